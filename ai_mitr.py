@@ -1,35 +1,115 @@
-from flask import Flask, render_template, request
+from flask import Flask, Response, g, jsonify, redirect, render_template, request, url_for
+from PIL import Image
 from werkzeug.utils import secure_filename
 import os
-from PIL import Image, ImageDraw, ImageFont
-import cv2
-import numpy as np
-import pytesseract
+import time
+
+import metrics
+import ocr
+import serving
+from blob_store import OUTPUT_MODE, blob_store, load_published, publish
+from features import UPLOAD_FOLDER, feature_params, process_feature
+from image_context import ImageContext
+from jobs import ASYNC_FEATURES, JOB_PREWARM, JobQueue
+from lazy import registry
+from ocr_regions import read_text
+from output_encoding import choose_format, encoder_stats
+from result_cache import ResultCache
+from remove_bg import batch_summary, preload_session, remove_backgrounds, session_stats
+from text_overlay import parse_text_items, text_edits
 
-from app import load_image_safe, extract_top_colors, calculate_brightness_contrast, get_color_suggestion, detect_font_from_text
-from remove_bg import remove_background
-from resize_image import resize_image
-from rotate_image import rotate_image
-
-UPLOAD_FOLDER = "static/uploads"
 ALLOWED_EXTENSIONS = {"png", "jpg", "jpeg"}
+# /remove-bg/batch runs on the request thread: at most this many images per request
+BATCH_MAX_FILES = int(os.environ.get("BATCH_MAX_FILES", 8))
 
 app = Flask(__name__)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
-# Uncomment if needed (Windows)
-# pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
+result_cache = ResultCache()
+
+# Slow features run on a local job pool (see JOB_EXECUTOR); JOBS_ENABLED=0 runs everything inline
+job_queue = None
+if os.environ.get("JOBS_ENABLED", "1") == "1":
+    job_queue = JobQueue(on_done=lambda job, result: cache_result(job["cache_key"], *result))
+    # (with SERVER_PRELOAD=1 the pool starts in post_fork, once per worker)
+    if JOB_PREWARM and os.environ.get("SERVER_PRELOAD") != "1":
+        job_queue.start()
+
+# Load the rembg model at worker boot instead of inside the first request
+# (with SERVER_PRELOAD=1 this happens in post_fork, once per worker)
+if os.environ.get("REMBG_PRELOAD") == "1" and os.environ.get("SERVER_PRELOAD") != "1":
+    preload_session()
+
+# Models and heavy modules load on first use; WARM_UP=1 loads them all at boot
+# (with SERVER_PRELOAD=1: shared ones in the master, the rest in post_fork)
+if os.environ.get("WARM_UP") == "1" and os.environ.get("SERVER_PRELOAD") != "1":
+    registry.warm_up()
+
+def create_app(preload=None):
+    """
+    WSGI entry point for production servers (gunicorn.conf.py serves
+    "ai_mitr:create_app()"). With preload - default: SERVER_PRELOAD=1 -
+    heavy modules and read-only models are loaded now, in the gunicorn
+    master, so forked workers share them copy-on-write.
+    """
+    if preload is None:
+        preload = os.environ.get("SERVER_PRELOAD") == "1"
+    if preload:
+        app.config["PRELOAD_SECONDS"] = serving.preload()
+    return app
+
+
+def cache_result(cache_key, context, data, name):
+    with metrics.timed("cache_store"):
+        result_cache.put(cache_key, context, data, name)
+
+
+def finish_result(cache_key, context, data, name):
+    """Cache a fresh result and return its context with a browser-ready image_path."""
+    cache_result(cache_key, context, data, name)
+    with metrics.timed("publish"):
+        image_path = publish_result(context, data, name)
+    return dict(context, image_path=image_path)
+
+
+def publish_result(context, data, name):
+    """publish() a feature output; when the page shows a preview, the full image is never inlined too."""
+    mode = "blob" if context.get("preview_path") and OUTPUT_MODE == "inline" else None
+    return publish(data, name, UPLOAD_FOLDER, mode)
+
+
+def wants_json():
+    return request.form.get("async") == "1" or request.accept_mimetypes.best == "application/json"
+
 
 def allowed_file(filename):
     return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
-def detect_text(image_path):
-    img = Image.open(image_path)
-    text = pytesseract.image_to_string(img)
-    return text.strip()
+@app.before_request
+def start_timing():
+    if metrics.METRICS_ENABLED:
+        g.request_start = time.perf_counter()
+        metrics.start_request()
+
+
+@app.after_request
+def finish_timing(response):
+    start = g.pop("request_start", None)
+    if start is not None:
+        metrics.observe("request", time.perf_counter() - start,
+                        metrics.current_feature() or request.endpoint or "")
+        timings = metrics.finish_request()
+        if metrics.SERVER_TIMING and timings:
+            response.headers["Server-Timing"] = metrics.server_timing(timings)
+    return response
+
+
+@app.errorhandler(ocr.OcrBusyError)
+def ocr_busy(error):
+    return "OCR is busy, please try again in a moment.", 503
 
 
 @app.route("/", methods=["GET", "POST"])
@@ -46,108 +126,206 @@ def index():
 
         if file and allowed_file(file.filename):
             filename = secure_filename(file.filename)
-            filepath = os.path.join(app.config["UPLOAD_FOLDER"], filename)
-            file.save(filepath)
 
-            feature = request.form.get("feature")
+            ctx = ImageContext.from_stream(file.stream, filename, ocr=read_text)
 
-            detected_text = detect_text(filepath)
-            no_text = True if detected_text == "" else False
-
-            # 1️⃣ COLOR + FONT
-            if feature == "color_font":
-                cv_img = cv2.cvtColor(np.array(Image.open(filepath)), cv2.COLOR_RGB2BGR)
-
-                palette = extract_top_colors(cv_img, k=5)
-                brightness, contrast = calculate_brightness_contrast(cv_img)
-                color_suggestions = [
-                    get_color_suggestion(c, brightness, contrast) for c in palette
-                ]
-
-                font_output = detect_font_from_text(cv_img)
-
-                return render_template(
-                    "result.html",
-                    image_path=filepath,
-                    palette=palette,
-                    color_suggestions=color_suggestions,
-                    font_output=font_output,
-                    feature="color_font",
-                    no_text=no_text
-                )
-
-            # 2️⃣ REMOVE BG
-            elif feature == "remove_bg":
-                output_path = remove_background(filepath)
-                return render_template(
-                    "result.html",
-                    image_path=output_path,
-                    feature="remove_bg",
-                    no_text=no_text
-                )
-
-            # 3️⃣ RESIZE
-            elif feature == "resize":
-                width = request.form.get("width")
-                height = request.form.get("height")
-
-                width = int(width) if width else None
-                height = int(height) if height else None
-
-                output_path = os.path.join(UPLOAD_FOLDER, f"resized_{filename}")
-                resize_image(filepath, output_path, width, height)
-
-                return render_template(
-                    "result.html",
-                    image_path=output_path,
-                    feature="resize",
-                    no_text=no_text
-                )
-
-            # 4️⃣ ROTATE
-            elif feature == "rotate":
-                angle = int(request.form.get("angle", 0))
-                output_path = os.path.join(UPLOAD_FOLDER, f"rotated_{filename}")
-
-                img = cv2.imread(filepath)
-                rotated = rotate_image(img, angle)
-                cv2.imwrite(output_path, rotated)
-
-                return render_template(
-                    "result.html",
-                    image_path=output_path,
-                    feature="rotate",
-                    no_text=no_text
-                )
+            feature = request.form.get("feature")
+            metrics.set_feature(feature)
+            try:
+                params = feature_params(feature, request.form)
+                # Output format from the Accept header (or an explicit "format" field);
+                # it is part of params, so each format gets its own cache entry
+                fmt = choose_format(feature, filename, request.accept_mimetypes, request.form.get("format"))
+            except ValueError as e:
+                return f"{e}", 400
+            if fmt:
+                params["format"] = fmt   # for "sizes", the default of targets without a :format
+
+            # Repeat uploads are served straight from the result cache
+            cache_key = result_cache.make_key(ctx.data, feature, params)
+            with metrics.timed("cache_lookup"):
+                cached = result_cache.get(cache_key)
+            if cached is not None:
+                context, data, name = cached
+                with metrics.timed("publish"):
+                    image_path = publish_result(context, data, name)
+                return render_template("result.html", image_path=image_path, **context)
+
+            # Slow features go to the job queue; the browser is sent to a polling page
+            if job_queue is not None and feature in ASYNC_FEATURES:
+                job_id = job_queue.submit(feature, params, ctx.data, filename, cache_key)
+                if wants_json():
+                    return jsonify(
+                        job_id=job_id,
+                        status_url=url_for("job_status", job_id=job_id),
+                        result_url=url_for("job_result", job_id=job_id),
+                    ), 202
+                return redirect(url_for("job_result", job_id=job_id), code=303)
+
+            # Decode once; every feature pulls the views it needs from ctx.
+            # Resize decodes on its own so JPEGs can shrink on load.
+            if feature != "resize":
+                try:
+                    ctx.bgr
+                except ValueError:
+                    return "Could not read the uploaded image!", 400
+
+            try:
+                result = process_feature(ctx, feature, params)
+            except ValueError as e:
+                return f"{e}", 400
+            if result is not None:
+                return render_template("result.html", **finish_result(cache_key, *result))
 
     return render_template("index.html")
 
 
+@app.route("/blobs/<blob_id>")
+def serve_blob(blob_id):
+    entry = blob_store.get(blob_id)
+    if entry is None:
+        return "Image expired!", 404
+    data, mimetype = entry
+    return Response(data, mimetype=mimetype, headers={"Cache-Control": "private, max-age=600"})
+
+
+@app.route("/remove-bg/batch", methods=["POST"])
+def remove_bg_batch():
+    """
+    Cut out every uploaded image in one pipelined pass; returns JSON with
+    each output published like any other result (see OUTPUT_MODE).
+    """
+    files = [f for f in request.files.getlist("images") if f.filename and allowed_file(f.filename)]
+    if not files:
+        return "No file uploaded!", 400
+    if len(files) > BATCH_MAX_FILES:
+        return f"At most {BATCH_MAX_FILES} images per batch.", 413
+
+    inputs = [(secure_filename(f.filename), f.read()) for f in files]
+
+    start = time.perf_counter()
+    records = list(remove_backgrounds(inputs, keep_bytes=True))
+    summary = batch_summary(records, time.perf_counter() - start)
+    seen = set()
+    with metrics.timed("publish"):
+        for record in records:
+            data = record.pop("data", None)
+            if data is None:
+                record["output"] = None
+                continue
+            # Same-named uploads must not overwrite each other when OUTPUT_MODE=disk
+            name, n = record["output"], 1
+            while name in seen:
+                n += 1
+                name = f"{os.path.splitext(record['output'])[0]}_{n}.png"
+            seen.add(name)
+            record["output"] = publish(data, name, UPLOAD_FOLDER)
+
+    return jsonify(summary=summary, results=records)
+
+
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    job = job_queue.get(job_id) if job_queue is not None else None
+    if job is None:
+        return jsonify(error="Unknown job"), 404
+    return jsonify(job)
+
+
+@app.route("/jobs/<job_id>/result")
+def job_result(job_id):
+    job = job_queue.get(job_id) if job_queue is not None else None
+    if job is None:
+        return "Unknown job!", 404
+    if job["status"] == "done":
+        # The record only points at the result; it is rendered from the shared result cache
+        cached = result_cache.get(job["cache_key"])
+        if cached is None:
+            return "Result expired, please upload again.", 410
+        context, data, name = cached
+        return render_template("result.html", image_path=publish_result(context, data, name), **context)
+    if job["status"] == "failed":
+        return f"Processing failed: {job['error']}", 500
+    return render_template("job_pending.html", job=job), 202
+
+
+@app.route("/jobs/metrics")
+def job_metrics():
+    if job_queue is None:
+        return jsonify(enabled=False)
+    return jsonify(enabled=True, **job_queue.metrics())
+
+
+@app.route("/cache-stats")
+def cache_stats():
+    return jsonify(result_cache.stats())
+
+
+@app.route("/metrics")
+def metrics_endpoint():
+    return Response(metrics.render_prometheus(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/encode-stats")
+def encode_stats():
+    return jsonify(encoder_stats())
+
+
+@app.route("/lazy-stats")
+def lazy_stats():
+    return jsonify(registry.report())
+
+
+@app.route("/rembg-stats")
+def rembg_stats():
+    return jsonify(session_stats())
+
+
 # ✍️ ADD TEXT ROUTE
 @app.route("/add-text", methods=["POST"])
 def add_text():
-    image_path = request.form.get("image_path")
-    user_text = request.form.get("user_text")
-    font_size = int(request.form.get("font_size", 30))
-
-    img = Image.open(image_path)
-    draw = ImageDraw.Draw(img)
-
+    undo = request.form.get("action") == "undo"
     try:
-        font = ImageFont.truetype("arial.ttf", font_size)
-    except:
-        font = ImageFont.load_default()
-
-    draw.text((50, 50), user_text, fill="black", font=font)
-    img.save(image_path)
+        items = None if undo else parse_text_items(request.form)
+    except ValueError as e:
+        return str(e), 400
+
+    # An open edit keeps the decoded image; otherwise start one from the published result
+    edit = text_edits.get(request.form.get("edit_id"))
+    if edit is None:
+        data = load_published(request.form.get("image_path"))
+        if data is None:
+            return "Image not found or expired!", 404
+        try:
+            edit = text_edits.open(data)
+        except (OSError, ValueError, Image.DecompressionBombError):
+            # UnidentifiedImageError (e.g. a ZIP bundle), truncated data, oversized images
+            return "Only images can have text added!", 400
+
+    with edit.lock:
+        if undo:
+            edit.undo()
+        else:
+            edit.add(items)
+        data, name = edit.encode()
+
+    # Publish the edit as a new image; cached results are never modified
+    image_path = publish(data, name, UPLOAD_FOLDER)
 
     return render_template(
         "result.html",
         image_path=image_path,
+        edit_id=edit.id,
+        text_items=edit.items,
         feature=None,
         no_text=False
     )
 
 
+@app.route("/text-stats")
+def text_stats():
+    return jsonify(text_edits.stats())
+
+
 if __name__ == "__main__":
     app.run(debug=True)
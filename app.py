@@ -1,27 +1,62 @@
 import cv2
 import numpy as np
-import pytesseract
 import pickle
 import os
-from glob import glob
-import colorsys
 
-# ---------------------------
-# Tesseract Setup
-# ---------------------------
-pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
+from color_index import ColorIndex
+from color_ops import bgr_array_to_hex, color_suggestions, hex_to_rgb_array, palette_strings, rgb_array_to_hex
+from font_matcher import get_font_matcher
+from image_stats import compute_stats
+from lazy import registry
+from metrics import timed
+from model_artifact import MODEL_ARTIFACT, ModelArtifact, load_artifact
+from ocr_regions import read_text
+from palette_engine import DEFAULT_MAX_PIXELS, DEFAULT_SEED, extract_palette
 
 # ---------------------------
 # Load Models
 # ---------------------------
+@timed("model_load")
 def load_model(path):
     if not os.path.exists(path):
         raise FileNotFoundError(f"Model not found: {path}")
     with open(path, "rb") as f:
         return pickle.load(f)
 
-color_model = load_model("tesco_model.pkl")
-font_model = load_model("font_suggestion_model.pkl")
+@timed("model_load")
+def load_artifact_or_none(path=MODEL_ARTIFACT):
+    """The compiled model artifact, or None when it has not been built (pickle fallback)."""
+    try:
+        return load_artifact(path)
+    except FileNotFoundError:
+        return None
+
+
+def _from_artifact(build, pickle_path):
+    artifact = registry.get("model_artifact")
+    return build(artifact) if artifact is not None else load_model(pickle_path)
+
+
+def _color_index():
+    artifact = registry.get("model_artifact")
+    if artifact is not None:
+        return ColorIndex.from_artifact(artifact)
+    return ColorIndex(registry.get("color_model"))
+
+
+# Loaded on first use (or by registry.warm_up()), not at import time
+registry.register("model_artifact", load_artifact_or_none)
+registry.register("color_model", lambda: _from_artifact(ModelArtifact.color_entries, "tesco_model.pkl"))
+registry.register("color_index", _color_index)
+registry.register("font_model", lambda: _from_artifact(ModelArtifact.font_model, "font_suggestion_model.pkl"))
+
+LAZY_MODELS = ("model_artifact", "color_model", "color_index", "font_model")
+
+def __getattr__(name):
+    # Keeps app.color_model / app.color_index / app.font_model working
+    if name in LAZY_MODELS:
+        return registry.get(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # ---------------------------
 # Safe Image Loader
@@ -37,34 +72,28 @@ def load_image_safe(path):
 # ---------------------------
 # Multi-Color Detection
 # ---------------------------
-def extract_top_colors(image, k=5):
-    data = image.reshape((-1, 3))
-    data = np.float32(data)
-
-    criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 10, 1.0)
-    _, labels, centers = cv2.kmeans(
-        data, k, None, criteria, 10, cv2.KMEANS_RANDOM_CENTERS
+@timed("palette")
+def extract_top_colors(image, k=5, max_pixels=DEFAULT_MAX_PIXELS, seed=DEFAULT_SEED,
+                       prebin_bits=None):
+    """
+    Palette extraction runs on at most max_pixels sampled pixels with a
+    fixed seed, so it is bounded in time and stable across runs.
+    Pass max_pixels=None to cluster every pixel.
+    """
+    palette = extract_palette(
+        image, k=k, max_pixels=max_pixels, seed=seed, prebin_bits=prebin_bits
     )
-
-    counts = np.bincount(labels.flatten())
-    sorted_indices = np.argsort(counts)[::-1]
-
-    palette = []
-    for i in sorted_indices:
-        c = centers[i]
-        color_hex = "#{:02x}{:02x}{:02x}".format(int(c[2]), int(c[1]), int(c[0]))
-        palette.append(color_hex)
-
-    return palette
+    return bgr_array_to_hex(np.array([c for c, _ in palette]))
 
 # ---------------------------
 # Brightness / Contrast
 # ---------------------------
-def calculate_brightness_contrast(img):
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    brightness = np.mean(gray) / 255
-    contrast = np.std(gray) / 255
-    return brightness, contrast
+@timed("brightness_contrast")
+def calculate_brightness_contrast(img, gray=None, stats=None):
+    """Mean and spread of luma (0-1), from the shared sampled statistics kernel."""
+    if stats is None:
+        stats = compute_stats(img if img is not None else gray)
+    return stats.brightness, stats.contrast
 
 def classify(value):
     if value < 0.33: return "low"
@@ -75,67 +104,43 @@ def classify(value):
 # Color Utils
 # ---------------------------
 def hex_to_rgb(hex_color):
-    hex_color = hex_color.lstrip('#')
-    return tuple(int(hex_color[i:i+2], 16) for i in (0, 2 ,4))
+    return tuple(int(v) for v in hex_to_rgb_array([hex_color])[0])
 
 def rgb_to_hex(rgb):
-    return "#{:02x}{:02x}{:02x}".format(*rgb)
+    return rgb_array_to_hex([rgb])[0]
 
 def generate_palette(hex_color):
-    r, g, b = hex_to_rgb(hex_color)
-    h, l, s = colorsys.rgb_to_hls(r/255, g/255, b/255)
-
-    h_comp = (h + 0.5) % 1.0
-    r_c, g_c, b_c = colorsys.hls_to_rgb(h_comp, l, s)
-    complementary = rgb_to_hex((int(r_c*255), int(g_c*255), int(b_c*255)))
-
-    h_analog1 = (h + 1/12) % 1.0
-    h_analog2 = (h - 1/12) % 1.0
-    r1, g1, b1 = colorsys.hls_to_rgb(h_analog1, l, s)
-    r2, g2, b2 = colorsys.hls_to_rgb(h_analog2, l, s)
-    analogous = [
-        rgb_to_hex((int(r1*255), int(g1*255), int(b1*255))),
-        rgb_to_hex((int(r2*255), int(g2*255), int(b2*255)))
-    ]
-
-    palette = [complementary] + analogous
-    return ", ".join(palette)
+    return palette_strings([hex_color])[0]
 
 # ---------------------------
 # Color Suggestion Logic
 # ---------------------------
 def get_color_suggestion(color, brightness, contrast):
-    b = classify(brightness)
-    c = classify(contrast)
-
-    for item in color_model:
-        if (item["dominant_color"].lower() == color.lower() and
-            item["brightness"] == b and item["contrast"] == c):
-            return item
+    return get_color_suggestions([color], brightness, contrast)[0]
 
-    return {
-        "dominant_color": color,
-        "brightness": b,
-        "contrast": c,
-        "suggested_color_palette": generate_palette(color),
-        "suggested_font_style": "Minimal Rounded (auto)"
-    }
+@timed("color_suggestions")
+def get_color_suggestions(colors, brightness, contrast):
+    """Whole-palette version: one vectorized pass over all colors."""
+    return color_suggestions(list(colors), brightness, contrast, registry.get("color_index"))
 
 # ---------------------------
 # Font Detection Logic
 # ---------------------------
-def detect_font_from_text(image, templates_folder="font_templates"):
-    text = pytesseract.image_to_string(image).strip()
+def detect_font_from_text(image, templates_folder="font_templates", gray=None, text=None,
+                          regions=None, stats=None):
+    if text is None:
+        text, found = read_text(gray if gray is not None else image)
+        if regions is None:
+            regions = found or None
 
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    brightness = np.mean(gray) / 255
+    if stats is None:
+        stats = compute_stats(image if image is not None else gray)
 
-    if brightness < 0.5:
-        group = "dark"
+    font_model = registry.get("font_model")
+    if stats.group == "dark":
         fallback_fonts = font_model.get("dark", [])
         font_color = "White"
     else:
-        group = "bright"
         fallback_fonts = font_model.get("bright", [])
         font_color = "Black"
 
@@ -146,23 +151,12 @@ def detect_font_from_text(image, templates_folder="font_templates"):
             "recommended_fonts": fallback_fonts,
         }
 
-    best_matches = []
-    gray_image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-
-    for template_path in glob(os.path.join(templates_folder, "*.png")):
-        template_img = cv2.imread(template_path, 0)
-        if template_img is None:
-            continue
-
-        res = cv2.matchTemplate(gray_image, template_img, cv2.TM_CCOEFF_NORMED)
-        _, max_val, _, _ = cv2.minMaxLoc(res)
-
-        if max_val > 0.7:
-            font_name = os.path.basename(template_path).split(".")[0]
-            best_matches.append((font_name, max_val))
-
-    best_matches = sorted(best_matches, key=lambda x: x[1], reverse=True)
-    detected_fonts = [name for name, val in best_matches[:5]]
+    if gray is None:
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    matcher = get_font_matcher(templates_folder)
+    with timed("font_match"):
+        best_matches = matcher.match(gray, regions=regions, top_k=5)
+    detected_fonts = [name for name, val in best_matches]
 
     if not detected_fonts:
         detected_fonts = fallback_fonts
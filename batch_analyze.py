@@ -0,0 +1,211 @@
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+IMAGE_PATTERNS = ("*.png", "*.jpg", "*.jpeg")
+
+# ---------------------------
+# Input Discovery
+# ---------------------------
+def collect_inputs(source):
+    """
+    A directory (recursive), a glob pattern, or a manifest file: plain
+    text with one path per line, or JSON Lines with a "path" field.
+    """
+    if os.path.isdir(source):
+        paths = []
+        for pattern in IMAGE_PATTERNS:
+            paths.extend(glob.glob(os.path.join(source, "**", pattern), recursive=True))
+        return sorted(paths)
+
+    if os.path.isfile(source) and source.endswith((".txt", ".jsonl", ".manifest")):
+        paths = []
+        with open(source) as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                paths.append(json.loads(line)["path"] if line.startswith("{") else line)
+        return paths
+
+    return sorted(glob.glob(source, recursive=True))
+
+
+def completed_paths(output_path):
+    """Paths already analysed without error in a previous run (for resume)."""
+    done = set()
+    if not output_path or not os.path.exists(output_path):
+        return done
+    with open(output_path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # torn last line from an interrupted run
+            if record.get("error") is None:
+                done.add(record["path"])
+    return done
+
+
+def open_output(output_path, resume):
+    """
+    The JSONL output: truncated for a fresh run, appended to on resume.
+    A torn last line (no trailing newline) is closed off first so it
+    cannot swallow the first new record.
+    """
+    if not resume:
+        return open(output_path, "w")
+    torn = False
+    if os.path.exists(output_path) and os.path.getsize(output_path):
+        with open(output_path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            torn = f.read(1) != b"\n"
+    out = open(output_path, "a")
+    if torn:
+        out.write("\n")
+    return out
+
+# ---------------------------
+# Worker Side
+# ---------------------------
+_options = {}
+
+
+def init_worker(options):
+    """
+    Runs once per worker process: load models and templates here so no
+    image pays for it.
+    """
+    _options.update(options)
+
+    import app
+    import ocr
+    from font_matcher import get_font_matcher
+
+    # One OCR call at a time per process; parallelism comes from the pool
+    ocr.set_engine(ocr.create_engine(workers=1, max_pending=0, timeout=None))
+    get_font_matcher(options["templates"])
+    _options["app"] = app
+
+
+def analyze_path(path):
+    app = _options["app"]
+    record = {"path": path, "error": None, "timings": {}}
+    timings = record["timings"]
+
+    def stage(name, start):
+        timings[name] = round(time.perf_counter() - start, 6)
+        return time.perf_counter()
+
+    try:
+        t = time.perf_counter()
+        img = app.load_image_safe(path)
+        t = stage("decode", t)
+
+        from image_stats import compute_stats
+        stats = compute_stats(img)
+        t = stage("image_stats", t)
+
+        palette = app.extract_top_colors(img, k=_options["k"], max_pixels=_options["max_pixels"])
+        t = stage("palette", t)
+
+        brightness, contrast = app.calculate_brightness_contrast(img, stats=stats)
+        t = stage("brightness_contrast", t)
+
+        suggestions = app.get_color_suggestions(palette, brightness, contrast)
+        t = stage("color_suggestions", t)
+
+        record.update(
+            width=int(img.shape[1]),
+            height=int(img.shape[0]),
+            palette=palette,
+            dominant_color=stats.dominant_color,
+            brightness=float(brightness),
+            contrast=float(contrast),
+            color_suggestions=suggestions,
+        )
+
+        if _options["fonts"]:
+            record["font"] = app.detect_font_from_text(img, _options["templates"], stats=stats)
+            t = stage("ocr_and_font", t)
+
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+
+    record["timings"]["total"] = round(sum(timings.values()), 6)
+    return record
+
+# ---------------------------
+# Driver
+# ---------------------------
+def run(paths, out, workers, options):
+    """Analyse paths on a process pool, writing one JSON line per image as it finishes."""
+    ok = failed = 0
+    start = time.perf_counter()
+
+    with multiprocessing.Pool(workers, initializer=init_worker, initargs=(options,)) as pool:
+        for record in pool.imap_unordered(analyze_path, paths, chunksize=1):
+            out.write(json.dumps(record) + "\n")
+            out.flush()
+            if record["error"] is None:
+                ok += 1
+            else:
+                failed += 1
+
+    elapsed = time.perf_counter() - start
+    return {
+        "images": ok + failed,
+        "succeeded": ok,
+        "failed": failed,
+        "seconds": elapsed,
+        "images_per_second": (ok + failed) / elapsed if elapsed else 0.0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless palette, brightness/contrast and font analysis.")
+    parser.add_argument("source", help="directory, glob pattern, or manifest (.txt / .jsonl)")
+    parser.add_argument("-o", "--out", help="JSON Lines output file (default: stdout); enables resume")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("-k", type=int, default=5, help="palette size")
+    parser.add_argument("--max-pixels", type=int, default=20000, help="palette pixel budget")
+    parser.add_argument("--no-fonts", action="store_true", help="skip OCR and font matching")
+    parser.add_argument("--templates", default="font_templates")
+    parser.add_argument("--no-resume", action="store_true", help="re-analyse images already in --out")
+    args = parser.parse_args(argv)
+
+    paths = collect_inputs(args.source)
+    if args.out and not args.no_resume:
+        done = completed_paths(args.out)
+        paths = [p for p in paths if p not in done]
+        if done:
+            print(f"Resuming: {len(done)} already done, {len(paths)} to go", file=sys.stderr)
+
+    if not paths:
+        print("Nothing to analyse.", file=sys.stderr)
+        return 0
+
+    options = {
+        "k": args.k,
+        "max_pixels": args.max_pixels,
+        "fonts": not args.no_fonts,
+        "templates": args.templates,
+    }
+
+    out = open_output(args.out, not args.no_resume) if args.out else sys.stdout
+    try:
+        summary = run(paths, out, args.workers, options)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    print(json.dumps(summary), file=sys.stderr)
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,330 @@
+import argparse
+import glob
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+# ---------------------------
+# Defaults
+# ---------------------------
+DEFAULT_SIZES = "640x480,1920x1080,3840x2160"
+DEFAULT_OUT = "bench/results.json"
+DEFAULT_BASELINE = "bench/baseline.json"
+SAMPLES_FOLDER = "static/uploads"
+DERIVED_MARKERS = ("_noBG", "resized_", "rotated_", "text_")
+STUB_TEXT = "Sample Heading"
+
+# A case is slower than baseline if its p50 grew by more than this fraction
+DEFAULT_TOLERANCE = 0.25
+# ...and by more than this many seconds (keeps sub-millisecond noise from failing runs)
+MIN_REGRESSION_SECONDS = 0.002
+
+# ---------------------------
+# Inputs
+# ---------------------------
+def parse_sizes(spec):
+    sizes = []
+    for item in filter(None, (s.strip() for s in spec.split(","))):
+        w, _, h = item.lower().partition("x")
+        sizes.append((int(w), int(h)))
+    return sizes
+
+
+def synthetic_image(width, height, seed=0):
+    """
+    Deterministic test card: gradient background, a few flat color
+    blocks and a line of text, so palette, OCR/font and cutout paths all
+    have something to work on.
+    """
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    img = np.empty((height, width, 3), dtype=np.uint8)
+    img[..., 0] = x
+    img[..., 1] = y
+    img[..., 2] = (x + y) / 2
+
+    for _ in range(6):
+        bw, bh = int(width * rng.uniform(0.1, 0.3)), int(height * rng.uniform(0.1, 0.3))
+        bx, by = int(rng.integers(0, width - bw)), int(rng.integers(0, height - bh))
+        img[by:by + bh, bx:bx + bw] = rng.integers(0, 256, 3)
+
+    scale = max(0.5, width / 640)
+    cv2.putText(img, STUB_TEXT, (int(width * 0.05), int(height * 0.5)),
+                cv2.FONT_HERSHEY_SIMPLEX, scale, (255, 255, 255), max(1, int(scale * 2)), cv2.LINE_AA)
+    return img
+
+
+def sample_paths(folder=SAMPLES_FOLDER, limit=5):
+    """Original uploads (not derived outputs) under folder, smallest name first."""
+    paths = []
+    for pattern in ("*.png", "*.jpg", "*.jpeg"):
+        paths.extend(glob.glob(os.path.join(folder, pattern)))
+    paths = [p for p in sorted(paths) if not any(m in os.path.basename(p) for m in DERIVED_MARKERS)]
+    return paths[:limit]
+
+
+def load_inputs(sizes, samples):
+    """[(label, bgr, encoded jpeg bytes, file path)]"""
+    tmp = tempfile.mkdtemp(prefix="bench_")
+    inputs = []
+    for w, h in sizes:
+        img = synthetic_image(w, h)
+        path = os.path.join(tmp, f"synthetic_{w}x{h}.jpg")
+        cv2.imwrite(path, img)
+        with open(path, "rb") as f:
+            inputs.append((f"synthetic_{w}x{h}", img, f.read(), path))
+
+    for path in samples:
+        img = cv2.imread(path)
+        if img is None:
+            continue
+        with open(path, "rb") as f:
+            inputs.append((f"sample_{os.path.basename(path)}", img, f.read(), path))
+    return inputs, tmp
+
+# ---------------------------
+# Measurement
+# ---------------------------
+def percentile(values, q):
+    values = sorted(values)
+    if not values:
+        return None
+    pos = (len(values) - 1) * q
+    lo, hi = int(pos), min(int(pos) + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (pos - lo)
+
+
+def measure(func, repeat, warmup=1):
+    """
+    Time func() `repeat` times after `warmup` calls, then run it once
+    more under tracemalloc for the peak Python/numpy allocation.
+    """
+    for _ in range(warmup):
+        func()
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    mean = statistics.fmean(times)
+    return {
+        "runs": repeat,
+        "p50": percentile(times, 0.50),
+        "p90": percentile(times, 0.90),
+        "p99": percentile(times, 0.99),
+        "mean": mean,
+        "min": min(times),
+        "throughput_per_s": 1 / mean if mean else None,
+        "peak_alloc_mb": peak / (1024 * 1024),
+    }
+
+# ---------------------------
+# Cases
+# ---------------------------
+def feature_cases(inputs, out_dir):
+    """(feature, input label, megapixels, callable) for every feature x input."""
+    import app
+    import remove_bg
+    from PIL import Image
+    from resize_image import resize_image
+    from rotate_image import rotate_image
+
+    cases = []
+    for label, img, data, path in inputs:
+        h, w = img.shape[:2]
+        mp = w * h / 1e6
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        pil = Image.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
+        resized_path = os.path.join(out_dir, f"resized_{label}.jpg")
+
+        cases += [
+            ("extract_top_colors", label, mp, lambda img=img: app.extract_top_colors(img)),
+            ("detect_font_from_text", label, mp,
+             lambda img=img, gray=gray: app.detect_font_from_text(img, gray=gray)),
+            ("remove_background", label, mp, lambda pil=pil: remove_bg.remove_background_image(pil)),
+            ("resize_image", label, mp,
+             lambda path=path, out=resized_path, w=w: resize_image(path, out, width=max(1, w // 2))),
+            ("rotate_image_90", label, mp, lambda img=img: rotate_image(img, 90)),
+            ("rotate_image_33", label, mp, lambda img=img: rotate_image(img, 33)),
+        ]
+    return cases
+
+
+def e2e_cases(inputs, cache_dir):
+    """The same features through the Flask test client, result cache bypassed."""
+    import ai_mitr
+    from result_cache import ResultCache
+
+    # ttl=0: every lookup misses, so each request does the full work
+    ai_mitr.result_cache = ResultCache(folder=cache_dir, ttl=0)
+    client = ai_mitr.app.test_client()
+
+    def post(data, feature, **extra):
+        def run():
+            r = client.post("/", data=dict(feature=feature, image=(io.BytesIO(data), "bench.jpg"), **extra),
+                            content_type="multipart/form-data")
+            if r.status_code != 200:
+                raise RuntimeError(f"{feature}: HTTP {r.status_code}")
+        return run
+
+    cases = []
+    for label, img, data, _ in inputs:
+        h, w = img.shape[:2]
+        mp = w * h / 1e6
+        cases += [
+            ("e2e_color_font", label, mp, post(data, "color_font")),
+            ("e2e_remove_bg", label, mp, post(data, "remove_bg")),
+            ("e2e_resize", label, mp, post(data, "resize", width=str(max(1, w // 2)))),
+            ("e2e_rotate", label, mp, post(data, "rotate", angle="90")),
+        ]
+    return cases
+
+# ---------------------------
+# Baseline Comparison
+# ---------------------------
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Cases whose p50 regressed beyond tolerance: [(key, old, new, ratio)]."""
+    old = {f"{c['feature']}/{c['input']}": c for c in baseline.get("cases", [])}
+    regressions = []
+    for case in results["cases"]:
+        key = f"{case['feature']}/{case['input']}"
+        ref = old.get(key)
+        if not ref or not ref.get("p50") or case.get("error"):
+            continue
+        ratio = case["p50"] / ref["p50"]
+        if ratio > 1 + tolerance and case["p50"] - ref["p50"] > MIN_REGRESSION_SECONDS:
+            regressions.append((key, ref["p50"], case["p50"], ratio))
+    return regressions
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "ocr_backend": os.environ.get("OCR_BACKEND"),
+        "rembg_model": os.environ.get("REMBG_MODEL"),
+    }
+
+# ---------------------------
+# Driver
+# ---------------------------
+def run(args):
+    sizes = parse_sizes(args.sizes)
+    samples = [] if args.no_samples else sample_paths(limit=args.samples)
+    inputs, tmp = load_inputs(sizes, samples)
+
+    import ocr
+    if args.stub_ocr:
+        ocr.set_engine(ocr.StubEngine(text=STUB_TEXT))
+
+    cases = feature_cases(inputs, tmp)
+    if args.e2e:
+        cases += e2e_cases(inputs, os.path.join(tmp, "cache"))
+    if args.only:
+        wanted = set(args.only.split(","))
+        cases = [c for c in cases if c[0] in wanted]
+
+    results = {"created": time.time(), "environment": environment(), "cases": []}
+    try:
+        for feature, label, mp, func in cases:
+            results["cases"].append(run_case(feature, label, mp, func, args))
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return results
+
+
+def run_case(feature, label, mp, func, args):
+    try:
+        stats = measure(func, args.repeat, warmup=args.warmup)
+        stats["megapixels_per_s"] = mp * stats["throughput_per_s"] if stats["throughput_per_s"] else None
+        error = None
+    except Exception as e:
+        stats, error = {}, f"{type(e).__name__}: {e}"
+
+    if error:
+        print(f"❌ {feature:<24} {label:<32} {error}")
+    else:
+        print(f"   {feature:<24} {label:<32} p50 {stats['p50'] * 1000:8.1f} ms  "
+              f"p90 {stats['p90'] * 1000:8.1f} ms  {stats['throughput_per_s']:7.1f}/s  "
+              f"peak {stats['peak_alloc_mb']:7.1f} MB")
+    return dict(feature=feature, input=label, megapixels=round(mp, 3), error=error, **stats)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Latency, throughput and memory benchmarks for every feature.")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="synthetic image sizes, e.g. 640x480,1920x1080")
+    parser.add_argument("--samples", type=int, default=5, help=f"sample images from {SAMPLES_FOLDER}")
+    parser.add_argument("--no-samples", action="store_true")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--only", help="comma-separated feature names to run")
+    parser.add_argument("--e2e", action="store_true", help="also benchmark the Flask app through its test client")
+    parser.add_argument("--real-ocr", dest="stub_ocr", action="store_false", help="use tesseract instead of the stub")
+    parser.add_argument("--real-rembg", dest="stub_rembg", action="store_false", help="use the rembg model instead of the stub")
+    parser.add_argument("--out", default=DEFAULT_OUT)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--save-baseline", action="store_true", help="write these results as the new baseline")
+    args = parser.parse_args(argv)
+
+    # Both must be chosen before the app modules are imported
+    if args.stub_rembg:
+        os.environ["REMBG_MODEL"] = "stub"
+    if args.stub_ocr:
+        os.environ["OCR_BACKEND"] = "stub"
+    os.environ.setdefault("JOBS_ENABLED", "0")
+
+    results = run(args)
+
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\n📁 Results saved to {args.out}")
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline) or ".", exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"📌 Baseline updated: {args.baseline}")
+        return 0
+
+    failed = [c for c in results["cases"] if c["error"]]
+    if not os.path.exists(args.baseline):
+        print("No baseline to compare against (use --save-baseline).")
+        return 1 if failed else 0
+
+    with open(args.baseline) as f:
+        regressions = compare(results, json.load(f), args.tolerance)
+
+    for key, old, new, ratio in regressions:
+        print(f"❌ REGRESSION {key}: p50 {old * 1000:.1f} ms -> {new * 1000:.1f} ms ({ratio:.2f}x)")
+    if not regressions:
+        print(f"✅ No case slower than baseline by more than {args.tolerance:.0%}")
+    return 1 if regressions or failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
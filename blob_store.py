@@ -0,0 +1,188 @@
+import base64
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+# ---------------------------
+# Config (environment)
+# ---------------------------
+# How result images reach the browser:
+#   auto   - inline up to INLINE_MAX_KB, blob above that (default)
+#   inline - base64 data URI inside the page, whatever the size
+#   blob   - short-lived store served from /blobs/<id>
+#   disk   - written under static/uploads, the old behaviour (opt-in)
+OUTPUT_MODE = os.environ.get("OUTPUT_MODE", "auto")
+INLINE_MAX_KB = int(os.environ.get("INLINE_MAX_KB", 24))
+BLOB_TTL = int(os.environ.get("BLOB_TTL", 600))
+BLOB_MAX_MB = int(os.environ.get("BLOB_MAX_MB", 256))
+# Blobs are also written here so any gunicorn worker can serve them; "" keeps them per process
+BLOB_FOLDER = os.environ.get("BLOB_FOLDER", os.path.join(tempfile.gettempdir(), "ai_mitr_blobs"))
+BLOB_SWEEP_SECONDS = 60
+
+MIMETYPES = {
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".webp": "image/webp",
+    ".avif": "image/avif",
+    ".zip": "application/zip",
+}
+EXTENSIONS = {mimetype: ext for ext, mimetype in reversed(MIMETYPES.items())}
+
+_BLOB_ID = re.compile(r"^[0-9a-f]{32}(\.[a-z0-9]{1,5})?$")
+
+# ---------------------------
+# Blob Store
+# ---------------------------
+class BlobStore:
+    """
+    Encoded images kept for `ttl` seconds: an in-memory LRU capped by total
+    bytes, backed by files in `folder` that every worker process can read.
+    Blob ids carry the extension, so the mimetype survives the trip to disk.
+    """
+
+    def __init__(self, ttl=BLOB_TTL, max_bytes=BLOB_MAX_MB * 1024 * 1024, folder=BLOB_FOLDER):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.folder = folder or None
+        self._blobs = OrderedDict()   # id -> (expires, data, mimetype)
+        self._size = 0
+        self._lock = threading.Lock()
+        self._swept = 0.0
+        if self.folder:
+            os.makedirs(self.folder, exist_ok=True)
+
+    def put(self, data, mimetype):
+        blob_id = uuid.uuid4().hex + EXTENSIONS.get(mimetype, "")
+        if self.folder:
+            path = os.path.join(self.folder, blob_id)
+            with open(path + ".tmp", "wb") as f:
+                f.write(data)
+            os.replace(path + ".tmp", path)   # readers never see a partial file
+        with self._lock:
+            self._blobs[blob_id] = (time.time() + self.ttl, data, mimetype)
+            self._size += len(data)
+            self._evict()
+        self._sweep()
+        return blob_id
+
+    def get(self, blob_id):
+        if not _BLOB_ID.match(blob_id or ""):
+            return None
+        with self._lock:
+            entry = self._blobs.get(blob_id)
+            if entry is not None:
+                expires, data, mimetype = entry
+                if expires >= time.time():
+                    self._blobs.move_to_end(blob_id)
+                    return data, mimetype
+                self._drop(blob_id)
+        return self._read_disk(blob_id)
+
+    def _read_disk(self, blob_id):
+        """A blob stored by another worker (or evicted from this one's memory)."""
+        if not self.folder:
+            return None
+        path = os.path.join(self.folder, blob_id)
+        try:
+            if os.path.getmtime(path) + self.ttl < time.time():
+                os.remove(path)
+                return None
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        return data, mimetype_for(blob_id)
+
+    def _drop(self, blob_id):
+        _, data, _ = self._blobs.pop(blob_id)
+        self._size -= len(data)
+
+    def _evict(self):
+        now = time.time()
+        for blob_id in [k for k, (expires, _, _) in self._blobs.items() if expires < now]:
+            self._drop(blob_id)
+        while self._size > self.max_bytes and len(self._blobs) > 1:
+            self._drop(next(iter(self._blobs)))
+
+    def _sweep(self):
+        """Every BLOB_SWEEP_SECONDS: delete expired files, then the oldest beyond max_bytes."""
+        now = time.time()
+        if not self.folder or now - self._swept < BLOB_SWEEP_SECONDS:
+            return
+        self._swept = now
+        files = []
+        for name in os.listdir(self.folder):
+            path = os.path.join(self.folder, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            files.append((st.st_mtime, path, st.st_size))
+        files.sort()
+        total = sum(size for _, _, size in files)
+        for mtime, path, size in files:
+            if mtime + self.ttl >= now and total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+
+blob_store = BlobStore()
+
+# ---------------------------
+# Publishing Outputs
+# ---------------------------
+def mimetype_for(name):
+    return MIMETYPES.get(os.path.splitext(name)[1].lower(), "application/octet-stream")
+
+
+def publish(data, name, folder="static/uploads", mode=None):
+    """
+    Make encoded image bytes reachable by the browser and return the URL
+    to put in result.html (an <img src> value).
+    """
+    mode = mode or OUTPUT_MODE
+    mimetype = mimetype_for(name)
+    if mode == "auto":
+        # Large outputs inline would sit in the page twice (download link, add-text form)
+        mode = "inline" if len(data) <= INLINE_MAX_KB * 1024 else "blob"
+
+    if mode == "disk":
+        path = os.path.join(folder, name)
+        with open(path, "wb") as f:
+            f.write(data)
+        return "/" + path.replace(os.sep, "/")
+
+    if mode == "blob":
+        return "/blobs/" + blob_store.put(data, mimetype)
+
+    return f"data:{mimetype};base64," + base64.b64encode(data).decode("ascii")
+
+
+def load_published(url, static_root="static"):
+    """Bytes behind a URL returned by publish(), or None if it is gone or not ours."""
+    if not url:
+        return None
+
+    if url.startswith("data:"):
+        header, _, payload = url.partition(",")
+        return base64.b64decode(payload) if header.endswith(";base64") else None
+
+    if url.startswith("/blobs/"):
+        entry = blob_store.get(url[len("/blobs/"):])
+        return entry[0] if entry else None
+
+    # Files under static/ only; never follow arbitrary paths
+    path = os.path.normpath(url.lstrip("/"))
+    if path.split(os.sep)[0] != static_root or not os.path.isfile(path):
+        return None
+    with open(path, "rb") as f:
+        return f.read()
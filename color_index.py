@@ -0,0 +1,185 @@
+import pickle
+import re
+
+import numpy as np
+
+from color_ops import hex_to_packed_array, packed_to_rgb_array
+
+# ---------------------------
+# Defaults
+# ---------------------------
+# CIE76 distance in Lab; ~2.3 is a just-noticeable difference, 20 is
+# "clearly the same color family"
+DEFAULT_MAX_DISTANCE = 20.0
+
+# ---------------------------
+# sRGB -> CIE Lab (D65)
+# ---------------------------
+_RGB_TO_XYZ = np.array([
+    [0.4124564, 0.3575761, 0.1804375],
+    [0.2126729, 0.7151522, 0.0721750],
+    [0.0193339, 0.1191920, 0.9503041],
+])
+_WHITE_D65 = np.array([0.95047, 1.0, 1.08883])
+
+
+def rgb_to_lab(rgb):
+    """(N, 3) RGB in 0-255 -> (N, 3) Lab."""
+    c = np.asarray(rgb, dtype=np.float64) / 255.0
+    c = np.where(c > 0.04045, ((c + 0.055) / 1.055) ** 2.4, c / 12.92)
+    xyz = c @ _RGB_TO_XYZ.T / _WHITE_D65
+
+    f = np.where(xyz > 216 / 24389, np.cbrt(xyz), (24389 / 27 * xyz + 16) / 116)
+    return np.stack([
+        116 * f[:, 1] - 16,
+        500 * (f[:, 0] - f[:, 1]),
+        200 * (f[:, 1] - f[:, 2]),
+    ], axis=1)
+
+
+# ---------------------------
+# Color Model Index
+# ---------------------------
+LEVELS = ("low", "medium", "high")   # brightness / contrast classes, code = position
+_LEVEL_CODES = {name: code for code, name in enumerate(LEVELS)}
+
+
+def _exact_keys(packed, b_codes, c_codes):
+    return (np.asarray(packed, dtype=np.int64) << 4) | (np.asarray(b_codes, dtype=np.int64) << 2) | c_codes
+
+
+def _codes(names):
+    return np.array([_LEVEL_CODES.get(str(n), -1) for n in names], dtype=np.int64)
+
+
+_HEX = re.compile(r"#?[0-9a-fA-F]{6}")
+
+
+def _parse_colors(hex_colors):
+    """(packed, ok): packed 0xRRGGBB per query, ok False (packed 0) where it is not a #rrggbb color."""
+    ok = np.array([isinstance(h, str) and _HEX.fullmatch(h) is not None for h in hex_colors], dtype=bool)
+    packed = hex_to_packed_array([h if good else "0" for h, good in zip(hex_colors, ok)])
+    return packed, ok
+
+
+class ColorIndex:
+    """
+    Lookup structure over the curated color model entries.
+
+    Exact hits go through a sorted array of (color, brightness, contrast)
+    keys. Everything else goes to a KD-tree in Lab space, built per
+    (brightness, contrast) pair, which returns the closest curated entry
+    within max_distance. `entries` only needs len() and indexing, so a
+    lazily materialized sequence (see from_artifact) works too.
+    """
+
+    def __init__(self, entries, max_distance=DEFAULT_MAX_DISTANCE, packed=None, b_codes=None, c_codes=None):
+        from scipy.spatial import cKDTree  # scipy is slow to import; only pay for it here
+
+        self.entries = entries if packed is not None else list(entries)
+        self.max_distance = max_distance
+
+        if packed is None:
+            packed = hex_to_packed_array([e["dominant_color"] for e in self.entries])
+            b_codes = _codes(e["brightness"] for e in self.entries)
+            c_codes = _codes(e["contrast"] for e in self.entries)
+        b_codes = np.asarray(b_codes, dtype=np.int64)
+        c_codes = np.asarray(c_codes, dtype=np.int64)
+
+        # Stable sort keeps the last of duplicate keys rightmost, like a dict overwrite
+        keys = _exact_keys(packed, b_codes, c_codes)
+        self._exact_order = np.argsort(keys, kind="stable")
+        self._exact_keys = keys[self._exact_order]
+
+        # Rows with an unknown class can never be asked for, so they get no tree
+        valid = np.flatnonzero((b_codes >= 0) & (c_codes >= 0))
+        lab = rgb_to_lab(packed_to_rgb_array(np.asarray(packed)[valid]))
+        groups, inverse = np.unique(b_codes[valid] * len(LEVELS) + c_codes[valid], return_inverse=True)
+        self.trees = {}
+        for g, group in enumerate(groups):
+            b, c = divmod(int(group), len(LEVELS))
+            members = np.flatnonzero(inverse == g)
+            self.trees[(LEVELS[b], LEVELS[c])] = (cKDTree(lab[members]), valid[members])
+
+    @classmethod
+    def from_pickle(cls, path, **kwargs):
+        with open(path, "rb") as f:
+            return cls(pickle.load(f), **kwargs)
+
+    @classmethod
+    def from_artifact(cls, artifact, **kwargs):
+        """Build straight from a ModelArtifact's columns; entry dicts are made only for hits."""
+        c = artifact.columns
+        if tuple(artifact.levels) != LEVELS:
+            raise ValueError(f"Artifact levels {artifact.levels} do not match {LEVELS}")
+        return cls(artifact.entries(), packed=c["color"], b_codes=c["brightness"], c_codes=c["contrast"],
+                   **kwargs)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _exact_rows(self, hex_colors, brightness, contrast):
+        """Row of the exact entry for each query, or -1 (also for unparsable colors)."""
+        b, c = _codes(brightness), _codes(contrast)
+        packed, ok = _parse_colors(hex_colors)
+        keys = _exact_keys(packed, b, c)
+        rows = np.full(len(keys), -1, dtype=np.int64)
+        if not len(self._exact_keys):
+            return rows
+        pos = np.searchsorted(self._exact_keys, keys, side="right") - 1
+        hit = ok & (b >= 0) & (c >= 0) & (pos >= 0) & (self._exact_keys[np.maximum(pos, 0)] == keys)
+        rows[hit] = self._exact_order[pos[hit]]
+        return rows
+
+    def nearest(self, hex_color, brightness, contrast, max_distance=None):
+        """Closest entry in the same brightness/contrast group as (entry, distance), or None."""
+        group = self.trees.get((brightness, contrast))
+        if group is None:
+            return None
+        tree, idx = group
+
+        packed, ok = _parse_colors([hex_color])
+        if not ok[0]:
+            return None
+        limit = self.max_distance if max_distance is None else max_distance
+        lab = rgb_to_lab(packed_to_rgb_array(packed))[0]
+        dist, pos = tree.query(lab, distance_upper_bound=limit)
+        if not np.isfinite(dist):
+            return None
+        return self.entries[idx[pos]], float(dist)
+
+    def lookup(self, hex_color, brightness, contrast):
+        """Exact entry if there is one, otherwise the nearest within max_distance."""
+        return self.lookup_batch([hex_color], [brightness], [contrast])[0]
+
+    def lookup_batch(self, hex_colors, brightness, contrast):
+        """
+        lookup() for many colors at once; brightness/contrast are per-color
+        class arrays. One KD-tree query per (brightness, contrast) group.
+        Colors that are not #rrggbb hex are misses (None), never errors.
+        """
+        rows = self._exact_rows(hex_colors, brightness, contrast)
+        results = [self.entries[r] if r >= 0 else None for r in rows]
+
+        packed, ok = _parse_colors(hex_colors)
+        todo = {}
+        for i, item in enumerate(results):
+            if item is None and ok[i]:
+                todo.setdefault((str(brightness[i]), str(contrast[i])), []).append(i)
+
+        for key, positions in todo.items():
+            group = self.trees.get(key)
+            if group is None:
+                continue
+            tree, idx = group
+            lab = rgb_to_lab(packed_to_rgb_array(packed[positions]))
+            dist, pos = tree.query(lab, distance_upper_bound=self.max_distance)
+            for i, d, p in zip(positions, dist, pos):
+                if np.isfinite(d):
+                    results[i] = self.entries[idx[p]]
+        return results
+
+
+def load_color_index(path="tesco_model.pkl", **kwargs):
+    """Build the index once from the pickle written by train_model.py."""
+    return ColorIndex.from_pickle(path, **kwargs)
@@ -0,0 +1,138 @@
+import numpy as np
+
+# ---------------------------
+# Hex <-> RGB (batched)
+# ---------------------------
+def hex_to_packed_array(hex_colors):
+    """Hex strings -> (N,) uint32 0xRRGGBB array."""
+    return np.array([int(h.lstrip("#"), 16) for h in hex_colors], dtype=np.uint32).reshape(-1)
+
+
+def packed_to_rgb_array(packed):
+    """(N,) 0xRRGGBB integers -> (N, 3) uint8 RGB array."""
+    packed = np.asarray(packed, dtype=np.uint32).reshape(-1)
+    return np.stack([(packed >> 16) & 255, (packed >> 8) & 255, packed & 255], axis=1).astype(np.uint8)
+
+
+def hex_to_rgb_array(hex_colors):
+    """Hex strings -> (N, 3) uint8 RGB array."""
+    return packed_to_rgb_array(hex_to_packed_array(hex_colors))
+
+
+def rgb_array_to_hex(rgb):
+    """(N, 3) RGB array (0-255) -> list of "#rrggbb" strings."""
+    rgb = np.asarray(rgb).astype(np.int64)
+    packed = (rgb[:, 0] << 16) | (rgb[:, 1] << 8) | rgb[:, 2]
+    return ["#%06x" % v for v in packed.tolist()]
+
+
+def bgr_array_to_hex(bgr):
+    """(N, 3) BGR float centers -> hex, truncating like int() did per channel."""
+    return rgb_array_to_hex(np.asarray(bgr)[:, ::-1].astype(np.int64))
+
+# ---------------------------
+# RGB <-> HLS (colorsys semantics, batched)
+# ---------------------------
+def rgb_to_hls_array(rgb):
+    """(N, 3) RGB in 0-1 -> (N, 3) HLS in 0-1; matches colorsys.rgb_to_hls."""
+    rgb = np.asarray(rgb, dtype=np.float64)
+    r, g, b = rgb[:, 0], rgb[:, 1], rgb[:, 2]
+    maxc = rgb.max(axis=1)
+    minc = rgb.min(axis=1)
+    sumc = maxc + minc
+    rangec = maxc - minc
+    l = sumc / 2.0
+
+    gray = rangec == 0
+    safe_range = np.where(gray, 1.0, rangec)
+    s = np.where(l <= 0.5, rangec / np.where(gray, 1.0, sumc), rangec / np.where(gray, 1.0, 2.0 - maxc - minc))
+
+    rc = (maxc - r) / safe_range
+    gc = (maxc - g) / safe_range
+    bc = (maxc - b) / safe_range
+    h = np.where(r == maxc, bc - gc, np.where(g == maxc, 2.0 + rc - bc, 4.0 + gc - rc))
+    h = (h / 6.0) % 1.0
+
+    return np.stack([np.where(gray, 0.0, h), l, np.where(gray, 0.0, s)], axis=1)
+
+
+def _hue_channel(m1, m2, hue):
+    hue = hue % 1.0
+    return np.where(hue < 1 / 6, m1 + (m2 - m1) * hue * 6.0,
+           np.where(hue < 0.5, m2,
+           np.where(hue < 2 / 3, m1 + (m2 - m1) * (2 / 3 - hue) * 6.0, m1)))
+
+
+def hls_to_rgb_array(hls):
+    """(N, 3) HLS in 0-1 -> (N, 3) RGB in 0-1; matches colorsys.hls_to_rgb."""
+    hls = np.asarray(hls, dtype=np.float64)
+    h, l, s = hls[:, 0], hls[:, 1], hls[:, 2]
+    m2 = np.where(l <= 0.5, l * (1.0 + s), l + s - (l * s))
+    m1 = 2.0 * l - m2
+
+    rgb = np.stack([
+        _hue_channel(m1, m2, h + 1 / 3),
+        _hue_channel(m1, m2, h),
+        _hue_channel(m1, m2, h - 1 / 3),
+    ], axis=1)
+    return np.where((s == 0)[:, None], l[:, None], rgb)
+
+# ---------------------------
+# Palettes
+# ---------------------------
+def generate_palettes(rgb):
+    """
+    (N, 3) RGB 0-255 -> (N, 3, 3) uint8: complementary, analogous +30°,
+    analogous -30° for every input color.
+    """
+    hls = rgb_to_hls_array(np.asarray(rgb, dtype=np.float64) / 255)
+    shifts = np.array([0.5, 1 / 12, -1 / 12])
+
+    shifted = np.repeat(hls[:, None, :], 3, axis=1)
+    shifted[:, :, 0] = (shifted[:, :, 0] + shifts) % 1.0
+
+    out = hls_to_rgb_array(shifted.reshape(-1, 3)) * 255
+    return out.astype(np.uint8).reshape(-1, 3, 3)
+
+
+def palette_strings(hex_colors):
+    """Hex strings -> the "#comp, #analog1, #analog2" strings generate_palette returns."""
+    palettes = generate_palettes(hex_to_rgb_array(hex_colors))
+    flat = rgb_array_to_hex(palettes.reshape(-1, 3))
+    return [", ".join(flat[i:i + 3]) for i in range(0, len(flat), 3)]
+
+# ---------------------------
+# Brightness Classes
+# ---------------------------
+CLASS_NAMES = np.array(["low", "medium", "high"])
+
+
+def classify_array(values):
+    """Vectorized classify(): <0.33 low, <0.66 medium, else high."""
+    return CLASS_NAMES[np.digitize(np.asarray(values, dtype=np.float64), [0.33, 0.66])]
+
+# ---------------------------
+# Model Lookups
+# ---------------------------
+def color_suggestions(hex_colors, brightness, contrast, index, fallback_style="Minimal Rounded (auto)"):
+    """
+    Batch version of get_color_suggestion. `brightness` and `contrast`
+    are scalars or per-color arrays of 0-1 values.
+    """
+    n = len(hex_colors)
+    b = np.broadcast_to(classify_array(brightness), (n,))
+    c = np.broadcast_to(classify_array(contrast), (n,))
+
+    matches = index.lookup_batch(hex_colors, b, c)
+    missing = [i for i, m in enumerate(matches) if m is None]
+    generated = palette_strings([hex_colors[i] for i in missing]) if missing else []
+
+    for i, palette in zip(missing, generated):
+        matches[i] = {
+            "dominant_color": hex_colors[i],
+            "brightness": str(b[i]),
+            "contrast": str(c[i]),
+            "suggested_color_palette": palette,
+            "suggested_font_style": fallback_style,
+        }
+    return matches
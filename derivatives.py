@@ -0,0 +1,176 @@
+import io
+import os
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+from metrics import timed
+from output_encoding import choose_format, encode_image, output_name, profile_for, supported
+from resize_image import decode_encoded, probe, resize_array, target_size
+
+# ---------------------------
+# Defaults
+# ---------------------------
+ENCODE_WORKERS = int(os.environ.get("DERIVATIVE_WORKERS", min(4, os.cpu_count() or 1)))
+MAX_DERIVATIVES = 12
+
+def _new_encoder():
+    return ThreadPoolExecutor(max_workers=ENCODE_WORKERS) if ENCODE_WORKERS > 1 else None
+
+
+def _after_fork():
+    # A forked child inherits the executor but not its threads
+    global _encoder
+    _encoder = _new_encoder()
+
+
+_encoder = _new_encoder()
+os.register_at_fork(after_in_child=_after_fork)
+
+# ---------------------------
+# Size Specs
+# ---------------------------
+def parse_sizes(spec):
+    """
+    "1280, 640x480, x200:webp" -> [(1280, None, None), (640, 480, None), (None, 200, "webp")].
+    Each item is WIDTH, WIDTHxHEIGHT or xHEIGHT, optionally followed by
+    :format (one of output_encoding.FORMATS, "jpg" for "jpeg"). Raises
+    ValueError on anything else.
+    """
+    targets = []
+    for item in spec.replace(";", ",").split(","):
+        item = item.strip().lower()
+        if not item:
+            continue
+
+        size, _, fmt = item.partition(":")
+        fmt = "jpeg" if fmt == "jpg" else fmt
+        if fmt and not supported(fmt):
+            raise ValueError(f"Unsupported format: {fmt}")
+
+        w, _, h = size.partition("x")
+        try:
+            width = int(w) if w else None
+            height = int(h) if h else None
+        except ValueError:
+            raise ValueError(f"Bad size: {item}") from None
+        if not (width or height) or (width or 1) < 1 or (height or 1) < 1:
+            raise ValueError(f"Bad size: {item}")
+
+        targets.append((width, height, fmt or None))
+
+    if not targets:
+        raise ValueError("Provide at least one size!")
+    if len(targets) > MAX_DERIVATIVES:
+        raise ValueError(f"At most {MAX_DERIVATIVES} sizes per request.")
+    return targets
+
+# ---------------------------
+# Pyramid
+# ---------------------------
+@timed("pyramid")
+def build_derivatives(img, targets):
+    """
+    One output array per (width, height, fmt) target, in input order.
+    The source is halved with 2x2 area averaging for as long as the
+    half is still at least as big as the next target, and each output
+    is then finished with one small area resize from the nearest level,
+    so no output is ever resized from more than twice its size.
+    """
+    h, w = img.shape[:2]
+    sizes = [target_size(w, h, tw, th) for tw, th, _ in targets]
+
+    outputs = [None] * len(sizes)
+    level = img
+    for i in sorted(range(len(sizes)), key=lambda i: sizes[i][0] * sizes[i][1], reverse=True):
+        tw, th = sizes[i]
+        lh, lw = level.shape[:2]
+        while lw // 2 >= tw and lh // 2 >= th:
+            level = cv2.resize(level, (lw // 2, lh // 2), interpolation=cv2.INTER_AREA)
+            lh, lw = level.shape[:2]
+        outputs[i] = resize_array(level, tw, th)
+    return outputs
+
+
+def derivative_formats(filename, targets, fmt=None):
+    """Each target's own format, else `fmt` (negotiated per request), else the source's default."""
+    default = fmt or choose_format("resize", filename)
+    return [target_fmt or default for _, _, target_fmt in targets]
+
+
+def derivative_names(filename, outputs, formats):
+    base = os.path.splitext(filename)[0]
+    return [output_name(f"{base}_{out.shape[1]}x{out.shape[0]}", fmt) for out, fmt in zip(outputs, formats)]
+
+
+def _encode(args):
+    img, fmt, profile = args
+    return encode_image(img, fmt, profile)
+
+
+@timed("encode")
+def encode_derivatives(outputs, formats, profile):
+    """
+    Encode every derivative with output_encoding's settings for `profile`,
+    in parallel when DERIVATIVE_WORKERS > 1 (the encoders release the GIL).
+    """
+    jobs = [(out, fmt, profile) for out, fmt in zip(outputs, formats)]
+    return list(_encoder.map(_encode, jobs) if _encoder else map(_encode, jobs))
+
+# ---------------------------
+# One-pass Pipeline
+# ---------------------------
+def make_derivatives(data, filename, targets, image=None, fmt=None):
+    """
+    Decode once (at a reduced JPEG scale if the largest target allows),
+    build every size from the halving pyramid and encode them in parallel,
+    each in its target's format or else `fmt` (see derivative_formats).
+    Returns [(name, width, height, encoded bytes)].
+    """
+    if image is None:
+        _, src_size, orientation = probe(io.BytesIO(data))
+        if src_size:
+            if orientation in (5, 6, 7, 8):
+                src_size = src_size[::-1]   # decoded upright, so the sides swap
+            sizes = [target_size(*src_size, tw, th) for tw, th, _ in targets]
+            image = decode_encoded(data, max(s[0] for s in sizes), max(s[1] for s in sizes))
+        else:
+            image = decode_encoded(data)
+
+    outputs = build_derivatives(image, targets)
+    formats = derivative_formats(filename, targets, fmt)
+    names = derivative_names(filename, outputs, formats)
+    encoded = encode_derivatives(outputs, formats, profile_for("resize", filename))
+    return [
+        (name, out.shape[1], out.shape[0], blob)
+        for name, out, blob in zip(names, outputs, encoded)
+    ]
+
+
+def zip_derivatives(derivatives):
+    """Bundle derivatives into one stored (already compressed) ZIP archive."""
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_STORED) as zf:
+        for name, _, _, blob in derivatives:
+            zf.writestr(name, blob)
+    return buf.getvalue()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Write several sizes of one image in a single pass.")
+    parser.add_argument("image")
+    parser.add_argument("sizes", help='e.g. "1920,1280,640x480:webp,x200"')
+    parser.add_argument("--out", default=".")
+    args = parser.parse_args()
+
+    with open(args.image, "rb") as f:
+        data = f.read()
+
+    os.makedirs(args.out, exist_ok=True)
+    for name, w, h, blob in make_derivatives(data, os.path.basename(args.image), parse_sizes(args.sizes)):
+        with open(os.path.join(args.out, name), "wb") as f:
+            f.write(blob)
+        print(f"✅ {name}  {w}x{h}  {len(blob) / 1024:.0f} KB")
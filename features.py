@@ -0,0 +1,143 @@
+import base64
+import os
+
+from app import extract_top_colors, calculate_brightness_contrast, get_color_suggestions, detect_font_from_text
+from blob_store import mimetype_for
+from derivatives import make_derivatives, parse_sizes, zip_derivatives
+from output_encoding import PREVIEW_MAX_SIDE, choose_format, encode_image, make_preview, output_name, profile_for
+from remove_bg import remove_background_image
+from resize_image import decode_encoded, resize_array, resize_encoded
+from rotate_image import normalize_angle, rotate_image
+
+UPLOAD_FOLDER = "static/uploads"
+
+# Features that consume OCR output; everything else skips tesseract entirely
+OCR_FEATURES = {"color_font"}
+
+
+def feature_params(feature, form):
+    """The request parameters a feature's output depends on (part of the cache key)."""
+    if feature == "resize":
+        # "sizes" asks for several derivatives at once, e.g. "1280, 640x480, x200:webp"
+        sizes = (form.get("sizes") or "").strip()
+        if sizes:
+            return {"sizes": sizes}
+        width = form.get("width")
+        height = form.get("height")
+        return {
+            "width": int(width) if width else None,
+            "height": int(height) if height else None,
+        }
+    if feature == "rotate":
+        # Clockwise degrees, any value; 90.0 and 450 share a cache key with 90
+        angle = normalize_angle(form.get("angle", 0))
+        return {"angle": int(angle) if angle.is_integer() else angle}
+    return {}
+
+
+def encode_output(image, feature, ctx, params, name):
+    """
+    Encode a feature's output in the negotiated format (params["format"],
+    set by the caller from the Accept header). Returns the bytes, the
+    output name with a matching extension, and the preview data URI.
+    """
+    fmt = params.get("format") or choose_format(feature, ctx.filename)
+    data = encode_image(image, fmt, profile_for(feature, ctx.filename))
+    return data, output_name(name, fmt), make_preview(image)
+
+
+def process_feature(ctx, feature, params):
+    """
+    Run one feature on a decoded upload, entirely in memory.
+    Returns (result.html context, encoded output bytes, output file name);
+    the caller decides where the bytes go and sets image_path.
+    """
+
+    # OCR runs lazily (at most once) and only for features that need it
+    no_text = ctx.no_text if feature in OCR_FEATURES else False
+
+    # 1️⃣ COLOR + FONT
+    if feature == "color_font":
+        palette = extract_top_colors(ctx.bgr, k=5)
+        brightness, contrast = calculate_brightness_contrast(ctx.bgr, stats=ctx.stats)
+        color_suggestions = get_color_suggestions(palette, brightness, contrast)
+
+        font_output = detect_font_from_text(ctx.bgr, gray=ctx.gray, text=ctx.text,
+                                            regions=ctx.text_regions or None, stats=ctx.stats)
+
+        context = dict(
+            palette=palette,
+            color_suggestions=color_suggestions,
+            font_output=font_output,
+            feature="color_font",
+            no_text=no_text
+        )
+        return context, ctx.data, ctx.filename
+
+    # 2️⃣ REMOVE BG
+    elif feature == "remove_bg":
+        output = remove_background_image(ctx.pil)
+        data, name, preview = encode_output(output, feature, ctx, params,
+                                            os.path.splitext(ctx.filename)[0] + "_noBG")
+        context = dict(
+            feature="remove_bg",
+            no_text=no_text,
+            preview_path=preview,
+            download_name=name,
+        )
+        return context, data, name
+
+    # 3️⃣ RESIZE
+    elif feature == "resize" and params.get("sizes"):
+        targets = parse_sizes(params["sizes"])
+        image = ctx.bgr if ctx.is_decoded else None
+        derivatives = make_derivatives(ctx.data, ctx.filename, targets, image=image, fmt=params.get("format"))
+
+        # Smallest output doubles as the on-page preview of the bundle; if even that
+        # is large, show a WebP preview of it instead
+        name, w, h, preview = min(derivatives, key=lambda d: d[1] * d[2])
+        preview_path = None
+        if max(w, h) > PREVIEW_MAX_SIDE:
+            preview_path = make_preview(decode_encoded(preview))
+        context = dict(
+            feature="resize",
+            no_text=no_text,
+            derivatives=[dict(name=n, width=w, height=h, kb=round(len(b) / 1024, 1))
+                         for n, w, h, b in derivatives],
+            preview_path=preview_path or f"data:{mimetype_for(name)};base64," + base64.b64encode(preview).decode("ascii"),
+            download_name=f"resized_{os.path.splitext(ctx.filename)[0]}.zip",
+        )
+        return context, zip_derivatives(derivatives), context["download_name"]
+
+    elif feature == "resize":
+        name = f"resized_{ctx.filename}"
+        if ctx.is_decoded:
+            resized = resize_array(ctx.bgr, params["width"], params["height"])
+        else:
+            # Not decoded yet: let JPEGs decode straight at a reduced scale
+            resized = resize_encoded(ctx.data, params["width"], params["height"])
+
+        data, name, preview = encode_output(resized, feature, ctx, params, name)
+        context = dict(
+            feature="resize",
+            no_text=no_text,
+            preview_path=preview,
+            download_name=name,
+        )
+        return context, data, name
+
+    # 4️⃣ ROTATE
+    elif feature == "rotate":
+        name = f"rotated_{ctx.filename}"
+        rotated = rotate_image(ctx.bgr, params["angle"])
+
+        data, name, preview = encode_output(rotated, feature, ctx, params, name)
+        context = dict(
+            feature="rotate",
+            no_text=no_text,
+            preview_path=preview,
+            download_name=name,
+        )
+        return context, data, name
+
+    return None
@@ -0,0 +1,179 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from glob import glob
+
+import cv2
+
+from lazy import registry
+
+# ---------------------------
+# Defaults
+# ---------------------------
+MATCH_THRESHOLD = 0.7
+COARSE_SLACK = 0.2        # coarse score may sit this far below the threshold and still be refined
+MIN_TEMPLATE_SIDE = 8     # never shrink a template below this at coarse levels
+REGION_PADDING = 8
+
+# ---------------------------
+# Template
+# ---------------------------
+class FontTemplate:
+    """One font sample, preprocessed at every scale and pyramid level."""
+
+    def __init__(self, name, gray, scales=(1.0,), pyramid_levels=2):
+        self.name = name
+        self.variants = []   # one pyramid (list, finest first) per scale
+
+        for scale in scales:
+            img = gray if scale == 1.0 else cv2.resize(
+                gray, None, fx=scale, fy=scale,
+                interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_CUBIC,
+            )
+            pyramid = [img]
+            while len(pyramid) <= pyramid_levels and min(pyramid[-1].shape[:2]) // 2 >= MIN_TEMPLATE_SIDE:
+                pyramid.append(cv2.pyrDown(pyramid[-1]))
+            self.variants.append(pyramid)
+
+# ---------------------------
+# Matcher
+# ---------------------------
+class FontMatcher:
+    """
+    Loads font templates once and matches them coarse-to-fine: each
+    template is first matched on a downsampled image pyramid, and only
+    a small window around the best coarse hit is matched at full
+    resolution. Matching can be limited to text regions and fanned out
+    across templates on a thread pool.
+    """
+
+    def __init__(self, templates_folder="font_templates", scales=(1.0,), pyramid_levels=2,
+                 threshold=MATCH_THRESHOLD, workers=None):
+        self.templates_folder = templates_folder
+        self.pyramid_levels = pyramid_levels
+        self.threshold = threshold
+        self.templates = []
+
+        for path in sorted(glob(os.path.join(templates_folder, "*.png"))):
+            gray = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+            if gray is None:
+                continue
+            name = os.path.basename(path).split(".")[0]
+            self.templates.append(FontTemplate(name, gray, scales, pyramid_levels))
+
+        self.workers = workers
+        self._pool = self._new_pool()
+
+    def _new_pool(self):
+        return ThreadPoolExecutor(max_workers=self.workers) if self.workers != 1 else None
+
+    # ----- image side -----
+    def _build_pyramid(self, gray):
+        pyramid = [gray]
+        for _ in range(self.pyramid_levels):
+            if min(pyramid[-1].shape[:2]) // 2 < MIN_TEMPLATE_SIDE:
+                break
+            pyramid.append(cv2.pyrDown(pyramid[-1]))
+        return pyramid
+
+    def _crop_regions(self, gray, regions):
+        if not regions:
+            return [gray]
+        h, w = gray.shape[:2]
+        crops = []
+        for x, y, bw, bh in regions:
+            x0, y0 = max(0, x - REGION_PADDING), max(0, y - REGION_PADDING)
+            x1, y1 = min(w, x + bw + REGION_PADDING), min(h, y + bh + REGION_PADDING)
+            if x1 > x0 and y1 > y0:
+                crops.append(gray[y0:y1, x0:x1])
+        return crops
+
+    # ----- matching -----
+    def _match_variant(self, image_pyramid, template_pyramid):
+        """Best full-resolution score of one template variant, or None."""
+        level = min(len(image_pyramid), len(template_pyramid)) - 1
+        while level >= 0:
+            img, tpl = image_pyramid[level], template_pyramid[level]
+            if tpl.shape[0] <= img.shape[0] and tpl.shape[1] <= img.shape[1]:
+                break
+            level -= 1
+        if level < 0:
+            return None
+
+        res = cv2.matchTemplate(image_pyramid[level], template_pyramid[level], cv2.TM_CCOEFF_NORMED)
+        _, score, _, (x, y) = cv2.minMaxLoc(res)
+        if level == 0:
+            return score
+        if score < self.threshold - COARSE_SLACK:
+            return None
+
+        # Refine in a small full-resolution window around the coarse hit
+        full, tpl = image_pyramid[0], template_pyramid[0]
+        factor = 2 ** level
+        margin = 2 * factor
+        x0 = max(0, x * factor - margin)
+        y0 = max(0, y * factor - margin)
+        x1 = min(full.shape[1], x * factor + tpl.shape[1] + margin)
+        y1 = min(full.shape[0], y * factor + tpl.shape[0] + margin)
+        window = full[y0:y1, x0:x1]
+        if window.shape[0] < tpl.shape[0] or window.shape[1] < tpl.shape[1]:
+            return score
+
+        res = cv2.matchTemplate(window, tpl, cv2.TM_CCOEFF_NORMED)
+        return cv2.minMaxLoc(res)[1]
+
+    def _match_template(self, template, image_pyramids):
+        best = None
+        for pyramid in image_pyramids:
+            for variant in template.variants:
+                score = self._match_variant(pyramid, variant)
+                if score is not None and (best is None or score > best):
+                    best = score
+        return template.name, best
+
+    def match(self, gray, regions=None, top_k=5):
+        """
+        Return up to top_k (font_name, score) pairs above the threshold,
+        best first. `regions` is an optional list of (x, y, w, h) text boxes.
+        """
+        if not self.templates:
+            return []
+
+        image_pyramids = [self._build_pyramid(crop) for crop in self._crop_regions(gray, regions)]
+        work = lambda t: self._match_template(t, image_pyramids)
+        results = self._pool.map(work, self.templates) if self._pool else map(work, self.templates)
+
+        matches = [(name, float(score)) for name, score in results
+                   if score is not None and score > self.threshold]
+        matches.sort(key=lambda x: x[1], reverse=True)
+        return matches[:top_k]
+
+# ---------------------------
+# Shared Instances
+# ---------------------------
+_matchers = {}
+_matchers_lock = threading.Lock()
+
+
+def get_font_matcher(templates_folder="font_templates"):
+    """One matcher per templates folder, loaded on first use and then reused."""
+    matcher = _matchers.get(templates_folder)
+    if matcher is None:
+        with _matchers_lock:
+            matcher = _matchers.get(templates_folder)
+            if matcher is None:
+                matcher = _matchers[templates_folder] = FontMatcher(templates_folder)
+    return matcher
+
+
+def _after_fork():
+    # Templates are inherited (shared copy-on-write); thread pools are not
+    global _matchers_lock
+    _matchers_lock = threading.Lock()
+    for matcher in _matchers.values():
+        matcher._pool = matcher._new_pool()
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+registry.register("font_matcher", get_font_matcher)
@@ -1,13 +1,14 @@
-import numpy as np
-from colorthief import ColorThief
-from PIL import Image
+from image_stats import ImageStats, load_stats
 
 def extract_dominant_color(image_path):
+    stats = image_stats_for(image_path)
+    return stats.dominant_color if stats else None
+
+def image_stats_for(image_path):
+    """Sampled statistics of the image file, or None if it cannot be read."""
     try:
-        color_thief = ColorThief(image_path)
-        dominant_color = color_thief.get_color(quality=1)
-        return dominant_color
-    except:
+        return load_stats(image_path)
+    except (OSError, ValueError):
         return None
 
 def calculate_brightness(rgb):
@@ -16,8 +17,10 @@ def calculate_brightness(rgb):
     return brightness
 
 def suggest_font(dominant_color):
-    r, g, b = dominant_color
-    brightness = calculate_brightness((r, g, b))
+    """Suggestions from the dominant color (an (r, g, b) tuple or ImageStats)."""
+    if isinstance(dominant_color, ImageStats):
+        dominant_color = dominant_color.dominant_color
+    brightness = calculate_brightness(dominant_color)
 
     suggestions = {}
 
@@ -47,12 +50,12 @@ def suggest_font(dominant_color):
     return suggestions
 
 def analyze_image_fonts(image_path):
-    dominant_color = extract_dominant_color(image_path)
-    if dominant_color is None:
+    stats = image_stats_for(image_path)
+    if stats is None:
         return {"error": "Unable to read image"}
 
-    suggestions = suggest_font(dominant_color)
-    suggestions["dominant_color"] = dominant_color
-    suggestions["brightness"] = calculate_brightness(dominant_color)
+    suggestions = suggest_font(stats)
+    suggestions["dominant_color"] = stats.dominant_color
+    suggestions["brightness"] = calculate_brightness(stats.dominant_color)
 
     return suggestions
@@ -0,0 +1,64 @@
+import os
+import tempfile
+
+from serving import cpu_count
+
+# ---------------------------
+# Workers
+# ---------------------------
+# Image work is CPU-bound native code that releases the GIL, so: one process per
+# core, a few threads each to overlap I/O and share the process's models.
+cores = cpu_count()
+workers = int(os.environ.get("WEB_CONCURRENCY", cores))
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+worker_class = "gthread"
+
+bind = os.environ.get("GUNICORN_BIND", f"0.0.0.0:{os.environ.get('PORT', '10000')}")
+wsgi_app = "ai_mitr:create_app()"
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
+graceful_timeout = 30
+keepalive = 5
+# Recycle workers now and then so fragmentation cannot grow without bound
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 1000))
+max_requests_jitter = max_requests // 10
+
+# ---------------------------
+# Preload And Fork
+# ---------------------------
+# Load modules and models once in the master; workers inherit them copy-on-write
+preload_app = os.environ.get("SERVER_PRELOAD", "1") == "1"
+os.environ.setdefault("SERVER_PRELOAD", "1" if preload_app else "0")
+
+# Native thread budgets per worker, so workers x threads do not oversubscribe the cores
+per_worker = str(max(1, cores // workers))
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")              # tesseract's OpenMP
+os.environ.setdefault("OCR_WORKERS", str(threads))          # one OCR slot per request thread
+os.environ.setdefault("REMBG_INTRA_THREADS", per_worker)
+os.environ.setdefault("DERIVATIVE_WORKERS", per_worker)
+os.environ.setdefault("JOB_WORKERS", per_worker)
+# Preloaded workers run jobs on their own threads: a spawned pool would load a second
+# copy of every model (and the rembg session) per worker, and again after each recycle
+os.environ.setdefault("JOB_EXECUTOR", "thread" if preload_app else "process")
+os.environ.setdefault("JOB_PREWARM", "1")                   # a process pool is started and warmed in post_fork
+# The worker's own rembg session is only worth building if remove_bg runs in the worker
+rembg_in_worker = os.environ.get("JOBS_ENABLED", "1") != "1" or os.environ["JOB_EXECUTOR"] == "thread"
+os.environ.setdefault("REMBG_PRELOAD", "1" if rembg_in_worker else "0")   # built in post_fork
+# Per-worker metrics files, summed by whichever worker answers /metrics
+os.environ.setdefault("METRICS_DIR", os.path.join(tempfile.gettempdir(), f"ai_mitr_metrics_{bind.rsplit(':', 1)[-1]}"))
+
+
+def on_starting(server):
+    import metrics
+    metrics.clear_shared(os.environ["METRICS_DIR"])
+
+
+def post_fork(server, worker):
+    import serving
+    serving.after_fork()
+
+
+def worker_exit(server, worker):
+    # Recycled (max_requests) or stopping workers take their in-memory job queue with them:
+    # let running jobs finish within the graceful timeout and fail the rest
+    import serving
+    serving.before_exit()
@@ -0,0 +1,106 @@
+from functools import cached_property
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from image_stats import compute_stats
+from metrics import timed
+
+PREVIEW_MAX_SIDE = 512
+
+# ---------------------------
+# Per-Request Image Context
+# ---------------------------
+class ImageContext:
+    """
+    Holds the raw upload bytes and decodes them once.
+    Derived views (BGR, RGB, gray, PIL, preview), image statistics and the OCR text/regions are
+    built on first access and cached for the rest of the request.
+    """
+
+    def __init__(self, data, filename=None, ocr=None):
+        self.data = data
+        self.filename = filename
+        self._ocr = ocr
+        self._bgr = None
+
+    @classmethod
+    def from_stream(cls, stream, filename=None, ocr=None):
+        return cls(stream.read(), filename, ocr)
+
+    @property
+    def bgr(self):
+        if self._bgr is None:
+            buf = np.frombuffer(self.data, dtype=np.uint8)
+            with timed("decode"):
+                img = cv2.imdecode(buf, cv2.IMREAD_COLOR)
+            if img is None:
+                raise ValueError("Could not load image.")
+            self._bgr = img
+        return self._bgr
+
+    @property
+    def is_decoded(self):
+        """True once bgr has been decoded; features that can decode more cheaply check this."""
+        return self._bgr is not None
+
+    @cached_property
+    def rgb(self):
+        return cv2.cvtColor(self.bgr, cv2.COLOR_BGR2RGB)
+
+    @cached_property
+    def gray(self):
+        return cv2.cvtColor(self.bgr, cv2.COLOR_BGR2GRAY)
+
+    @cached_property
+    def pil(self):
+        return Image.fromarray(self.rgb)
+
+    @cached_property
+    def stats(self):
+        """Sampled dominant color, luma histogram, brightness and contrast (one kernel pass)."""
+        return compute_stats(self.bgr)
+
+    @cached_property
+    def preview(self):
+        """BGR copy whose longest side is at most PREVIEW_MAX_SIDE."""
+        h, w = self.bgr.shape[:2]
+        scale = PREVIEW_MAX_SIDE / max(h, w)
+        if scale >= 1:
+            return self.bgr
+        size = (max(1, round(w * scale)), max(1, round(h * scale)))
+        return cv2.resize(self.bgr, size, interpolation=cv2.INTER_AREA)
+
+    @cached_property
+    def ocr_result(self):
+        """
+        (text, text boxes) from the OCR function, run at most once and only
+        if something asks for it. Functions returning a bare string get no boxes.
+        """
+        if self._ocr is None:
+            raise RuntimeError("No OCR function configured for this image.")
+        result = self._ocr(self.gray)
+        if isinstance(result, str):
+            return result.strip(), []
+        text, boxes = result
+        return text.strip(), list(boxes)
+
+    @property
+    def text(self):
+        return self.ocr_result[0]
+
+    @property
+    def text_regions(self):
+        """(x, y, w, h) boxes the text was read from, in gray/bgr coordinates."""
+        return self.ocr_result[1]
+
+    @property
+    def no_text(self):
+        return self.text == ""
+
+    def save(self, path):
+        """Write the original upload bytes; nothing is re-encoded."""
+        with open(path, "wb") as f:
+            f.write(self.data)
+        return path
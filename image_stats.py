@@ -0,0 +1,91 @@
+import os
+
+import numpy as np
+
+from metrics import timed
+from resize_image import decode_encoded, probe
+
+# ---------------------------
+# Config (environment)
+# ---------------------------
+STATS_MAX_PIXELS = int(os.environ.get("IMAGE_STATS_MAX_PIXELS", 65536))   # sampled pixels per image
+STATS_DECODE_SIDE = 512      # files are decoded (shrink-on-load) to about this width
+DOMINANT_BITS = 4            # 16 levels per channel -> 4096 color bins
+
+# Integer BT.601 luma weights (sum to 256), the same mix cv2 uses for BGR2GRAY
+_LUMA_R, _LUMA_G, _LUMA_B = 77, 150, 29
+
+# ---------------------------
+# Statistics Kernel
+# ---------------------------
+class ImageStats:
+    """Dominant color, luma histogram, brightness/contrast and dark/bright group of one image."""
+
+    __slots__ = ("dominant_color", "histogram", "brightness", "contrast", "group", "pixels")
+
+    def __init__(self, dominant_color, histogram, brightness, contrast, pixels):
+        self.dominant_color = dominant_color   # (r, g, b) ints, None for gray input
+        self.histogram = histogram             # 256 luma counts over the sample
+        self.brightness = brightness           # mean luma, 0-1
+        self.contrast = contrast               # luma standard deviation, 0-1
+        self.group = "dark" if brightness < 0.5 else "bright"
+        self.pixels = pixels                   # number of sampled pixels
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__ if name != "histogram"}
+
+
+def sample_grid(image, max_pixels=STATS_MAX_PIXELS):
+    """Strided view with at most ~max_pixels pixels; no copy, every region represented."""
+    h, w = image.shape[:2]
+    if max_pixels is None or h * w <= max_pixels:
+        return image
+    stride = int(np.ceil(np.sqrt(h * w / max_pixels)))
+    return image[stride // 2::stride, stride // 2::stride]
+
+
+@timed("image_stats")
+def compute_stats(image, order="bgr", max_pixels=STATS_MAX_PIXELS):
+    """
+    All statistics from one pass over a grid sample of `image` (BGR or
+    RGB uint8 array, or gray). Luma and the quantized color code of each
+    sampled pixel are computed together; the histogram gives brightness
+    and contrast, and the most populated color bin gives the dominant
+    color (the mean of the pixels in it).
+    """
+    sample = sample_grid(np.asarray(image), max_pixels)
+
+    if sample.ndim == 2 or sample.shape[2] == 1:
+        luma = sample.reshape(-1)
+        dominant = None
+    else:
+        px = sample[..., :3].reshape(-1, 3)
+        r_i, b_i = (2, 0) if order == "bgr" else (0, 2)
+        r = px[:, r_i].astype(np.uint32)
+        g = px[:, 1].astype(np.uint32)
+        b = px[:, b_i].astype(np.uint32)
+
+        luma = (_LUMA_R * r + _LUMA_G * g + _LUMA_B * b + 128) >> 8
+        shift = 8 - DOMINANT_BITS
+        codes = ((r >> shift) << (2 * DOMINANT_BITS)) | ((g >> shift) << DOMINANT_BITS) | (b >> shift)
+
+        in_bin = codes == np.argmax(np.bincount(codes, minlength=1 << (3 * DOMINANT_BITS)))
+        count = np.count_nonzero(in_bin)
+        dominant = tuple(int(round(int(c[in_bin].sum()) / count)) for c in (r, g, b))
+
+    hist = np.bincount(luma, minlength=256)
+    n = int(hist.sum())
+    levels = np.arange(256, dtype=np.float64)
+    mean = float(hist @ levels) / n
+    var = max(0.0, float(hist @ (levels * levels)) / n - mean * mean)
+
+    return ImageStats(dominant, hist, mean / 255, float(np.sqrt(var)) / 255, n)
+
+
+def load_stats(path, max_pixels=STATS_MAX_PIXELS):
+    """compute_stats for an image file, decoded at a reduced scale where the format allows."""
+    with open(path, "rb") as f:
+        data = f.read()
+    _, size, _ = probe(path)
+    width = min(size[0], STATS_DECODE_SIDE) if size else None
+    return compute_stats(decode_encoded(data, width), "bgr", max_pixels)
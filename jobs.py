@@ -0,0 +1,304 @@
+import json
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import metrics
+
+# ---------------------------
+# Config (environment)
+# ---------------------------
+JOBS_FOLDER = os.environ.get("JOBS_FOLDER", "jobs")
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", os.cpu_count() or 1))
+# JOB_EXECUTOR: process - a spawned pool that loads its own models; thread - threads of
+# the web process itself, sharing its (preloaded) models and rembg session
+JOB_EXECUTOR = os.environ.get("JOB_EXECUTOR", "process")
+# Per-feature concurrency caps, e.g. "remove_bg=2,color_font=4"; capped at JOB_WORKERS
+JOB_LIMITS = os.environ.get("JOB_LIMITS", "remove_bg=2")
+# Finished records are deleted after JOB_TTL; unfinished ones are failed after JOB_STALE_SECONDS
+JOB_TTL = int(os.environ.get("JOB_TTL", 3600))
+JOB_STALE_SECONDS = int(os.environ.get("JOB_STALE_SECONDS", 900))
+JOB_SWEEP_SECONDS = 60
+# How long a recycled/stopping worker waits for its running jobs
+JOB_DRAIN_SECONDS = int(os.environ.get("JOB_DRAIN_SECONDS", 20))
+# JOB_PREWARM=1 starts the pool (and loads its models) at worker boot instead of on the first job
+JOB_PREWARM = os.environ.get("JOB_PREWARM") == "1"
+
+# Features slow enough to be worth running off the request thread
+ASYNC_FEATURES = {"color_font", "remove_bg"}
+
+
+def parse_limits(spec):
+    limits = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        feature, _, value = part.partition("=")
+        limits[feature.strip()] = int(value)
+    return limits
+
+# ---------------------------
+# Worker Side
+# ---------------------------
+def _init_worker():
+    """
+    Pool process start: load the models and the rembg session now, so a
+    fresh pool (first job, or after a recycle) does not make its first
+    jobs pay for them.
+    """
+    import features  # noqa: F401  (registers every model, the rembg session included)
+    import remove_bg
+    from lazy import registry
+
+    registry.warm_up()
+    remove_bg.preload_session()
+
+
+def _ready():
+    return os.getpid()
+
+
+def run_job(data, filename, feature, params):
+    """
+    Executed inside a pool process: decode the upload and run the feature.
+    Returns process_feature's (context, output bytes, output name) and the
+    stage timings, which the parent merges into its own /metrics.
+    """
+    from features import process_feature
+    from image_context import ImageContext
+    from ocr_regions import read_text
+
+    with metrics.request_scope(feature) as timings:
+        ctx = ImageContext(data, filename, ocr=read_text)
+        ctx.bgr  # raises ValueError for unreadable uploads
+        result = process_feature(ctx, feature, params)
+    return result, timings
+
+def _alive(pid):
+    if pid is None:
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+# ---------------------------
+# Job Queue
+# ---------------------------
+class JobQueue:
+    """
+    Runs slow features on a local process or thread pool (no external
+    broker; see JOB_EXECUTOR).
+
+    Job records are small JSON files under `folder` (status, timestamps,
+    cache key, owning pid), so any web worker can answer a status poll,
+    not just the one that accepted the upload. The result itself goes to
+    the result cache through `on_done(job, result)` and is rendered from
+    there. Each feature has its own concurrency cap; jobs over the cap
+    wait in a per-feature FIFO until a slot frees up.
+
+    The queue lives in the accepting process, so a record whose owner has
+    exited, or that has not finished within `stale_after` seconds, is
+    reported as failed instead of polling forever. Finished records are
+    swept after `ttl` seconds.
+    """
+
+    def __init__(self, folder=JOBS_FOLDER, max_workers=JOB_WORKERS, limits=None, on_done=None,
+                 ttl=JOB_TTL, stale_after=JOB_STALE_SECONDS, executor=JOB_EXECUTOR):
+        self.folder = folder
+        self.max_workers = max_workers
+        # A cap above the pool size could never be reached; report what actually applies
+        limits = parse_limits(JOB_LIMITS) if limits is None else limits
+        self.limits = {feature: min(n, max_workers) for feature, n in limits.items()}
+        self.executor = executor
+        self.on_done = on_done
+        self.ttl = ttl
+        self.stale_after = stale_after
+        self._swept = 0.0
+
+        self._pool = None
+        self._lock = threading.RLock()  # done callbacks may fire while submit() holds it
+        self._pending = {}    # feature -> deque of (job_id, args)
+        self._running = {}    # feature -> count
+        self._futures = {}    # job_id -> future, while running
+        self._idle = threading.Condition(self._lock)
+        self.counters = {"submitted": 0, "done": 0, "failed": 0}
+        os.makedirs(folder, exist_ok=True)
+
+    # ----- records -----
+    def _path(self, job_id):
+        return os.path.join(self.folder, job_id + ".json")
+
+    def _write(self, job):
+        tmp = self._path(job["id"]) + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(job, f)
+        os.replace(tmp, self._path(job["id"]))
+
+    def get(self, job_id):
+        if not job_id or not all(c in "0123456789abcdef" for c in job_id):
+            return None
+        try:
+            with open(self._path(job_id)) as f:
+                job = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if job["status"] in ("queued", "running"):
+            error = self._stale(job)
+            if error:
+                job.update(status="failed", finished=time.time(), error=error)
+                self._write(job)
+        return job
+
+    def _stale(self, job):
+        """Why an unfinished job can never finish, or None while it still can."""
+        if not _alive(job.get("owner")):
+            return "The server process running this job exited; please upload again."
+        if self.stale_after and time.time() - job["submitted"] > self.stale_after:
+            return "The job timed out; please upload again."
+        return None
+
+    def _update(self, job_id, **fields):
+        job = self.get(job_id)
+        job.update(fields)
+        self._write(job)
+        return job
+
+    def sweep(self):
+        """Every JOB_SWEEP_SECONDS: delete records finished more than `ttl` seconds ago."""
+        now = time.time()
+        if now - self._swept < JOB_SWEEP_SECONDS:
+            return
+        self._swept = now
+        for name in os.listdir(self.folder):
+            path = os.path.join(self.folder, name)
+            try:
+                if os.path.getmtime(path) + self.ttl >= now:
+                    continue
+                job = self.get(name[:-len(".json")]) if name.endswith(".json") else None
+                if job is None or job["status"] in ("done", "failed"):
+                    os.remove(path)
+            except OSError:
+                pass
+
+    # ----- scheduling -----
+    def _get_pool(self):
+        if self._pool is None and self.executor == "thread":
+            self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="job")
+        elif self._pool is None:
+            # spawn: workers must not inherit the web process's threads and sessions
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+            )
+        return self._pool
+
+    def start(self):
+        """Start every pool process now, so they are warm (see _init_worker) before the first job."""
+        if self.executor == "thread":
+            return   # threads use the web process's own models
+        with self._lock:
+            pool = self._get_pool()
+            for _ in range(self.max_workers):
+                pool.submit(_ready)
+
+    def submit(self, feature, params, data, filename, cache_key=None):
+        job_id = uuid.uuid4().hex
+        self._write({
+            "id": job_id,
+            "feature": feature,
+            "cache_key": cache_key,
+            "status": "queued",
+            "submitted": time.time(),
+            "started": None,
+            "finished": None,
+            "error": None,
+            "owner": os.getpid(),
+        })
+        with self._lock:
+            self.counters["submitted"] += 1
+            self._pending.setdefault(feature, deque()).append(
+                (job_id, (data, filename, feature, params))
+            )
+            self._dispatch()
+        self.sweep()
+        return job_id
+
+    def _dispatch(self):
+        """Start queued jobs while their feature is under its cap. Caller holds the lock."""
+        for feature, pending in self._pending.items():
+            limit = self.limits.get(feature, self.max_workers)
+            while pending and self._running.get(feature, 0) < limit:
+                job_id, args = pending.popleft()
+                self._running[feature] = self._running.get(feature, 0) + 1
+                self._update(job_id, status="running", started=time.time())
+                future = self._get_pool().submit(run_job, *args)
+                self._futures[job_id] = future
+                future.add_done_callback(
+                    lambda f, job_id=job_id, feature=feature: self._finished(job_id, feature, f)
+                )
+
+    def _finished(self, job_id, feature, future):
+        try:
+            result, timings = future.result()
+            if self.executor != "thread":   # a thread's stages were recorded here already
+                metrics.observe_all(timings, feature)
+            if result is None:
+                raise ValueError(f"Unknown feature: {feature}")
+            if self.on_done:
+                with metrics.request_scope(feature):
+                    self.on_done(self.get(job_id), result)
+            self._update(job_id, status="done", finished=time.time())
+            outcome = "done"
+        except Exception as e:
+            self._update(job_id, status="failed", finished=time.time(), error=str(e))
+            outcome = "failed"
+
+        with self._lock:
+            self._futures.pop(job_id, None)
+            self.counters[outcome] += 1
+            self._running[feature] -= 1
+            self._dispatch()
+            self._idle.notify_all()
+
+    # ----- metrics -----
+    def metrics(self):
+        with self._lock:
+            features = set(self._pending) | set(self._running)
+            return {
+                "queued": {f: len(self._pending.get(f, ())) for f in features},
+                "running": {f: self._running.get(f, 0) for f in features},
+                "limits": {f: self.limits.get(f, self.max_workers) for f in features},
+                "queue_depth": sum(len(q) for q in self._pending.values()),
+                **self.counters,
+            }
+
+    def drain(self, timeout=JOB_DRAIN_SECONDS):
+        """
+        Before the process exits: fail queued jobs, give running ones up to
+        `timeout` seconds to finish, then fail whatever is still running.
+        """
+        with self._lock:
+            queued = [job_id for pending in self._pending.values() for job_id, _ in pending]
+            self._pending.clear()
+        for job_id in queued:
+            self._update(job_id, status="failed", finished=time.time(),
+                         error="The server restarted before this job started; please upload again.")
+        with self._lock:
+            # _finished() removes each job once its record is written
+            self._idle.wait_for(lambda: not self._futures, timeout=timeout)
+            running = list(self._futures)
+        for job_id in running:
+            self._update(job_id, status="failed", finished=time.time(),
+                         error="The server restarted while this job was running; please upload again.")
+        self.shutdown()
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
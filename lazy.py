@@ -0,0 +1,152 @@
+import importlib
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+
+# ---------------------------
+# Lazy Registry
+# ---------------------------
+class LazyRegistry:
+    """
+    Named resources (models, sessions, heavy modules) that are built on
+    first use. Each loader runs at most once per process; load times are
+    recorded so warm-up cost is visible. Entries registered with
+    per_process=True (native sessions, handles with threads) are dropped
+    in forked children and rebuilt there; everything else is inherited
+    and shared copy-on-write.
+    """
+
+    def __init__(self):
+        self._loaders = {}
+        self._values = {}
+        self._timings = {}
+        self._per_process = set()
+        self._lock = threading.RLock()
+
+    def register(self, name, loader, per_process=False):
+        with self._lock:
+            self._loaders[name] = loader
+            if per_process:
+                self._per_process.add(name)
+            else:
+                self._per_process.discard(name)
+        return name
+
+    def _after_fork(self):
+        self._lock = threading.RLock()
+        for name in self._per_process:
+            self._values.pop(name, None)
+            self._timings.pop(name, None)
+
+    def get(self, name):
+        try:
+            return self._values[name]
+        except KeyError:
+            pass
+        with self._lock:
+            if name not in self._values:
+                start = time.perf_counter()
+                self._values[name] = self._loaders[name]()
+                self._timings[name] = time.perf_counter() - start
+            return self._values[name]
+
+    def is_loaded(self, name):
+        return name in self._values
+
+    def warm_up(self, names=None):
+        """Load everything (or just `names`) now, e.g. at worker boot."""
+        for name in names or list(self._loaders):
+            self.get(name)
+        return self.report()
+
+    def report(self):
+        with self._lock:
+            return {
+                name: {
+                    "loaded": name in self._values,
+                    "seconds": self._timings.get(name),
+                    "per_process": name in self._per_process,
+                }
+                for name in self._loaders
+            }
+
+
+registry = LazyRegistry()
+os.register_at_fork(after_in_child=registry._after_fork)
+
+
+def lazy_import(module_name):
+    """
+    Stand-in for `import module_name` that defers the real import until
+    the first attribute access, recorded in the registry as import:<name>.
+    """
+    key = registry.register(f"import:{module_name}", lambda: importlib.import_module(module_name))
+
+    class _LazyModule:
+        def __getattr__(self, attr):
+            return getattr(registry.get(key), attr)
+
+        def __repr__(self):
+            state = "loaded" if registry.is_loaded(key) else "not loaded"
+            return f"<lazy module {module_name!r} ({state})>"
+
+    return _LazyModule()
+
+# ---------------------------
+# Import-Time Budget Report
+# ---------------------------
+ENTRY_POINTS = ("ai_mitr", "app", "remove_bg", "resize_image", "rotate_image")
+_IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+
+def import_report(module_name, top=10):
+    """
+    Import module_name in a fresh interpreter with -X importtime and
+    return its total cost plus the most expensive direct and nested imports.
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module_name}"],
+        capture_output=True, text=True,
+    )
+
+    rows = []
+    for line in proc.stderr.splitlines():
+        m = _IMPORTTIME_LINE.match(line)
+        if m:
+            rows.append((m.group(4), int(m.group(1)), int(m.group(2)), len(m.group(3))))
+
+    total = next((cum for name, _, cum, _ in reversed(rows) if name == module_name), None)
+    heaviest = sorted(rows, key=lambda r: r[2], reverse=True)
+    heaviest = [(name, cum / 1000) for name, _, cum, _ in heaviest if name != module_name][:top]
+
+    return {
+        "module": module_name,
+        "ok": proc.returncode == 0,
+        "total_ms": total / 1000 if total is not None else None,
+        "heaviest_ms": heaviest,
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Import-time budget report for the entry points.")
+    parser.add_argument("modules", nargs="*", default=list(ENTRY_POINTS))
+    parser.add_argument("--budget-ms", type=float, help="exit non-zero if any import exceeds this")
+    args = parser.parse_args()
+
+    over = False
+    for module in args.modules:
+        r = import_report(module)
+        total = "failed" if r["total_ms"] is None else f"{r['total_ms']:.0f} ms"
+        flag = ""
+        if args.budget_ms and r["total_ms"] and r["total_ms"] > args.budget_ms:
+            flag, over = "  ❌ over budget", True
+        print(f"\n===== {module}: {total}{flag} =====")
+        for name, ms in r["heaviest_ms"]:
+            print(f"  {ms:8.1f} ms  {name}")
+
+    sys.exit(1 if over else 0)
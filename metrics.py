@@ -0,0 +1,377 @@
+import bisect
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+try:
+    import fcntl
+except ImportError:   # Windows: single-process dev server, nothing to share
+    fcntl = None
+
+# ---------------------------
+# Config (environment)
+# ---------------------------
+# METRICS=0 turns every timer into a no-op (decorators return the bare function)
+METRICS_ENABLED = os.environ.get("METRICS", "1") != "0"
+# SERVER_TIMING=1 adds a Server-Timing header with the stages of each request
+SERVER_TIMING = os.environ.get("SERVER_TIMING") == "1"
+# Multi-process servers: each worker writes its histograms here (see share()) and
+# /metrics sums every file, like prometheus_client's multiprocess mode
+METRICS_DIR = os.environ.get("METRICS_DIR", "")
+METRICS_FLUSH_SECONDS = 1.0
+# Counts of exited workers, folded together so the folder does not grow with every recycle
+DEAD_FILE = "dead.json"
+
+# Prometheus-style upper bounds, in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Feature of the request being served and the stage timings it has collected so far
+_feature = ContextVar("metrics_feature", default="")
+_timings = ContextVar("metrics_timings", default=None)
+
+# ---------------------------
+# Histograms
+# ---------------------------
+class Histogram:
+    """Cumulative-bucket latency histogram (Prometheus semantics)."""
+
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)   # last slot is +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+
+
+_histograms = {}   # (stage, feature) -> Histogram
+_lock = threading.Lock()
+_shared = {"path": None, "flushed": 0.0}   # this process's file under METRICS_DIR, once share()d
+_flush_lock = threading.Lock()
+
+
+def observe(stage, seconds, feature=None):
+    """Record one stage duration for the current (or given) feature."""
+    if feature is None:
+        feature = _feature.get()
+    with _lock:
+        hist = _histograms.get((stage, feature))
+        if hist is None:
+            hist = _histograms[(stage, feature)] = Histogram()
+        hist.observe(seconds)
+
+    timings = _timings.get()
+    if timings is not None:
+        timings.append((stage, seconds))
+
+    if _shared["path"] and time.monotonic() - _shared["flushed"] >= METRICS_FLUSH_SECONDS:
+        flush()
+
+
+def observe_all(timings, feature=None):
+    """Merge (stage, seconds) pairs collected elsewhere, e.g. in a job worker."""
+    for stage, seconds in timings:
+        observe(stage, seconds, feature)
+
+# ---------------------------
+# Timers
+# ---------------------------
+class timed:
+    """
+    Time a stage, as a block or a function:
+
+        with timed("ocr"):
+            ...
+
+        @timed("palette")
+        def extract_top_colors(...):
+    """
+
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.start = None
+
+    def __enter__(self):
+        if METRICS_ENABLED:
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self.start is not None:
+            observe(self.stage, time.perf_counter() - self.start)
+
+    def __call__(self, func):
+        if not METRICS_ENABLED:
+            return func
+        stage = self.stage
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                observe(stage, time.perf_counter() - start)
+
+        return wrapper
+
+
+def start_request(feature=""):
+    """Begin collecting stages for a new web request; returns its timing list."""
+    timings = []
+    _feature.set(feature or "")
+    _timings.set(timings)
+    return timings
+
+
+def finish_request():
+    """Stop collecting and return the request's (stage, seconds) pairs."""
+    timings = _timings.get() or []
+    _timings.set(None)
+    _feature.set("")
+    return timings
+
+
+@contextmanager
+def request_scope(feature=""):
+    """
+    Attribute stages to `feature` and collect them for this request (or
+    job). Yields the list of (stage, seconds) pairs recorded inside.
+    """
+    timings = []
+    feature_token = _feature.set(feature or "")
+    timings_token = _timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _feature.reset(feature_token)
+        _timings.reset(timings_token)
+
+
+def set_feature(feature):
+    """Label the rest of the current request's stages with `feature`."""
+    _feature.set(feature or "")
+
+
+def current_feature():
+    return _feature.get()
+
+# ---------------------------
+# Export
+# ---------------------------
+def server_timing(timings):
+    """Server-Timing header value; repeated stages are summed."""
+    totals = {}
+    for stage, seconds in timings:
+        totals[stage] = totals.get(stage, 0.0) + seconds
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in totals.items())
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _snapshot():
+    with _lock:
+        return {k: (list(h.counts), h.total, h.count) for k, h in _histograms.items()}
+
+
+def _merged():
+    """This process's histograms plus, when shared, every worker's file under METRICS_DIR."""
+    if not _shared["path"]:
+        return _snapshot()
+    flush()
+    folder = os.path.dirname(_shared["path"])
+    _compact(folder)
+    merged = {}
+    with _folder_lock(folder, exclusive=False):
+        for name in os.listdir(folder):
+            if name.endswith(".json"):
+                _add(merged, _read_rows(os.path.join(folder, name)))
+    return merged
+
+
+def render_prometheus(prefix="ai_mitr"):
+    """All histograms (of every worker, when shared) in the Prometheus text exposition format (0.0.4)."""
+    name = f"{prefix}_stage_seconds"
+    lines = [
+        f"# HELP {name} Time spent in each processing stage, by feature.",
+        f"# TYPE {name} histogram",
+    ]
+
+    for (stage, feature), (counts, total, count) in sorted(_merged().items()):
+        labels = f'stage="{_escape(stage)}",feature="{_escape(feature)}"'
+        running = 0
+        for bound, n in zip(BUCKETS, counts):
+            running += n
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {running}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {count}')
+        lines.append(f"{name}_sum{{{labels}}} {total:.6f}")
+        lines.append(f"{name}_count{{{labels}}} {count}")
+
+    return "\n".join(lines) + "\n"
+
+# ---------------------------
+# Multi-Process Sharing
+# ---------------------------
+def share(folder=None):
+    """
+    Call once per worker process: from now on its histograms are written
+    (at most every METRICS_FLUSH_SECONDS) to a file of its own under
+    `folder`, and render_prometheus() sums all files there. Counts of
+    exited workers are folded into DEAD_FILE (see retire() and
+    _compact()), so totals never go backwards; clear the folder when the
+    server (not a worker) starts.
+    """
+    folder = folder or METRICS_DIR
+    if not folder:
+        return
+    os.makedirs(folder, exist_ok=True)
+    _shared["path"] = os.path.join(folder, f"{os.getpid()}-{time.time_ns()}.json")
+    flush()
+
+
+def flush():
+    """Write this process's histograms to its shared file now."""
+    with _flush_lock:
+        path = _shared["path"]
+        if not path:
+            return
+        _shared["flushed"] = time.monotonic()
+        _write_rows(path, _snapshot())
+
+
+def retire():
+    """Worker exit: fold this process's histograms into DEAD_FILE and drop its own file."""
+    with _flush_lock:   # no flush() may recreate the file afterwards
+        path, _shared["path"] = _shared["path"], None
+    if not path:
+        return
+    folder = os.path.dirname(path)
+    with _folder_lock(folder, exclusive=True):
+        merged = {}
+        _add(merged, _read_rows(os.path.join(folder, DEAD_FILE)))
+        for key, (counts, total, count) in _snapshot().items():
+            _add(merged, [[*key, counts, total, count]])
+        if _write_rows(os.path.join(folder, DEAD_FILE), merged):
+            _remove(path)
+
+
+def _compact(folder):
+    """Fold the files of workers that died without retire() (killed, timed out) into DEAD_FILE."""
+    dead = []
+    for name in os.listdir(folder):
+        pid = name.split("-", 1)[0]
+        if name.endswith(".json") and pid.isdigit() and not _alive(int(pid)):
+            dead.append(os.path.join(folder, name))
+    if not dead:
+        return
+    with _folder_lock(folder, exclusive=True):
+        merged = {}
+        _add(merged, _read_rows(os.path.join(folder, DEAD_FILE)))
+        dead = [path for path in dead if os.path.exists(path)]   # another worker may have folded them
+        for path in dead:
+            _add(merged, _read_rows(path))
+        if _write_rows(os.path.join(folder, DEAD_FILE), merged):
+            for path in dead:
+                _remove(path)
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+@contextmanager
+def _folder_lock(folder, exclusive):
+    """Readers share, folders exclude each other, so no count is read twice or missed."""
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(folder, ".lock"), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _read_rows(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return []
+
+
+def _add(merged, rows):
+    """Sum [stage, feature, counts, total, count] rows into {(stage, feature): (counts, total, count)}."""
+    for stage, feature, counts, total, count in rows:
+        entry = merged.get((stage, feature))
+        if entry is None:
+            merged[(stage, feature)] = (counts, total, count)
+        else:
+            merged[(stage, feature)] = ([a + b for a, b in zip(entry[0], counts)],
+                                        entry[1] + total, entry[2] + count)
+
+
+def _write_rows(path, merged):
+    """Atomically replace `path` with `merged` as rows; False if it could not be written."""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "w") as f:
+            json.dump([[stage, feature, *values] for (stage, feature), values in merged.items()], f)
+        os.replace(tmp, path)
+    except OSError:
+        return False
+    return True
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def clear_shared(folder=None):
+    """Remove every worker file; for the server master at startup."""
+    folder = folder or METRICS_DIR
+    if not folder or not os.path.isdir(folder):
+        return
+    for name in os.listdir(folder):
+        try:
+            os.remove(os.path.join(folder, name))
+        except OSError:
+            pass
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+
+
+def _after_fork():
+    # Each worker reports its own stages, not what the parent timed while preloading
+    global _lock, _flush_lock
+    _lock, _flush_lock = threading.Lock(), threading.Lock()
+    _histograms.clear()
+    _shared["path"] = None   # the child share()s under its own pid
+
+
+os.register_at_fork(after_in_child=_after_fork)
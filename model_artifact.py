@@ -0,0 +1,405 @@
+import hashlib
+import json
+import math
+import mmap as mmap_module
+import os
+import pickle
+import time
+
+import numpy as np
+
+from color_ops import hex_to_packed_array, packed_to_rgb_array, rgb_array_to_hex
+
+# ---------------------------
+# Config (environment)
+# ---------------------------
+MODEL_ARTIFACT = os.environ.get("MODEL_ARTIFACT", "models")
+
+FORMAT = "ai-mitr-model"
+FORMAT_VERSION = 1
+LEVELS = ("low", "medium", "high")   # brightness / contrast enum, code = position
+
+MANIFEST = "manifest.json"
+
+# Column name -> dtype; every color column has one row per color model entry
+COLUMNS = {
+    "color": "<u4",        # 0xRRGGBB
+    "brightness": "u1",    # LEVELS code
+    "contrast": "u1",      # LEVELS code
+    "palette": "<u2",      # string id of suggested_color_palette
+    "font_style": "<u2",   # string id of suggested_font_style
+    "font_ids": "<u2",     # string ids of every font group, concatenated
+}
+
+
+class ModelFormatError(ValueError):
+    pass
+
+# ---------------------------
+# Packing
+# ---------------------------
+def pack_colors(hex_colors):
+    return hex_to_packed_array(hex_colors)
+
+
+def unpack_colors(packed):
+    return rgb_array_to_hex(packed_to_rgb_array(packed))
+
+
+class _Strings:
+    """Interned string table; each distinct string is stored once."""
+
+    def __init__(self):
+        self.table = []
+        self.ids = {}
+
+    def __call__(self, value):
+        value = str(value)
+        if value not in self.ids:
+            self.ids[value] = len(self.table)
+            self.table.append(value)
+        return self.ids[value]
+
+# ---------------------------
+# Build
+# ---------------------------
+def _level_codes(values, column):
+    try:
+        return np.array([LEVELS.index(v) for v in values], dtype=COLUMNS[column])
+    except ValueError:
+        raise ModelFormatError(f"{column} must be one of {LEVELS}") from None
+
+
+def compile_model(color_entries, font_groups, out_dir=MODEL_ARTIFACT, source=None):
+    """
+    Write the color model entries and font groups as a columnar artifact:
+    one binary file of packed columns (named by content hash) plus
+    manifest.json, which is replaced last so readers never see a
+    half-written model.
+    Returns the manifest.
+    """
+    entries = list(color_entries)
+    strings = _Strings()
+
+    columns = {
+        "color": pack_colors([e["dominant_color"] for e in entries]),
+        "brightness": _level_codes([e["brightness"] for e in entries], "brightness"),
+        "contrast": _level_codes([e["contrast"] for e in entries], "contrast"),
+        "palette": np.array([strings(e["suggested_color_palette"]) for e in entries], dtype=COLUMNS["palette"]),
+        "font_style": np.array([strings(e["suggested_font_style"]) for e in entries], dtype=COLUMNS["font_style"]),
+    }
+
+    groups, font_ids = {}, []
+    for group, fonts in font_groups.items():
+        groups[group] = [len(font_ids), len(fonts)]   # offset, count into font_ids
+        font_ids.extend(strings(f) for f in fonts)
+    columns["font_ids"] = np.array(font_ids, dtype=COLUMNS["font_ids"])
+
+    if len(strings.table) > np.iinfo(np.uint16).max:
+        raise ModelFormatError("Too many distinct strings for 16-bit ids.")
+
+    # All columns go into one 8-byte aligned file, so loading is a single mmap
+    arrays, chunks, offset = {}, [], 0
+    for name, arr in columns.items():
+        arr = np.ascontiguousarray(arr, dtype=COLUMNS[name])
+        data = arr.tobytes()
+        arrays[name] = {"offset": offset, "dtype": arr.dtype.str, "shape": list(arr.shape),
+                        "sha256": hashlib.sha256(data).hexdigest()}
+        pad = -len(data) % 8
+        chunks.append(data + b"\0" * pad)
+        offset += len(data) + pad
+    blob = b"".join(chunks)
+
+    os.makedirs(out_dir, exist_ok=True)
+    data_file = f"columns-{hashlib.sha256(blob).hexdigest()[:12]}.bin"
+    path = os.path.join(out_dir, data_file)
+    if not os.path.exists(path):
+        with open(path + ".tmp", "wb") as f:
+            f.write(blob)
+        os.replace(path + ".tmp", path)
+
+    manifest = {
+        "format": FORMAT,
+        "version": FORMAT_VERSION,
+        "created": int(time.time()),
+        "source": source,
+        "rows": len(entries),
+        "levels": list(LEVELS),
+        "strings": strings.table,
+        "font_groups": groups,
+        "data": data_file,
+        "arrays": arrays,
+    }
+
+    tmp = os.path.join(out_dir, MANIFEST + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp, os.path.join(out_dir, MANIFEST))
+
+    # Data from older builds; processes that still map it keep their pages
+    for name in os.listdir(out_dir):
+        if name.startswith("columns-") and name != data_file:
+            os.remove(os.path.join(out_dir, name))
+    return manifest
+
+
+def import_pickles(color_path="tesco_model.pkl", font_path="font_suggestion_model.pkl", out_dir=MODEL_ARTIFACT):
+    """
+    Compile the legacy pickles into an artifact. Pickle can run arbitrary
+    code, so this is a build step for trusted files only; the app itself
+    then never needs to unpickle.
+    """
+    with open(color_path, "rb") as f:
+        color_entries = pickle.load(f)
+    with open(font_path, "rb") as f:
+        font_groups = pickle.load(f)
+    return compile_model(color_entries, font_groups, out_dir,
+                         source=[os.path.basename(color_path), os.path.basename(font_path)])
+
+# ---------------------------
+# Load
+# ---------------------------
+class ModelArtifact:
+    """
+    A loaded artifact. Columns are memory-mapped read-only, so every
+    worker process on the machine shares the same page-cache pages.
+    """
+
+    def __init__(self, path=MODEL_ARTIFACT, mmap=True):
+        self.path = path
+        try:
+            with open(os.path.join(path, MANIFEST)) as f:
+                self.manifest = json.load(f)
+        except FileNotFoundError:
+            raise   # no artifact built; callers may fall back to the pickles
+        except (OSError, ValueError) as e:
+            raise ModelFormatError(f"Unreadable manifest in {path}: {e}") from None
+
+        if self.manifest.get("format") != FORMAT:
+            raise ModelFormatError(f"{path} is not an {FORMAT} artifact")
+        if self.manifest.get("version") != FORMAT_VERSION:
+            raise ModelFormatError(
+                f"{path} has format version {self.manifest.get('version')}, expected {FORMAT_VERSION}"
+            )
+
+        self.strings = tuple(self.manifest["strings"])
+        self.levels = tuple(self.manifest["levels"])
+        data_path = os.path.join(path, self.manifest["data"])
+        try:
+            with open(data_path, "rb") as f:
+                if mmap and os.fstat(f.fileno()).st_size:
+                    # Plain ndarray views over a read-only mmap (np.memmap adds per-slice overhead)
+                    data = np.frombuffer(mmap_module.mmap(f.fileno(), 0, access=mmap_module.ACCESS_READ),
+                                         dtype=np.uint8)
+                else:
+                    data = np.frombuffer(f.read(), dtype=np.uint8)
+        except (OSError, ValueError) as e:
+            raise ModelFormatError(f"Bad column data: {e}") from None
+
+        self.columns = {}
+        for name, meta in self.manifest["arrays"].items():
+            dtype = np.dtype(meta["dtype"])
+            count = math.prod(meta["shape"])
+            start = meta["offset"]
+            end = start + count * dtype.itemsize
+            if start < 0 or end > data.size:
+                raise ModelFormatError(f"Column {name!r} runs past the end of {self.manifest['data']}")
+            self.columns[name] = data[start:end].view(dtype).reshape(meta["shape"])
+
+        validate(self)
+
+    def __len__(self):
+        return int(self.manifest["rows"])
+
+    def entry(self, i):
+        """Row i as a color model entry dict."""
+        c = self.columns
+        return {
+            "dominant_color": "#%06x" % int(c["color"][i]),
+            "brightness": self.levels[c["brightness"][i]],
+            "contrast": self.levels[c["contrast"][i]],
+            "suggested_color_palette": self.strings[c["palette"][i]],
+            "suggested_font_style": self.strings[c["font_style"][i]],
+        }
+
+    def entries(self):
+        """Read-only sequence of entry dicts, each built only when indexed."""
+        return _Entries(self)
+
+    def color_entries(self):
+        """Every entry, in the shape train_model.py used to pickle (list of dicts)."""
+        return [self.entry(i) for i in range(len(self))]
+
+    def font_model(self):
+        """{group: [font names]}, as in font_suggestion_model.pkl."""
+        ids = self.columns["font_ids"]
+        return {
+            group: [self.strings[i] for i in ids[offset:offset + count]]
+            for group, (offset, count) in self.manifest["font_groups"].items()
+        }
+
+
+class _Entries:
+    __slots__ = ("artifact",)
+
+    def __init__(self, artifact):
+        self.artifact = artifact
+
+    def __len__(self):
+        return len(self.artifact)
+
+    def __getitem__(self, i):
+        i = int(i)
+        if not -len(self) <= i < len(self):
+            raise IndexError(i)
+        return self.artifact.entry(i % len(self))
+
+
+def validate(artifact, checksums=False):
+    """
+    Raise ModelFormatError unless every column has the declared dtype and
+    shape, color columns agree on length, and every code or string id is
+    in range. checksums=True also re-hashes each column.
+    """
+    manifest, columns = artifact.manifest, artifact.columns
+
+    missing = set(COLUMNS) - set(columns)
+    if missing:
+        raise ModelFormatError(f"Missing columns: {sorted(missing)}")
+
+    for name, arr in columns.items():
+        meta = manifest["arrays"][name]
+        if arr.dtype.str != meta["dtype"] or list(arr.shape) != meta["shape"]:
+            raise ModelFormatError(f"Column {name!r} is {arr.dtype.str}{arr.shape}, manifest says "
+                                   f"{meta['dtype']}{tuple(meta['shape'])}")
+        if checksums and hashlib.sha256(np.ascontiguousarray(arr).tobytes()).hexdigest() != meta["sha256"]:
+            raise ModelFormatError(f"Column {name!r} does not match its checksum")
+
+    rows = len(artifact)
+    for name in ("color", "brightness", "contrast", "palette", "font_style"):
+        if columns[name].shape != (rows,):
+            raise ModelFormatError(f"Column {name!r} has {columns[name].shape[0]} rows, expected {rows}")
+
+    n_strings = len(artifact.strings)
+    if rows and int(columns["color"].max()) > 0xFFFFFF:
+        raise ModelFormatError("Color out of range")
+    for name in ("brightness", "contrast"):
+        if rows and int(columns[name].max()) >= len(artifact.levels):
+            raise ModelFormatError(f"Unknown {name} code")
+    for name in ("palette", "font_style", "font_ids"):
+        if columns[name].size and int(columns[name].max()) >= n_strings:
+            raise ModelFormatError(f"String id out of range in {name!r}")
+
+    n_fonts = columns["font_ids"].shape[0]
+    for group, (offset, count) in manifest["font_groups"].items():
+        if offset < 0 or count < 0 or offset + count > n_fonts:
+            raise ModelFormatError(f"Font group {group!r} is out of range")
+
+
+def load_artifact(path=MODEL_ARTIFACT):
+    return ModelArtifact(path)
+
+# ---------------------------
+# Load-time Benchmark
+# ---------------------------
+def synthetic_model(rows, seed=0):
+    """Color entries and font groups of a given size, for timing loads beyond the 10-row curated model."""
+    rng = np.random.default_rng(seed)
+    colors = rgb_array_to_hex(rng.integers(0, 256, size=(rows, 3)))
+    levels = rng.integers(0, len(LEVELS), size=(rows, 2))
+    entries = [
+        {
+            "dominant_color": colors[i],
+            "brightness": LEVELS[levels[i, 0]],
+            "contrast": LEVELS[levels[i, 1]],
+            "suggested_color_palette": f"Palette {i % 500}",
+            "suggested_font_style": f"Style {i % 50}",
+        }
+        for i in range(rows)
+    ]
+    fonts = {"bright": ["Montserrat", "Poppins"], "dark": ["Oswald"], "colorful": ["Raleway"]}
+    return entries, fonts
+
+
+def _median_seconds(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return float(np.median(times))
+
+
+def benchmark(path=MODEL_ARTIFACT, color_path="tesco_model.pkl", font_path="font_suggestion_model.pkl",
+              repeat=200):
+    """
+    Median seconds to load via pickle, to open the artifact, and to open
+    it and materialize the same dicts the pickles hold.
+    """
+    def via_pickle():
+        with open(color_path, "rb") as f:
+            pickle.load(f)
+        with open(font_path, "rb") as f:
+            pickle.load(f)
+
+    def via_artifact():
+        artifact = load_artifact(path)
+        return artifact.color_entries(), artifact.font_model()
+
+    return {
+        "pickle": _median_seconds(via_pickle, repeat),
+        "artifact_open": _median_seconds(lambda: load_artifact(path), repeat),
+        "artifact_entries": _median_seconds(via_artifact, repeat),
+    }
+
+
+def benchmark_synthetic(rows, repeat=20):
+    """benchmark() on a synthetic model of `rows` entries, built in a temporary directory."""
+    import tempfile
+
+    entries, fonts = synthetic_model(rows)
+    with tempfile.TemporaryDirectory() as tmp:
+        color_path, font_path = os.path.join(tmp, "colors.pkl"), os.path.join(tmp, "fonts.pkl")
+        with open(color_path, "wb") as f:
+            pickle.dump(entries, f)
+        with open(font_path, "wb") as f:
+            pickle.dump(fonts, f)
+        compile_model(entries, fonts, os.path.join(tmp, "artifact"))
+        return benchmark(os.path.join(tmp, "artifact"), color_path, font_path, repeat)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build, check and time the columnar model artifact.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="compile the legacy pickles into an artifact")
+    build.add_argument("--colors", default="tesco_model.pkl")
+    build.add_argument("--fonts", default="font_suggestion_model.pkl")
+    build.add_argument("--out", default=MODEL_ARTIFACT)
+
+    verify = sub.add_parser("verify", help="validate an artifact, including checksums")
+    verify.add_argument("path", nargs="?", default=MODEL_ARTIFACT)
+
+    bench = sub.add_parser("bench", help="compare load time against the pickles")
+    bench.add_argument("path", nargs="?", default=MODEL_ARTIFACT)
+    bench.add_argument("--repeat", type=int, default=200)
+    bench.add_argument("--rows", type=int, help="time a synthetic model of this many entries instead")
+
+    args = parser.parse_args()
+
+    if args.command == "build":
+        manifest = import_pickles(args.colors, args.fonts, args.out)
+        print(f"✅ {args.out}: {manifest['rows']} colors, {len(manifest['strings'])} strings, "
+              f"{len(manifest['font_groups'])} font groups")
+    elif args.command == "verify":
+        validate(load_artifact(args.path), checksums=True)
+        print(f"✅ {args.path} is valid")
+    else:
+        if args.rows:
+            results = benchmark_synthetic(args.rows, min(args.repeat, 20))
+        else:
+            results = benchmark(args.path, repeat=args.repeat)
+        for name, seconds in results.items():
+            print(f"{name:17s} {seconds * 1e3:9.3f} ms")
@@ -0,0 +1,252 @@
+import abc
+import os
+import queue
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+from PIL import Image
+
+from metrics import timed
+
+# ---------------------------
+# Config (environment)
+# ---------------------------
+# OCR_BACKEND: auto | tesserocr | pytesseract | stub
+OCR_BACKEND = os.environ.get("OCR_BACKEND", "auto")
+OCR_WORKERS = int(os.environ.get("OCR_WORKERS", os.cpu_count() or 1))
+OCR_MAX_PENDING = int(os.environ.get("OCR_MAX_PENDING", 16))
+OCR_TIMEOUT = float(os.environ.get("OCR_TIMEOUT", 30))
+OCR_LANG = os.environ.get("OCR_LANG", "eng")
+
+WINDOWS_TESSERACT_CMD = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
+
+
+class OcrBusyError(RuntimeError):
+    """Raised when the OCR queue is full and the wait timed out."""
+
+
+def to_pil(image):
+    if isinstance(image, Image.Image):
+        return image
+    return Image.fromarray(np.asarray(image))
+
+# ---------------------------
+# Engine Interface
+# ---------------------------
+class OcrEngine(abc.ABC):
+    """
+    Minimal OCR interface. Every engine bounds how many calls may run or
+    wait at once: `workers` run concurrently, up to `max_pending` more
+    queue, and anything beyond that waits `timeout` seconds then fails
+    with OcrBusyError.
+    """
+
+    name = "base"
+    # True when a call is cheap (in-process handles); per-call subprocess engines are not
+    pooled = False
+
+    def __init__(self, workers=OCR_WORKERS, max_pending=OCR_MAX_PENDING, timeout=OCR_TIMEOUT):
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self._running = threading.BoundedSemaphore(self.workers)
+        self._admitted = threading.BoundedSemaphore(self.workers + max(0, max_pending))
+
+    @contextmanager
+    def _slot(self):
+        if not self._admitted.acquire(timeout=self.timeout):
+            raise OcrBusyError("OCR queue is full, try again later.")
+        try:
+            if not self._running.acquire(timeout=self.timeout):
+                raise OcrBusyError("Timed out waiting for an OCR worker.")
+            try:
+                yield
+            finally:
+                self._running.release()
+        finally:
+            self._admitted.release()
+
+    def image_to_string(self, image, psm=None):
+        with self._slot():
+            return self._recognize(image, psm)
+
+    def image_to_words(self, image, psm=None):
+        """[(text, (x, y, w, h), line_key)] for every recognized word, in reading order."""
+        with self._slot():
+            return self._words(image, psm)
+
+    @abc.abstractmethod
+    def _recognize(self, image, psm):
+        """Plain text of `image`; called with a slot held."""
+
+    @abc.abstractmethod
+    def _words(self, image, psm):
+        """Words with boxes and line keys, as image_to_words returns them."""
+
+    def close(self):
+        pass
+
+
+class PytesseractEngine(OcrEngine):
+    """Fallback: one tesseract subprocess per call."""
+
+    name = "pytesseract"
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        import pytesseract
+        if os.name == "nt":
+            pytesseract.pytesseract.tesseract_cmd = WINDOWS_TESSERACT_CMD
+        self._pytesseract = pytesseract
+
+    def _recognize(self, image, psm):
+        config = f"--psm {psm}" if psm is not None else ""
+        return self._pytesseract.image_to_string(to_pil(image), lang=OCR_LANG, config=config)
+
+    def _words(self, image, psm):
+        config = f"--psm {psm}" if psm is not None else ""
+        data = self._pytesseract.image_to_data(to_pil(image), lang=OCR_LANG, config=config,
+                                               output_type=self._pytesseract.Output.DICT)
+        words = []
+        for i, text in enumerate(data.get("text", ())):
+            if text.strip() and float(data["conf"][i]) >= 0:
+                box = (data["left"][i], data["top"][i], data["width"][i], data["height"][i])
+                words.append((text, box, (data["block_num"][i], data["par_num"][i], data["line_num"][i])))
+        return words
+
+
+class TesserocrPoolEngine(OcrEngine):
+    """
+    Pool of long-lived in-process Tesseract handles (tesserocr), so language
+    data is loaded once per handle instead of once per call.
+    """
+
+    name = "tesserocr"
+    pooled = True
+
+    def __init__(self, lang=OCR_LANG, **kwargs):
+        super().__init__(**kwargs)
+        import tesserocr
+        self._tesserocr = tesserocr
+        self._apis = queue.Queue()
+        for _ in range(self.workers):
+            self._apis.put(tesserocr.PyTessBaseAPI(lang=lang))
+
+    def _recognize(self, image, psm):
+        api = self._apis.get()
+        try:
+            api.SetPageSegMode(psm if psm is not None else self._tesserocr.PSM.AUTO)
+            api.SetImage(to_pil(image))
+            return api.GetUTF8Text()
+        finally:
+            api.Clear()
+            self._apis.put(api)
+
+    def _words(self, image, psm):
+        RIL = self._tesserocr.RIL
+        api = self._apis.get()
+        try:
+            api.SetPageSegMode(psm if psm is not None else self._tesserocr.PSM.AUTO)
+            api.SetImage(to_pil(image))
+            api.Recognize()
+            words, line = [], 0
+            for r in self._tesserocr.iterate_level(api.GetIterator(), RIL.WORD):
+                if r.IsAtBeginningOf(RIL.TEXTLINE):
+                    line += 1
+                text = r.GetUTF8Text(RIL.WORD)
+                box = r.BoundingBox(RIL.WORD)
+                if text and text.strip() and box:
+                    x0, y0, x1, y1 = box
+                    words.append((text, (x0, y0, x1 - x0, y1 - y0), line))
+            return words
+        finally:
+            api.Clear()
+            self._apis.put(api)
+
+    def close(self):
+        while not self._apis.empty():
+            self._apis.get().End()
+
+
+class StubEngine(OcrEngine):
+    """
+    Offline engine for local runs and tests. `text` is either a fixed
+    string or a callable taking the image.
+    """
+
+    name = "stub"
+    pooled = True
+
+    def __init__(self, text="", **kwargs):
+        super().__init__(**kwargs)
+        self.text = text
+        self.calls = 0
+
+    def _recognize(self, image, psm):
+        self.calls += 1
+        return self.text(image) if callable(self.text) else self.text
+
+    def _words(self, image, psm):
+        # The whole text as one "word" spanning the image
+        text = self._recognize(image, psm).strip()
+        w, h = to_pil(image).size
+        return [(text, (0, 0, w, h), 0)] if text else []
+
+# ---------------------------
+# Engine Selection
+# ---------------------------
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def _after_fork():
+    # Tesseract handles and the engine's semaphores belong to the parent; build fresh ones on first use
+    global _engine, _engine_lock
+    _engine, _engine_lock = None, threading.Lock()
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+def create_engine(backend=OCR_BACKEND, **kwargs):
+    if backend == "stub":
+        return StubEngine(**kwargs)
+    if backend == "pytesseract":
+        return PytesseractEngine(**kwargs)
+    if backend == "tesserocr":
+        return TesserocrPoolEngine(**kwargs)
+
+    # auto: prefer the in-process pool, fall back to subprocess calls
+    try:
+        return TesserocrPoolEngine(**kwargs)
+    except (ImportError, RuntimeError):
+        return PytesseractEngine(**kwargs)
+
+
+def get_engine():
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = create_engine()
+    return _engine
+
+
+def set_engine(engine):
+    """Swap the process-wide engine (e.g. a StubEngine in tests)."""
+    global _engine
+    with _engine_lock:
+        old, _engine = _engine, engine
+    if old is not None and old is not engine:
+        old.close()
+    return engine
+
+
+@timed("ocr")
+def image_to_string(image, psm=None):
+    return get_engine().image_to_string(image, psm=psm)
+
+
+@timed("ocr")
+def image_to_words(image, psm=None):
+    return get_engine().image_to_words(image, psm=psm)
@@ -0,0 +1,343 @@
+import bisect
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+import ocr
+from metrics import timed
+
+# ---------------------------
+# Config (environment)
+# ---------------------------
+# OCR_ROI=0 sends the whole image to tesseract as before
+OCR_ROI = os.environ.get("OCR_ROI", "1") != "0"
+DETECT_MAX_SIDE = int(os.environ.get("OCR_DETECT_MAX_SIDE", 1600))   # region search runs at most this big
+TARGET_TEXT_HEIGHT = int(os.environ.get("OCR_TEXT_HEIGHT", 32))      # px per text line handed to tesseract
+FALLBACK_MAX_SIDE = int(os.environ.get("OCR_FALLBACK_MAX_SIDE", 1600))
+# OCR_TILE: auto - tile the regions into one page per PSM (a few tesseract calls, not one per
+# region) unless the engine is pooled in-process; 1/0 forces tiling on/off
+OCR_TILE = os.environ.get("OCR_TILE", "auto")
+
+MAX_REGIONS = 16
+TILE_GAP = 24             # white rows between stacked regions
+MIN_REGION_SIDE = 8       # at detection scale
+ROI_PADDING = 4           # source px around each region
+ROI_BORDER = 10           # white margin tesseract expects around text
+
+# Tesseract page segmentation modes
+PSM_BLOCK = 6
+PSM_LINE = 7
+PSM_WORD = 8
+
+# ---------------------------
+# Preprocessing
+# ---------------------------
+def to_gray(image):
+    """Gray uint8 array from a gray/RGB array or a PIL image."""
+    arr = np.asarray(image)
+    if arr.ndim == 3:
+        # Channel order does not matter much for finding text; RGB weights are close enough for BGR
+        return cv2.cvtColor(arr[..., :3], cv2.COLOR_RGB2GRAY)
+    return arr
+
+
+def downscale(gray, max_side):
+    """(image, scale) with the longest side at most max_side."""
+    h, w = gray.shape[:2]
+    scale = min(1.0, max_side / max(h, w))
+    if scale == 1.0:
+        return gray, 1.0
+    size = (max(1, round(w * scale)), max(1, round(h * scale)))
+    return cv2.resize(gray, size, interpolation=cv2.INTER_AREA), scale
+
+
+def binarize(gray):
+    """Otsu threshold, flipped if needed so text ends up dark on white."""
+    _, bw = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+    if cv2.countNonZero(bw) < bw.size / 2:
+        bw = cv2.bitwise_not(bw)
+    return bw
+
+# ---------------------------
+# Text Region Detection
+# ---------------------------
+def _merge_lines(boxes):
+    """Join boxes that sit on the same line and nearly touch (letters -> words -> lines)."""
+    merged = sorted(boxes, key=lambda b: (b[1] + b[3] / 2, b[0]))
+    changed = True
+    while changed:
+        changed = False
+        out = []
+        for x, y, w, h in merged:
+            for i, (mx, my, mw, mh) in enumerate(out):
+                overlap = min(y + h, my + mh) - max(y, my)
+                gap = max(x, mx) - min(x + w, mx + mw)
+                if overlap > 0.5 * min(h, mh) and gap < max(h, mh):
+                    nx, ny = min(x, mx), min(y, my)
+                    out[i] = (nx, ny, max(x + w, mx + mw) - nx, max(y + h, my + mh) - ny)
+                    changed = True
+                    break
+            else:
+                out.append((x, y, w, h))
+        merged = out
+    return merged
+
+
+@timed("text_regions")
+def find_text_regions(gray, max_side=DETECT_MAX_SIDE, max_regions=MAX_REGIONS):
+    """
+    Candidate text lines as (x, y, w, h) boxes in gray's coordinates,
+    in reading order. Morphological gradient + Otsu picks out strokes,
+    a short closing and a same-line merge join letters into lines, and
+    size/fill filters drop most non-text blobs.
+    """
+    small, scale = downscale(gray, max_side)
+    sh, sw = small.shape[:2]
+
+    grad = cv2.morphologyEx(small, cv2.MORPH_GRADIENT, cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3)))
+    _, strokes = cv2.threshold(grad, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+    joined = cv2.morphologyEx(strokes, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_RECT, (9, 1)))
+    contours, _ = cv2.findContours(joined, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    glyphs = []
+    for contour in contours:
+        x, y, w, h = cv2.boundingRect(contour)
+        if h < MIN_REGION_SIDE or h > 0.5 * sh or w > 4 * sw // 5 and h > sh // 5:
+            continue
+        # Edges of strokes cover a good share of a glyph box; photos and flat shapes do not
+        fill = cv2.countNonZero(strokes[y:y + h, x:x + w]) / float(w * h)
+        if 0.1 <= fill <= 0.9:
+            glyphs.append((x, y, w, h))
+
+    boxes = [b for b in _merge_lines(glyphs) if b[2] >= MIN_REGION_SIDE and b[2] >= 0.8 * b[3]]
+    # Keep the widest lines when a busy photo produces too many candidates
+    boxes = sorted(boxes, key=lambda b: b[2], reverse=True)[:max_regions]
+    boxes.sort(key=lambda b: (b[1], b[0]))
+
+    inv = 1.0 / scale
+    return [
+        (int(x * inv), int(y * inv), max(1, int(round(w * inv))), max(1, int(round(h * inv))))
+        for x, y, w, h in boxes
+    ]
+
+
+def count_lines(bw):
+    """Text lines in a binarized (dark on white) crop, from its row ink profile."""
+    inked = np.count_nonzero(bw < 128, axis=1) > 0
+    starts = np.count_nonzero(inked[1:] & ~inked[:-1]) + int(inked[0]) if inked.size else 0
+    return max(1, starts)
+
+
+def choose_psm(box, lines):
+    """Block for multi-line regions, word for short ones, single line otherwise."""
+    _, _, w, h = box
+    if lines > 1:
+        return PSM_BLOCK
+    if w < 2.5 * h:
+        return PSM_WORD
+    return PSM_LINE
+
+
+def prepare_roi(gray, box, target_height=TARGET_TEXT_HEIGHT):
+    """
+    Crop a region from the full-resolution image, binarize it and scale it
+    so each text line is about target_height px. Returns (roi, psm).
+    """
+    H, W = gray.shape[:2]
+    x, y, w, h = box
+    x0, y0 = max(0, x - ROI_PADDING), max(0, y - ROI_PADDING)
+    x1, y1 = min(W, x + w + ROI_PADDING), min(H, y + h + ROI_PADDING)
+    crop = gray[y0:y1, x0:x1]
+
+    lines = count_lines(binarize(crop))
+    scale = min(4.0, max(0.25, target_height * lines / max(1, h)))
+    if abs(scale - 1.0) > 0.1:
+        crop = cv2.resize(crop, None, fx=scale, fy=scale,
+                          interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_CUBIC)
+
+    roi = cv2.copyMakeBorder(binarize(crop), ROI_BORDER, ROI_BORDER, ROI_BORDER, ROI_BORDER,
+                             cv2.BORDER_CONSTANT, value=255)
+    return roi, choose_psm(box, lines)
+
+# ---------------------------
+# Region OCR
+# ---------------------------
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=ocr.get_engine().workers,
+                                           thread_name_prefix="ocr-roi")
+    return _pool
+
+
+def _after_fork():
+    # A forked child inherits the executor but not its threads
+    global _pool, _pool_lock
+    _pool, _pool_lock = None, threading.Lock()
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+def _has_text(text):
+    return any(ch.isalnum() for ch in text)
+
+
+def use_tiling():
+    if OCR_TILE == "auto":
+        return not ocr.get_engine().pooled
+    return OCR_TILE == "1"
+
+
+def read_each(jobs):
+    """One OCR call per region, in parallel; cheap with pooled in-process handles."""
+    # Each task gets its own copy of the request context so "ocr" timings keep their labels
+    pool = _get_pool()
+    futures = [
+        pool.submit(contextvars.copy_context().run, ocr.image_to_string, roi, psm)
+        for roi, psm in jobs
+    ]
+    return [f.result().strip() for f in futures]
+
+
+def tile_rois(rois, gap=TILE_GAP, across=False):
+    """
+    Lay binarized regions out on one white page: stacked top to bottom, or
+    side by side in a single row (vertically centered) when `across`.
+    Returns (page, ranges), each range being the region's span along the
+    layout axis.
+    """
+    if across:
+        height = max(roi.shape[0] for roi in rois)
+        width = sum(roi.shape[1] for roi in rois) + gap * (len(rois) - 1)
+    else:
+        width = max(roi.shape[1] for roi in rois)
+        height = sum(roi.shape[0] for roi in rois) + gap * (len(rois) - 1)
+    page = np.full((height, width), 255, dtype=np.uint8)
+    ranges = []
+    pos = 0
+    for roi in rois:
+        h, w = roi.shape[:2]
+        if across:
+            top = (height - h) // 2
+            page[top:top + h, pos:pos + w] = roi
+            ranges.append((pos, pos + w))
+            pos += w + gap
+        else:
+            page[pos:pos + h, :w] = roi
+            ranges.append((pos, pos + h))
+            pos += h + gap
+    return page, ranges
+
+
+def tile_groups(jobs):
+    """
+    {psm: [job indices]} for read_tiled. Regions keep their own PSM, except
+    that several single-word regions are read together as one line: a row
+    of separate words is a line, and word mode only holds for a lone word.
+    """
+    groups = {}
+    for i, (_, psm) in enumerate(jobs):
+        groups.setdefault(psm, []).append(i)
+    if len(groups.get(PSM_WORD, ())) > 1:
+        groups.setdefault(PSM_LINE, []).extend(groups.pop(PSM_WORD))
+        groups[PSM_LINE].sort()
+    return groups
+
+
+def read_tiled(jobs):
+    """
+    Regions read in one OCR call per page segmentation mode. The regions
+    (already scaled to the same text height) of each group are tiled into
+    one page that still fits the mode - multi-line blocks stacked, single
+    lines and words side by side in one row - and each word goes back to
+    the region its center falls in. With the per-call subprocess engine
+    this is at most three tesseract launches instead of one per region.
+    """
+    texts = [""] * len(jobs)
+    for psm, indices in sorted(tile_groups(jobs).items()):
+        across = psm != PSM_BLOCK
+        page, ranges = tile_rois([jobs[i][0] for i in indices], across=across)
+        words = ocr.image_to_words(page, psm)
+
+        starts = [start for start, _ in ranges]
+        lines = [[] for _ in indices]   # per region: [(line_key, [words])]
+        for text, (x, y, w, h), line in words:
+            center = x + w / 2 if across else y + h / 2
+            k = bisect.bisect_right(starts, center) - 1
+            if k < 0 or center >= ranges[k][1]:
+                continue   # between regions
+            if not lines[k] or lines[k][-1][0] != line:
+                lines[k].append((line, []))
+            lines[k][-1][1].append(text)
+        for i, region in zip(indices, lines):
+            texts[i] = "\n".join(" ".join(ws) for _, ws in region).strip()
+    return texts
+
+
+def read_text(image):
+    """
+    OCR through the region pipeline. Returns (text, boxes): the text of
+    every region that produced something, top to bottom, and those
+    regions as (x, y, w, h) in the image's coordinates. When no region
+    is found the whole (downsized, binarized) image is read instead.
+    Regions are read in tiled calls unless the engine is pooled (see OCR_TILE).
+    """
+    gray = to_gray(image)
+    if not OCR_ROI:
+        return ocr.image_to_string(image).strip(), []
+
+    boxes = find_text_regions(gray)
+    if not boxes:
+        small, _ = downscale(gray, FALLBACK_MAX_SIDE)
+        return ocr.image_to_string(binarize(small)).strip(), []
+
+    with timed("ocr_prepare"):
+        jobs = [prepare_roi(gray, box) for box in boxes]
+
+    texts = read_tiled(jobs) if use_tiling() else read_each(jobs)
+
+    found = [(box, text) for box, text in zip(boxes, texts) if _has_text(text)]
+    return "\n".join(text for _, text in found), [box for box, _ in found]
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Time region OCR: one call per region vs. tiled calls.")
+    parser.add_argument("images", nargs="+")
+    args = parser.parse_args()
+
+    engine = ocr.get_engine()
+    print(f"engine: {engine.name} (pooled={engine.pooled})")
+    print(f"{'image':40s} {'regions':>7s} {'each ms':>9s} {'tiled ms':>9s}")
+    totals = [0.0, 0.0]
+    for path in args.images:
+        gray = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+        if gray is None:
+            continue
+        jobs = [prepare_roi(gray, box) for box in find_text_regions(gray)]
+        if not jobs:
+            print(f"{os.path.basename(path)[:40]:40s} {0:7d}")
+            continue
+        start = time.perf_counter()
+        read_each(jobs)
+        each = time.perf_counter() - start
+        start = time.perf_counter()
+        read_tiled(jobs)
+        tiled = time.perf_counter() - start
+        totals[0] += each
+        totals[1] += tiled
+        print(f"{os.path.basename(path)[:40]:40s} {len(jobs):7d} {each * 1000:9.1f} {tiled * 1000:9.1f}")
+    print(f"{'total':40s} {'':7s} {totals[0] * 1000:9.1f} {totals[1] * 1000:9.1f}")
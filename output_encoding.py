@@ -0,0 +1,300 @@
+import base64
+import io
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from metrics import observe
+
+try:
+    import pillow_avif  # noqa: F401  (optional) registers an AVIF encoder with Pillow
+except ImportError:
+    pass
+
+# ---------------------------
+# Config (environment)
+# ---------------------------
+# auto - negotiate per request from the Accept header and the feature; or force one of FORMATS
+OUTPUT_FORMAT = os.environ.get("OUTPUT_FORMAT", "auto").lower()
+
+# Lossless formats tried, in order, for cutouts and PNG sources; PNG is the fallback
+LOSSLESS_FORMATS = tuple(f.strip() for f in os.environ.get("LOSSLESS_FORMATS", "webp,avif").split(",") if f.strip())
+
+JPEG_QUALITY = int(os.environ.get("JPEG_QUALITY", 85))
+WEBP_QUALITY = int(os.environ.get("WEBP_QUALITY", 82))
+PNG_COMPRESSION = int(os.environ.get("PNG_COMPRESSION", 1))        # zlib level; 1 is ~2x faster than the default 6
+LOSSLESS_EFFORT = int(os.environ.get("LOSSLESS_EFFORT", 0))        # WebP method 0-6; 0 is the fast path
+AVIF_SPEED = int(os.environ.get("AVIF_SPEED", 8))                  # 0 slowest .. 10 fastest
+
+PREVIEW_MAX_SIDE = int(os.environ.get("PREVIEW_MAX_SIDE", 640))
+PREVIEW_QUALITY = int(os.environ.get("PREVIEW_QUALITY", 70))
+
+Image.init()
+AVIF_SUPPORTED = "AVIF" in Image.SAVE
+
+FORMATS = {
+    # name: (extension, mimetype)
+    "jpeg": (".jpg", "image/jpeg"),
+    "png": (".png", "image/png"),
+    "webp": (".webp", "image/webp"),
+    "avif": (".avif", "image/avif"),
+}
+
+# Features whose output gets negotiated; cutouts carry alpha
+FORMAT_FEATURES = {"remove_bg", "resize", "rotate"}
+ALPHA_FEATURES = {"remove_bg"}
+PHOTO_EXTENSIONS = {".jpg", ".jpeg"}
+
+# Encoder settings per feature and format. Cutouts stay lossless (edges and
+# alpha matter); resized/rotated photos are lossy; previews are small and lossy.
+SETTINGS = {
+    "remove_bg": {
+        "webp": {"lossless": True, "quality": 25, "method": LOSSLESS_EFFORT},
+        "avif": {"lossless": True, "speed": AVIF_SPEED},
+        "png": {"compression": PNG_COMPRESSION},
+        "jpeg": {"quality": JPEG_QUALITY, "optimize": True},
+    },
+    "photo": {
+        "jpeg": {"quality": JPEG_QUALITY, "optimize": True},
+        "webp": {"quality": WEBP_QUALITY, "method": 2},
+        "avif": {"quality": WEBP_QUALITY, "speed": AVIF_SPEED},
+        "png": {"compression": PNG_COMPRESSION},
+    },
+    "graphic": {
+        "webp": {"lossless": True, "quality": 25, "method": LOSSLESS_EFFORT},
+        "avif": {"lossless": True, "speed": AVIF_SPEED},
+        "png": {"compression": PNG_COMPRESSION},
+        "jpeg": {"quality": JPEG_QUALITY, "optimize": True},
+    },
+    "preview": {
+        "webp": {"quality": PREVIEW_QUALITY, "alpha_quality": PREVIEW_QUALITY, "method": 2},
+    },
+}
+
+# ---------------------------
+# Negotiation
+# ---------------------------
+def accepted_types(accept):
+    """
+    Mimetypes the client lists explicitly with q > 0. `accept` is a raw
+    header string or werkzeug's request.accept_mimetypes. Wildcards do not
+    count: "*/*" says nothing about whether a browser can decode WebP.
+    """
+    if not accept:
+        return set()
+    if isinstance(accept, str):
+        types = set()
+        for part in accept.split(","):
+            value, _, params = part.strip().partition(";")
+            q = params.strip()
+            if q.startswith("q=") and q[2:] in ("0", "0.0", "0.00", "0.000"):
+                continue
+            types.add(value.strip().lower())
+        return types
+    return {value.lower() for value, quality in accept if quality > 0}
+
+
+def supported(fmt):
+    return fmt in FORMATS and (fmt != "avif" or AVIF_SUPPORTED)
+
+
+def profile_for(feature, filename):
+    """Settings profile: cutouts, photos (JPEG sources) or graphics (everything else)."""
+    if feature in ALPHA_FEATURES:
+        return feature
+    return "photo" if os.path.splitext(filename)[1].lower() in PHOTO_EXTENSIONS else "graphic"
+
+
+def choose_format(feature, filename, accept=None, requested=None):
+    """
+    Output format for one request, or None when the feature's output is not
+    re-encoded (color_font). For multi-size resize it is the format of the
+    sizes that do not name their own. An explicit `requested`
+    format wins, then OUTPUT_FORMAT; otherwise cutouts and PNG sources get
+    the first lossless format in LOSSLESS_FORMATS the client accepts (else
+    PNG) and JPEG sources get a tuned JPEG. Raises ValueError for unknown
+    or unavailable formats.
+    """
+    if feature not in FORMAT_FEATURES:
+        return None
+
+    fixed = (requested or "").strip().lower()
+    if fixed in ("", "auto"):
+        fixed = OUTPUT_FORMAT
+    if fixed == "jpg":
+        fixed = "jpeg"
+    if fixed != "auto":
+        if not supported(fixed):
+            raise ValueError(f"Unsupported output format: {fixed}")
+        return fixed
+
+    if profile_for(feature, filename) == "photo":
+        return "jpeg"
+    types = accepted_types(accept)
+    for fmt in LOSSLESS_FORMATS:
+        if supported(fmt) and FORMATS[fmt][1] in types:
+            return fmt
+    return "png"
+
+
+def output_name(filename, fmt):
+    return os.path.splitext(filename)[0] + FORMATS[fmt][0]
+
+# ---------------------------
+# Encoders
+# ---------------------------
+def _to_array(image):
+    """BGR / BGRA / gray uint8 array from a PIL image or an array already in cv2 order."""
+    if not isinstance(image, Image.Image):
+        return image
+    if image.mode not in ("RGB", "RGBA", "L"):
+        image = image.convert("RGBA" if "A" in image.getbands() or "transparency" in image.info else "RGB")
+    arr = np.asarray(image)
+    if image.mode == "RGBA":
+        return cv2.cvtColor(arr, cv2.COLOR_RGBA2BGRA)
+    if image.mode == "RGB":
+        return cv2.cvtColor(arr, cv2.COLOR_RGB2BGR)
+    return arr
+
+
+def _to_pil(arr):
+    if arr.ndim == 2:
+        return Image.fromarray(arr)
+    if arr.shape[2] == 4:
+        return Image.fromarray(cv2.cvtColor(arr, cv2.COLOR_BGRA2RGBA))
+    return Image.fromarray(cv2.cvtColor(arr, cv2.COLOR_BGR2RGB))
+
+
+def _flatten(arr):
+    """JPEG has no alpha: composite BGRA onto white."""
+    if arr.ndim == 3 and arr.shape[2] == 4:
+        alpha = arr[..., 3:].astype(np.uint16)
+        return ((arr[..., :3] * alpha + 255 * (255 - alpha) + 127) // 255).astype(np.uint8)
+    return arr
+
+
+def _encode(arr, fmt, opts):
+    # JPEG and PNG go through cv2 (libjpeg-turbo, no PIL round trip);
+    # WebP and AVIF through Pillow, which exposes the effort settings
+    if fmt == "jpeg":
+        params = [cv2.IMWRITE_JPEG_QUALITY, opts.get("quality", JPEG_QUALITY),
+                  cv2.IMWRITE_JPEG_OPTIMIZE, int(opts.get("optimize", False))]
+        ok, buf = cv2.imencode(".jpg", _flatten(arr), params)
+    elif fmt == "png":
+        ok, buf = cv2.imencode(".png", arr, [cv2.IMWRITE_PNG_COMPRESSION, opts.get("compression", PNG_COMPRESSION)])
+    else:
+        buf = io.BytesIO()
+        _to_pil(arr).save(buf, format=fmt.upper(), **opts)
+        return buf.getvalue()
+    if not ok:
+        raise ValueError(f"Could not encode {fmt}")
+    return buf.tobytes()
+
+
+_stats = {}   # format -> counters
+_stats_lock = threading.Lock()
+
+
+def encode_image(image, fmt, profile="photo"):
+    """
+    Encode a PIL image or a BGR(A) array as `fmt` with the profile's
+    settings. Time goes to the "encode_<fmt>" stage; sizes and times are
+    also totalled per format for encoder_stats().
+    """
+    arr = _to_array(image)
+    opts = SETTINGS.get(profile, SETTINGS["photo"]).get(fmt, {})
+
+    start = time.perf_counter()
+    data = _encode(arr, fmt, opts)
+    seconds = time.perf_counter() - start
+
+    observe(f"encode_{fmt}", seconds)
+    with _stats_lock:
+        s = _stats.setdefault(fmt, {"images": 0, "pixels": 0, "bytes": 0, "seconds": 0.0})
+        s["images"] += 1
+        s["pixels"] += arr.shape[0] * arr.shape[1]
+        s["bytes"] += len(data)
+        s["seconds"] += seconds
+    return data
+
+
+def encoder_stats():
+    """Per-format totals plus bytes per pixel and megapixels per second."""
+    with _stats_lock:
+        stats = {fmt: dict(s) for fmt, s in _stats.items()}
+    for s in stats.values():
+        s["bytes_per_pixel"] = round(s["bytes"] / s["pixels"], 4) if s["pixels"] else None
+        s["megapixels_per_second"] = round(s["pixels"] / s["seconds"] / 1e6, 2) if s["seconds"] else None
+    return {"formats": stats, "default": OUTPUT_FORMAT, "avif": AVIF_SUPPORTED}
+
+# ---------------------------
+# Preview
+# ---------------------------
+def make_preview(image, max_side=PREVIEW_MAX_SIDE):
+    """
+    Data URI of a downscaled lossy WebP (alpha kept, also lossy) for
+    result.html, or None when the image already fits in max_side (the
+    full output is shown as is).
+    """
+    arr = _to_array(image)
+    h, w = arr.shape[:2]
+    if max(h, w) <= max_side:
+        return None
+    scale = max_side / max(h, w)
+    small = cv2.resize(arr, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA)
+
+    data = encode_image(small, "webp", "preview")
+    return "data:image/webp;base64," + base64.b64encode(data).decode("ascii")
+
+# ---------------------------
+# Benchmark
+# ---------------------------
+def benchmark(image, profile="photo", formats=None, repeat=3):
+    """
+    Encode `image` in every format the profile defines (best of `repeat`).
+    Returns {format: {"kb", "ms", "ratio"}}, ratio being size vs. the PNG
+    at zlib's default level 6 - what outputs used before negotiation.
+    """
+    arr = _to_array(image)
+    baseline = len(_encode(arr, "png", {"compression": 6}))
+    results = {}
+    for fmt in formats or SETTINGS.get(profile, SETTINGS["photo"]):
+        if not supported(fmt):
+            continue
+        opts = SETTINGS.get(profile, SETTINGS["photo"]).get(fmt, {})
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            data = _encode(arr, fmt, opts)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        results[fmt] = {
+            "kb": round(len(data) / 1024, 1),
+            "ms": round(best * 1000, 1),
+            "ratio": round(len(data) / baseline, 3),
+        }
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Size and encode time of each output format.")
+    parser.add_argument("images", nargs="+")
+    parser.add_argument("--profile", choices=sorted(SETTINGS), help="default: from the file (remove_bg for RGBA)")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    for path in args.images:
+        img = Image.open(path)
+        img.load()
+        alpha = "A" in img.getbands()
+        profile = args.profile or ("remove_bg" if alpha else profile_for(None, path))
+        print(f"\n{path}  {img.size[0]}x{img.size[1]}  profile={profile}")
+        print(f"  {'format':8s} {'KB':>9s} {'ms':>8s} {'vs png6':>8s}")
+        for fmt, r in benchmark(img, profile, repeat=args.repeat).items():
+            print(f"  {fmt:8s} {r['kb']:9.1f} {r['ms']:8.1f} {r['ratio']:8.3f}")
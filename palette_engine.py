@@ -0,0 +1,240 @@
+import time
+from itertools import permutations
+
+import cv2
+import numpy as np
+
+# ---------------------------
+# Defaults
+# ---------------------------
+DEFAULT_MAX_PIXELS = 20000   # pixel budget handed to k-means
+DEFAULT_SEED = 42
+DEFAULT_MAX_ITER = 20
+DEFAULT_TOL = 0.5            # stop when no center moves more than this (0-255 units)
+
+# ---------------------------
+# Sampling
+# ---------------------------
+def sample_pixels(image, max_pixels=DEFAULT_MAX_PIXELS, seed=DEFAULT_SEED):
+    """
+    Jittered grid sample: one pixel per stride x stride cell, so every
+    region of the image is represented and the count stays near max_pixels.
+    """
+    h, w = image.shape[:2]
+    channels = image.shape[2] if image.ndim == 3 else 1
+
+    if max_pixels is None or h * w <= max_pixels:
+        return image.reshape((-1, channels))
+
+    stride = int(np.ceil(np.sqrt(h * w / max_pixels)))
+    rng = np.random.default_rng(seed)
+
+    ys = np.arange(0, h, stride)
+    xs = np.arange(0, w, stride)
+    ys = np.minimum(ys + rng.integers(0, stride, size=len(ys)), h - 1)
+    xs = np.minimum(xs + rng.integers(0, stride, size=len(xs)), w - 1)
+
+    return image[ys[:, None], xs[None, :]].reshape((-1, channels))
+
+
+def quantize_histogram(pixels, bits=5):
+    """
+    Pre-bin pixels into a (2**bits)^3 color histogram.
+    Returns the mean color of every occupied bin and its pixel count.
+    """
+    pixels = np.asarray(pixels, dtype=np.float32)
+    shift = 8 - bits
+    q = pixels.astype(np.uint8) >> shift
+    codes = (q[:, 0].astype(np.int32) << (2 * bits)) | (q[:, 1].astype(np.int32) << bits) | q[:, 2]
+
+    _, inverse, counts = np.unique(codes, return_inverse=True, return_counts=True)
+    means = np.stack(
+        [np.bincount(inverse, weights=pixels[:, c]) for c in range(3)], axis=1
+    ) / counts[:, None]
+
+    return means.astype(np.float32), counts.astype(np.float32)
+
+# ---------------------------
+# K-Means
+# ---------------------------
+def kmeans_pp_init(points, weights, k, rng):
+    """Weighted k-means++ seeding."""
+    n = len(points)
+    centers = np.empty((k, points.shape[1]), dtype=np.float32)
+    centers[0] = points[rng.choice(n, p=weights / weights.sum())]
+
+    closest = np.sum((points - centers[0]) ** 2, axis=1)
+    for i in range(1, k):
+        prob = closest * weights
+        total = prob.sum()
+        idx = rng.choice(n, p=prob / total) if total > 0 else rng.integers(n)
+        centers[i] = points[idx]
+        closest = np.minimum(closest, np.sum((points - centers[i]) ** 2, axis=1))
+
+    return centers
+
+
+def _assign(points, centers):
+    dists = (
+        np.sum(points ** 2, axis=1)[:, None]
+        - 2 * points @ centers.T
+        + np.sum(centers ** 2, axis=1)[None, :]
+    )
+    return np.argmin(dists, axis=1)
+
+
+def weighted_kmeans(points, weights=None, k=5, seed=DEFAULT_SEED,
+                    max_iter=DEFAULT_MAX_ITER, tol=DEFAULT_TOL, batch_size=None):
+    """
+    Deterministic weighted k-means with k-means++ seeding.
+    With batch_size set, runs mini-batch updates instead of full Lloyd steps.
+    Returns (centers, weight per center).
+    """
+    points = np.asarray(points, dtype=np.float32)
+    if weights is None:
+        weights = np.ones(len(points), dtype=np.float32)
+    weights = np.asarray(weights, dtype=np.float32)
+
+    rng = np.random.default_rng(seed)
+    centers = kmeans_pp_init(points, weights, k, rng)
+
+    if batch_size:
+        seen = np.zeros(k, dtype=np.float64)
+        for _ in range(max_iter):
+            batch = rng.choice(len(points), size=min(batch_size, len(points)), replace=False)
+            labels = _assign(points[batch], centers)
+            for j in range(k):
+                mask = labels == j
+                if not mask.any():
+                    continue
+                w = weights[batch][mask]
+                seen[j] += w.sum()
+                lr = w.sum() / seen[j]
+                target = np.average(points[batch][mask], axis=0, weights=w)
+                centers[j] = (1 - lr) * centers[j] + lr * target
+    else:
+        for _ in range(max_iter):
+            labels = _assign(points, centers)
+            totals = np.bincount(labels, weights=weights, minlength=k)
+            new_centers = centers.copy()
+            for c in range(points.shape[1]):
+                sums = np.bincount(labels, weights=weights * points[:, c], minlength=k)
+                np.divide(sums, totals, out=new_centers[:, c], where=totals > 0)
+            shift = np.max(np.abs(new_centers - centers))
+            centers = new_centers
+            if shift <= tol:
+                break
+
+    labels = _assign(points, centers)
+    totals = np.bincount(labels, weights=weights, minlength=k)
+    return centers, totals
+
+# ---------------------------
+# Palette Extraction
+# ---------------------------
+def extract_palette(image, k=5, max_pixels=DEFAULT_MAX_PIXELS, seed=DEFAULT_SEED,
+                    prebin_bits=None, batch_size=None):
+    """
+    Bounded-time palette: sample at most max_pixels pixels, optionally
+    pre-bin them into a color histogram, then run seeded k-means.
+    Returns a list of (BGR center, share) sorted by share.
+    """
+    pixels = sample_pixels(image, max_pixels, seed).astype(np.float32)
+
+    if prebin_bits:
+        points, weights = quantize_histogram(pixels, prebin_bits)
+    else:
+        points, weights = pixels, None
+
+    centers, totals = weighted_kmeans(points, weights, k=k, seed=seed, batch_size=batch_size)
+    shares = totals / max(totals.sum(), 1)
+
+    order = np.argsort(totals, kind="stable")[::-1]
+    return [(centers[i], float(shares[i])) for i in order]
+
+
+def exhaustive_palette(image, k=5):
+    """The original full-resolution cv2.kmeans palette, kept as the drift reference."""
+    data = np.float32(image.reshape((-1, 3)))
+
+    criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 10, 1.0)
+    _, labels, centers = cv2.kmeans(
+        data, k, None, criteria, 10, cv2.KMEANS_RANDOM_CENTERS
+    )
+
+    counts = np.bincount(labels.flatten(), minlength=k)
+    shares = counts / max(counts.sum(), 1)
+    order = np.argsort(counts)[::-1]
+    return [(centers[i], float(shares[i])) for i in order]
+
+
+def bgr_to_hex(c):
+    return "#{:02x}{:02x}{:02x}".format(int(c[2]), int(c[1]), int(c[0]))
+
+# ---------------------------
+# Drift Report
+# ---------------------------
+def _match_centers(a, b):
+    """Pair up two center lists so the summed distance is minimal."""
+    dist = np.linalg.norm(a[:, None, :] - b[None, :, :], axis=2)
+    k = len(a)
+
+    if k <= 6:
+        best = min(permutations(range(k)), key=lambda p: dist[np.arange(k), p].sum())
+        return dist[np.arange(k), list(best)], list(best)
+
+    # Greedy pairing for larger palettes
+    pairs = [0] * k
+    used = set()
+    for i in np.argsort(dist.min(axis=1)):
+        j = next(j for j in np.argsort(dist[i]) if j not in used)
+        used.add(j)
+        pairs[i] = j
+    return dist[np.arange(k), pairs], pairs
+
+
+def palette_drift(image, k=5, **kwargs):
+    """
+    Compare the bounded palette against the exhaustive one.
+    Distances are Euclidean in 0-255 RGB units.
+    """
+    start = time.perf_counter()
+    fast = extract_palette(image, k=k, **kwargs)
+    fast_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    full = exhaustive_palette(image, k=k)
+    full_time = time.perf_counter() - start
+
+    fast_centers = np.array([c for c, _ in fast], dtype=np.float32)
+    full_centers = np.array([c for c, _ in full], dtype=np.float32)
+    distances, pairs = _match_centers(fast_centers, full_centers)
+
+    share_diff = [abs(fast[i][1] - full[j][1]) for i, j in enumerate(pairs)]
+
+    return {
+        "fast_palette": [bgr_to_hex(c) for c, _ in fast],
+        "exhaustive_palette": [bgr_to_hex(c) for c, _ in full],
+        "mean_color_distance": float(distances.mean()),
+        "max_color_distance": float(distances.max()),
+        "max_share_difference": float(max(share_diff)),
+        "fast_seconds": fast_time,
+        "exhaustive_seconds": full_time,
+    }
+
+# ---------------------------
+# Main
+# ---------------------------
+if __name__ == "__main__":
+    import sys
+
+    path = sys.argv[1] if len(sys.argv) > 1 else input("Enter image path: ").strip()
+    img = cv2.imread(path)
+    if img is None:
+        raise SystemExit(f"Could not load image: {path}")
+
+    for budget in (5000, DEFAULT_MAX_PIXELS, 100000):
+        report = palette_drift(img, k=5, max_pixels=budget)
+        print(f"\n===== max_pixels={budget} =====")
+        for key, value in report.items():
+            print(f"{key}: {value}")
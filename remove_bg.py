@@ -1,6 +1,43 @@
+import argparse
+import contextvars
+import glob
+import io
 import os
-from rembg import remove
-from PIL import Image
+import queue
+import threading
+import time
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from lazy import lazy_import, registry
+from metrics import observe, timed
+from output_encoding import encode_image
+
+# rembg pulls in onnxruntime, scipy and pymatting; import it on first use
+rembg = lazy_import("rembg")
+
+# ------------------------------------------------------------
+# SESSION CONFIG (environment)
+# ------------------------------------------------------------
+REMBG_MODEL = os.environ.get("REMBG_MODEL", "u2net")   # "stub" runs offline without a model
+REMBG_INTRA_THREADS = int(os.environ.get("REMBG_INTRA_THREADS", 0))  # 0 = onnxruntime default
+REMBG_INTER_THREADS = int(os.environ.get("REMBG_INTER_THREADS", 0))
+# REMBG_SHARED=1: a session built before fork (gunicorn preload) is kept by every
+# worker, so the model weights are shared copy-on-write. ONNX Runtime thread pools
+# do not survive fork, so a shared session runs single-threaded; request threads
+# provide the parallelism. Default: each worker builds its own session.
+REMBG_SHARED = os.environ.get("REMBG_SHARED") == "1"
+
+_session = None
+_session_lock = threading.Lock()
+_stats = {
+    "model": None,
+    "session_load_seconds": None,   # model download/read + ONNX session setup
+    "first_call_seconds": None,     # first inference on a fresh session (cold)
+    "warm_calls": 0,
+    "warm_total_seconds": 0.0,
+}
 
 # ------------------------------------------------------------
 # SAFE IMAGE LOADER
@@ -9,24 +46,142 @@ def load_image_safe(path):
     if not os.path.exists(path):
         raise FileNotFoundError(f"Image not found: {path}")
     try:
-        return Image.open(path)
+        # Phone photos store rotation in EXIF; apply it before cutting out
+        return ImageOps.exif_transpose(Image.open(path))
     except:
         raise ValueError("Unable to open the image. File may be corrupted.")
 
 
+# ------------------------------------------------------------
+# MANAGED REMBG SESSION
+# ------------------------------------------------------------
+class StubSession:
+    """
+    Offline stand-in for a rembg session (REMBG_MODEL=stub): pixels close
+    to the average border color become transparent. For tests and benchmarks.
+    """
+
+    def remove(self, img):
+        rgb = np.asarray(img.convert("RGB"), dtype=np.int16)
+        border = np.concatenate([rgb[0], rgb[-1], rgb[:, 0], rgb[:, -1]]).mean(axis=0)
+        alpha = (np.abs(rgb - border).sum(axis=2) > 60).astype(np.uint8) * 255
+        out = img.convert("RGBA")
+        out.putalpha(Image.fromarray(alpha))
+        return out
+
+
+@timed("rembg_session_load")
+def create_session(model_name=REMBG_MODEL, intra_threads=REMBG_INTRA_THREADS,
+                   inter_threads=REMBG_INTER_THREADS):
+    """
+    Build a rembg session with explicit ONNX Runtime thread settings.
+    rembg.new_session only reads OMP_NUM_THREADS, so the session class
+    is looked up and constructed directly.
+    """
+    if model_name == "stub":
+        return StubSession()
+
+    import onnxruntime as ort
+    from rembg.sessions import sessions_class
+
+    opts = ort.SessionOptions()
+    if intra_threads:
+        opts.intra_op_num_threads = intra_threads
+    if inter_threads:
+        opts.inter_op_num_threads = inter_threads
+
+    for session_class in sessions_class:
+        if session_class.name() == model_name:
+            return session_class(model_name, opts)
+
+    raise ValueError(f"Unknown rembg model: {model_name}")
+
+
+def get_session():
+    """Return the process-wide rembg session, creating it on first use."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                start = time.perf_counter()
+                _session = create_session(intra_threads=1, inter_threads=1) if REMBG_SHARED else create_session()
+                _stats["session_load_seconds"] = time.perf_counter() - start
+                _stats["model"] = REMBG_MODEL
+    return _session
+
+
+def _after_fork():
+    global _session, _session_lock
+    _session_lock = threading.Lock()
+    if not REMBG_SHARED:
+        _session = None
+        _stats.update(model=None, session_load_seconds=None, first_call_seconds=None,
+                      warm_calls=0, warm_total_seconds=0.0)
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+registry.register("rembg_session", get_session, per_process=not REMBG_SHARED)
+
+
+def preload_session(warmup=True):
+    """
+    Create the session ahead of the first request (e.g. at worker boot)
+    and optionally run one tiny inference so ONNX Runtime allocates its
+    buffers up front.
+    """
+    session = get_session()
+    if warmup and _stats["first_call_seconds"] is None:
+        _timed_remove(Image.new("RGB", (64, 64)), session)
+    return session_stats()
+
+
+def _timed_remove(img, session):
+    with timed("rembg"):
+        start = time.perf_counter()
+        if isinstance(session, StubSession):
+            output = session.remove(img)
+        else:
+            output = rembg.remove(img, session=session)
+        elapsed = time.perf_counter() - start
+
+    with _session_lock:
+        if _stats["first_call_seconds"] is None:
+            _stats["first_call_seconds"] = elapsed
+        else:
+            _stats["warm_calls"] += 1
+            _stats["warm_total_seconds"] += elapsed
+    return output
+
+
+def session_stats():
+    """Cold-start vs. warm latency of the managed session."""
+    with _session_lock:
+        stats = dict(_stats, shared=REMBG_SHARED)
+    calls = stats["warm_calls"]
+    stats["warm_mean_seconds"] = stats["warm_total_seconds"] / calls if calls else None
+    return stats
+
+
 # ------------------------------------------------------------
 # REMOVE BACKGROUND FUNCTION
 # ------------------------------------------------------------
-def remove_background(input_path, output_path=None):
+def remove_background_image(img):
+    """In-memory variant: PIL image in, RGBA cutout out, nothing touches disk."""
+    return _timed_remove(img, get_session())
+
+
+def remove_background(input_path, output_path=None, image=None):
     """
     Removes background using rembg and saves the output.
+    Pass an already decoded PIL image to skip reading input_path.
     """
 
     # Load the image safely
-    img = load_image_safe(input_path)
+    img = image if image is not None else load_image_safe(input_path)
 
-    # Remove background
-    output = remove(img)
+    # Remove background (shared, already-warm session)
+    output = remove_background_image(img)
 
     # Generate output path if not provided
     if output_path is None:
@@ -39,18 +194,210 @@ def remove_background(input_path, output_path=None):
     return output_path
 
 
+# ------------------------------------------------------------
+# BATCH REMOVAL (decode -> infer -> encode pipeline)
+# ------------------------------------------------------------
+IMAGE_PATTERNS = ("*.png", "*.jpg", "*.jpeg")
+_DONE = object()
+
+
+def default_infer_workers():
+    """
+    Parallel inference threads sharing the one ONNX session. With the
+    default intra-op setting each run already uses every core, so only
+    one runs at a time; with REMBG_INTRA_THREADS=1 there is one per core.
+    """
+    cores = os.cpu_count() or 1
+    return max(1, cores // (REMBG_INTRA_THREADS or cores))
+
+
+def expand_inputs(source):
+    """A directory, a glob pattern or a single file -> sorted list of image paths."""
+    if os.path.isdir(source):
+        paths = []
+        for pattern in IMAGE_PATTERNS:
+            paths.extend(glob.glob(os.path.join(source, pattern)))
+        return sorted(p for p in paths if not p.endswith("_noBG.png"))
+    return sorted(glob.glob(source))
+
+
+def _output_path_for(name, output_dir):
+    base = os.path.splitext(name)[0]
+    if output_dir is not None:
+        base = os.path.join(output_dir, os.path.basename(base))
+    return base + "_noBG.png"
+
+
+def _start_stage(func, inbox, outbox, workers):
+    """Run func over inbox items on `workers` threads, forwarding to outbox."""
+
+    def loop():
+        while True:
+            record = inbox.get()
+            if record is _DONE:
+                inbox.put(_DONE)  # let sibling threads see it too
+                return
+            if record["error"] is None:
+                try:
+                    func(record)
+                except Exception as e:
+                    record["error"] = str(e)
+            outbox.put(record)
+
+    # Each thread runs in a copy of the caller's context so stage timings
+    # keep the request's feature label
+    threads = [
+        threading.Thread(target=contextvars.copy_context().run, args=(loop,), daemon=True)
+        for _ in range(workers)
+    ]
+    for t in threads:
+        t.start()
+
+    def close():
+        for t in threads:
+            t.join()
+        outbox.put(_DONE)
+
+    threading.Thread(target=close, daemon=True).start()
+
+
+def remove_backgrounds(inputs, output_dir=None, decode_workers=2,
+                       infer_workers=None, encode_workers=2, max_in_flight=8, keep_bytes=False):
+    """
+    Remove backgrounds from many images through one shared session.
+
+    `inputs` are file paths or (filename, bytes) pairs. Decode, inference
+    and PNG encoding run as separate thread stages connected by bounded
+    queues, so the stages overlap and memory stays capped by
+    max_in_flight. The bundled rembg models take one image per run, so
+    inference scales by running the shared session on several threads
+    rather than stacking a batch tensor.
+
+    Yields one record per image, in completion order, with its output
+    path, per-stage timings and any error. With keep_bytes nothing is
+    written: each PNG is left in record["data"] and record["output"] is
+    just its file name, for callers that publish the outputs themselves.
+    """
+    session = get_session()
+    infer_workers = infer_workers or default_infer_workers()
+
+    to_decode = queue.Queue()
+    to_infer = queue.Queue(maxsize=max_in_flight)
+    to_encode = queue.Queue(maxsize=max_in_flight)
+    finished = queue.Queue()
+
+    def decode(record):
+        start = time.perf_counter()
+        source = record["source"]
+        try:
+            img = Image.open(io.BytesIO(source) if isinstance(source, bytes) else source)
+            img = ImageOps.exif_transpose(img)
+        except Exception:
+            raise ValueError("Unable to open the image. File may be corrupted.")
+        record["image"] = img
+        record["decode_seconds"] = time.perf_counter() - start
+        observe("decode", record["decode_seconds"])
+
+    def infer(record):
+        start = time.perf_counter()
+        record["image"] = _timed_remove(record.pop("image"), session)
+        record["infer_seconds"] = time.perf_counter() - start
+
+    def encode(record):
+        start = time.perf_counter()
+        # Batch outputs stay PNG, at the fast cutout compression level
+        data = encode_image(record.pop("image"), "png", "remove_bg")
+        if keep_bytes:
+            record["data"] = data
+        else:
+            with open(record["output"], "wb") as f:
+                f.write(data)
+        record["encode_seconds"] = time.perf_counter() - start
+        observe("encode", record["encode_seconds"])
+
+    _start_stage(decode, to_decode, to_infer, decode_workers)
+    _start_stage(infer, to_infer, to_encode, infer_workers)
+    _start_stage(encode, to_encode, finished, encode_workers)
+
+    def feed():
+        for item in inputs:
+            name, source = item if isinstance(item, tuple) else (item, item)
+            to_decode.put({
+                "input": name,
+                "source": source,
+                "output": os.path.basename(_output_path_for(name, None)) if keep_bytes
+                          else _output_path_for(name, output_dir),
+                "error": None,
+            })
+        to_decode.put(_DONE)
+
+    threading.Thread(target=feed, daemon=True).start()
+
+    while True:
+        record = finished.get()
+        if record is _DONE:
+            return
+        record.pop("source", None)
+        record.pop("image", None)
+        yield record
+
+
+def batch_summary(records, elapsed):
+    done = [r for r in records if r["error"] is None]
+    return {
+        "images": len(records),
+        "succeeded": len(done),
+        "failed": len(records) - len(done),
+        "seconds": elapsed,
+        "images_per_second": len(done) / elapsed if elapsed else 0.0,
+    }
+
+
 # ------------------------------------------------------------
 # MAIN (User Input)
 # ------------------------------------------------------------
+def run_batch(source, output_dir=None, infer_workers=None):
+    paths = expand_inputs(source)
+    if not paths:
+        print("❌ No images matched:", source)
+        return
+
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    print(f"\n⏳ Removing background from {len(paths)} images...")
+    start = time.perf_counter()
+    records = []
+    for record in remove_backgrounds(paths, output_dir, infer_workers=infer_workers):
+        records.append(record)
+        if record["error"]:
+            print(f"❌ {record['input']}: {record['error']}")
+        else:
+            print(f"✅ {record['output']}  (decode {record['decode_seconds']:.3f}s, "
+                  f"infer {record['infer_seconds']:.3f}s, encode {record['encode_seconds']:.3f}s)")
+
+    summary = batch_summary(records, time.perf_counter() - start)
+    print(f"\n📌 {summary['succeeded']}/{summary['images']} done in {summary['seconds']:.1f}s "
+          f"({summary['images_per_second']:.2f} images/sec)")
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Remove image backgrounds with rembg.")
+    parser.add_argument("--batch", metavar="DIR_OR_GLOB", help="directory or glob of images to process")
+    parser.add_argument("--out", metavar="DIR", help="output folder (default: next to each input)")
+    parser.add_argument("--workers", type=int, help="parallel inference threads")
+    args = parser.parse_args()
 
-    # Ask user for image path
-    image_path = input("Enter the image path: ").strip()
+    if args.batch:
+        run_batch(args.batch, args.out, args.workers)
+    else:
+        # Ask user for image path
+        image_path = input("Enter the image path: ").strip()
 
-    try:
-        print("\n⏳ Removing background...")
-        result_path = remove_background(image_path)
-        print("✅ Background removed successfully!")
-        print("📌 Saved at:", result_path)
-    except Exception as e:
-        print("❌ Error:", e)
+        try:
+            print("\n⏳ Removing background...")
+            result_path = remove_background(image_path)
+            print("✅ Background removed successfully!")
+            print("📌 Saved at:", result_path)
+        except Exception as e:
+            print("❌ Error:", e)
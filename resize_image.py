@@ -1,45 +1,259 @@
-import cv2
+import io
 import os
 
-def resize_image(input_path, output_path, width=None, height=None):
+import cv2
+import numpy as np
+from PIL import Image
+
+from metrics import timed
+from rotate_image import exif_orientation
+
+# ---------------------------
+# Defaults
+# ---------------------------
+STRIP_BYTES = int(float(os.environ.get("RESIZE_STRIP_MB", "4")) * 1024 * 1024)      # source bytes per strip
+TILE_MIN_PIXELS = int(os.environ.get("RESIZE_TILE_MIN_PIXELS", str(16_000_000)))   # shrink strip-wise above this
+UPSCALE_INTERPOLATION = cv2.INTER_LANCZOS4 if os.environ.get("RESIZE_UPSCALE") == "lanczos" else cv2.INTER_CUBIC
+
+# JPEG DCT-domain downscale while decoding (libjpeg scale_denom)
+_REDUCED_FLAGS = {2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+
+# Uncompressed layouts that can be read row by row instead of decoded
+_RAW_MODES = {"BGR": 3, "RGB": 3, "L": 1}
+
+# ---------------------------
+# Geometry
+# ---------------------------
+def target_size(w, h, width=None, height=None):
     """
-    Resize an image while keeping aspect ratio if only width or height is given.
+    (width, height) of the output, keeping aspect ratio if only one side
+    is given. Raises ValueError if neither is given.
+    """
+    if width and height:
+        return int(width), int(height)
+    if width:
+        return int(width), max(1, int(h * width / w))
+    if height:
+        return max(1, int(w * height / h)), int(height)
+    raise ValueError("Provide at least width or height!")
+
+
+def pick_interpolation(src_size, dst_size):
+    """Area averaging when shrinking (no aliasing), cubic/Lanczos when enlarging."""
+    (sw, sh), (dw, dh) = src_size, dst_size
+    if dw <= sw and dh <= sh:
+        return cv2.INTER_AREA
+    return UPSCALE_INTERPOLATION
+
+# ---------------------------
+# Strip-wise Shrink
+# ---------------------------
+def _to_bgr(slab):
+    slab = np.ascontiguousarray(slab)
+    if slab.ndim == 2:
+        return cv2.cvtColor(slab, cv2.COLOR_GRAY2BGR)
+    return slab
+
+
+@timed("shrink")
+def shrink_strips(src, factor_x, factor_y, strip_bytes=STRIP_BYTES, convert=_to_bgr):
+    """
+    Integer box shrink of an array-like source (ndarray or RawRows)
+    that only touches about strip_bytes of source rows at a time.
+    Each output row averages exactly factor_y source rows, so strips
+    join without seams.
+    """
+    h, w = src.shape[:2]
+    out_w = max(1, w // factor_x)
+    out_h = -(-h // factor_y)
+    row_bytes = w * (src.shape[2] if len(src.shape) > 2 else 1) * factor_y
+    strip_rows = max(1, strip_bytes // row_bytes)
+    out = None
+
+    for y in range(0, out_h, strip_rows):
+        rows = min(strip_rows, out_h - y)
+        slab = convert(src[y * factor_y:min(h, (y + rows) * factor_y)])
+        part = cv2.resize(slab, (out_w, rows), interpolation=cv2.INTER_AREA)
+        if out is None:
+            out = np.empty((out_h, out_w) + part.shape[2:], dtype=part.dtype)
+        out[y:y + rows] = part
+    return out
+
+
+@timed("resize")
+def resize_array(img, width=None, height=None):
+    """
+    Resize a decoded image in memory, keeping aspect ratio if only width or
+    height is given. Raises ValueError if neither is given. Very large
+    downscales are box-shrunk strip by strip first, then finished with
+    one area resize on the much smaller intermediate.
+    """
+    h, w = img.shape[:2]
+    size = target_size(w, h, width, height)
+    if size == (w, h):
+        return img
+
+    fx, fy = w // size[0], h // size[1]
+    if w * h >= TILE_MIN_PIXELS and fx >= 2 and fy >= 2:
+        img = shrink_strips(img, fx, fy, convert=np.ascontiguousarray)
+        h, w = img.shape[:2]
+        if (w, h) == size:
+            return img
+
+    return cv2.resize(img, size, interpolation=pick_interpolation((w, h), size))
+
+# ---------------------------
+# Shrink-on-load Decode
+# ---------------------------
+def reduce_factor(src_size, dst_size):
+    """Largest JPEG decode reduction (1, 2, 4, 8) that keeps the decoded image at or above dst_size."""
+    (sw, sh), (dw, dh) = src_size, dst_size
+    scale = min(sw / dw, sh / dh)
+    factor = 1
+    while factor < 8 and scale >= factor * 2:
+        factor *= 2
+    return factor
+
+
+def probe(source):
+    """(format, (w, h), EXIF orientation) from the image header without decoding."""
+    try:
+        with Image.open(source) as header:
+            return header.format, header.size, exif_orientation(header)
+    except Exception:
+        return None, None, 1
+
+
+def _decode_flags(fmt, src_size, width, height, orientation=1):
+    if fmt != "JPEG":
+        return cv2.IMREAD_COLOR
+    if orientation in (5, 6, 7, 8):
+        src_size = src_size[::-1]   # cv2 decodes upright, so width/height refer to swapped sides
+    factor = reduce_factor(src_size, target_size(*src_size, width, height))
+    return _REDUCED_FLAGS.get(factor, cv2.IMREAD_COLOR)
+
+
+class RawRows:
+    """
+    Row-addressable view of the pixel data in an uncompressed image file
+    (BMP, PPM/PGM, raw TIFF). Slicing rows reads just those rows from
+    disk, so nothing proportional to the full image is ever resident.
+    """
+
+    def __init__(self, path, offset, stride, w, h, bands, bottom_up=False, rgb=False):
+        self.path = path
+        self.offset = offset
+        self.stride = stride
+        self.bands = bands
+        self.bottom_up = bottom_up
+        self.rgb = rgb
+        self.shape = (h, w, bands) if bands > 1 else (h, w)
+
+    @classmethod
+    def open(cls, path):
+        """RawRows for a single-tile raw image, or None for anything else."""
+        try:
+            with Image.open(path) as header:
+                tiles = list(header.tile)
+        except Exception:
+            return None
+        if len(tiles) != 1:
+            return None
+
+        decoder, box, offset, args = tiles[0][:4]
+        if decoder != "raw" or not isinstance(args, tuple) or args[0] not in _RAW_MODES:
+            return None
+
+        rawmode = args[0]
+        bands = _RAW_MODES[rawmode]
+        w, h = box[2] - box[0], box[3] - box[1]
+        stride = (args[1] if len(args) > 1 else 0) or w * bands
+        orientation = args[2] if len(args) > 2 else 1
+        return cls(path, offset, stride, w, h, bands, orientation < 0, rawmode == "RGB")
+
+    def __getitem__(self, rows):
+        h, w = self.shape[:2]
+        y0, y1, _ = rows.indices(h)
+        # Bottom-up files store the last row first
+        first = h - y1 if self.bottom_up else y0
+        count = max(0, y1 - y0)
+
+        with open(self.path, "rb") as f:
+            f.seek(self.offset + first * self.stride)
+            buf = np.fromfile(f, dtype=np.uint8, count=count * self.stride)
+
+        block = buf.reshape(count, self.stride)[:, :w * self.bands]
+        block = block.reshape((count,) + self.shape[1:])
+        if self.bottom_up:
+            block = block[::-1]
+        if self.rgb:
+            block = block[:, :, ::-1]
+        return block
+
+
+def resize_file(input_path, width=None, height=None):
+    """
+    Resize an image file and return the BGR result. JPEGs are decoded
+    at a reduced scale and uncompressed formats are read and shrunk
+    strip by strip, so peak memory follows the output size rather
+    than the input. Raises FileNotFoundError / ValueError.
     """
     if not os.path.exists(input_path):
-        print("❌ Input image not found!")
-        return
+        raise FileNotFoundError(f"Input image not found: {input_path}")
+
+    fmt, src_size, orientation = probe(input_path)
+    if src_size is not None:
+        w, h = target_size(*src_size, width, height)
+        raw = RawRows.open(input_path) if fmt != "JPEG" else None
+        if raw is not None:
+            fx, fy = src_size[0] // w, src_size[1] // h
+            img = shrink_strips(raw, fx, fy) if fx >= 2 and fy >= 2 else _to_bgr(raw[:])
+            return resize_array(img, w, h)
 
-    img = cv2.imread(input_path)
+    flags = _decode_flags(fmt, src_size, width, height, orientation) if src_size else cv2.IMREAD_COLOR
+    with timed("decode"):
+        img = cv2.imread(input_path, flags)
     if img is None:
-        print("❌ Error loading image!")
-        return
+        raise ValueError("Could not load image.")
+    return resize_array(img, width, height)
 
-    h, w = img.shape[:2]
 
-    # If both width and height are given → direct resize
-    if width and height:
-        new_size = (width, height)
-        resized = cv2.resize(img, new_size)
-    
-    # Resize based on width only → keep aspect ratio
-    elif width:
-        ratio = width / w
-        height = int(h * ratio)
-        resized = cv2.resize(img, (width, height))
-
-    # Resize based on height only → keep aspect ratio
-    elif height:
-        ratio = height / h
-        width = int(w * ratio)
-        resized = cv2.resize(img, (width, height))
-    
+@timed("decode")
+def decode_encoded(data, width=None, height=None):
+    """
+    Decode upload bytes, no smaller than a width/height target would
+    need; JPEGs are decoded at a reduced scale when the target allows.
+    """
+    fmt, src_size, orientation = probe(io.BytesIO(data))
+    flags = cv2.IMREAD_COLOR
+    if src_size and (width or height):
+        flags = _decode_flags(fmt, src_size, width, height, orientation)
+
+    img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flags)
+    if img is None:
+        raise ValueError("Could not load image.")
+    return img
+
+
+def resize_encoded(data, width=None, height=None):
+    """resize_file() for upload bytes; JPEGs are decoded at a reduced scale."""
+    return resize_array(decode_encoded(data, width, height), width, height)
+
+
+def resize_image(input_path, output_path, width=None, height=None, image=None):
+    """
+    Resize an image while keeping aspect ratio if only width or height is given.
+    Pass an already decoded BGR array as image to skip reading input_path.
+    Returns output_path; raises FileNotFoundError / ValueError on bad input.
+    """
+    if image is not None:
+        resized = resize_array(image, width, height)
     else:
-        print("❌ Provide at least width or height!")
-        return
+        resized = resize_file(input_path, width, height)
 
-    cv2.imwrite(output_path, resized)
-    print(f"✅ Image resized successfully!")
-    print(f"📁 Saved at: {output_path}")
+    if not cv2.imwrite(output_path, resized):
+        raise ValueError(f"Could not write {output_path}")
+    return output_path
 
 
 # ----------------------------------------------------
@@ -56,18 +270,23 @@ if __name__ == "__main__":
     print("3️⃣ Resize by Width & Height (custom)")
     choice = input("\nEnter choice (1/2/3): ")
 
+    width = height = None
     if choice == "1":
         width = int(input("Enter new width (px): "))
-        resize_image(image_path, save_path, width=width)
-
     elif choice == "2":
         height = int(input("Enter new height (px): "))
-        resize_image(image_path, save_path, height=height)
-
     elif choice == "3":
         width = int(input("Enter width: "))
         height = int(input("Enter height: "))
-        resize_image(image_path, save_path, width=width, height=height)
-
     else:
         print("❌ Invalid choice!")
+        raise SystemExit(1)
+
+    try:
+        resize_image(image_path, save_path, width=width, height=height)
+    except (FileNotFoundError, ValueError) as e:
+        print("❌", e)
+        raise SystemExit(1)
+
+    print(f"✅ Image resized successfully!")
+    print(f"📁 Saved at: {save_path}")
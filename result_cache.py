@@ -0,0 +1,177 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# ---------------------------
+# Config (environment)
+# ---------------------------
+CACHE_FOLDER = os.environ.get("RESULT_CACHE_FOLDER", "static/cache")
+CACHE_MAX_ITEMS = int(os.environ.get("RESULT_CACHE_MAX_ITEMS", 256))
+CACHE_MAX_MEMORY_MB = int(os.environ.get("RESULT_CACHE_MAX_MEMORY_MB", 128))
+CACHE_MAX_DISK_MB = int(os.environ.get("RESULT_CACHE_MAX_DISK_MB", 512))
+CACHE_TTL = int(os.environ.get("RESULT_CACHE_TTL", 24 * 3600))
+
+# ---------------------------
+# Content-Addressed Result Cache
+# ---------------------------
+class ResultCache:
+    """
+    Two-tier cache of feature results.
+
+    Keys are sha256(upload bytes + feature + params). Each entry is the
+    template context for result.html plus the encoded output image and
+    its file name; callers decide how to publish the bytes. The memory
+    tier is an LRU capped by `max_items` and `max_memory_bytes`, the disk
+    tier is trimmed oldest-first to `max_disk_bytes`, and both honour `ttl`.
+    """
+
+    def __init__(self, folder=CACHE_FOLDER, max_items=CACHE_MAX_ITEMS,
+                 max_memory_bytes=CACHE_MAX_MEMORY_MB * 1024 * 1024,
+                 max_disk_bytes=CACHE_MAX_DISK_MB * 1024 * 1024, ttl=CACHE_TTL):
+        self.folder = folder
+        self.max_items = max_items
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.ttl = ttl
+        self._memory = OrderedDict()   # key -> (created, context, data, name)
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        os.makedirs(folder, exist_ok=True)
+
+    @staticmethod
+    def make_key(data, feature, params=None):
+        h = hashlib.sha256(data)
+        h.update(b"\0" + str(feature).encode())
+        h.update(b"\0" + json.dumps(params or {}, sort_keys=True).encode())
+        return h.hexdigest()
+
+    def _meta_path(self, key):
+        return os.path.join(self.folder, key + ".json")
+
+    def _data_path(self, key):
+        return os.path.join(self.folder, key + ".bin")
+
+    def _expired(self, created):
+        return self.ttl is not None and time.time() - created > self.ttl
+
+    # ----- lookups -----
+    def get(self, key):
+        """Return (context, data, name) or None."""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if not self._expired(entry[0]):
+                    self._memory.move_to_end(key)
+                    self.counters["memory_hits"] += 1
+                    return dict(entry[1]), entry[2], entry[3]
+                self._forget(key)
+
+        entry = self._read_disk(key)
+        with self._lock:
+            if entry is None:
+                self.counters["misses"] += 1
+                return None
+            self.counters["disk_hits"] += 1
+            self._remember(key, entry)
+        return dict(entry[1]), entry[2], entry[3]
+
+    def _read_disk(self, key):
+        try:
+            with open(self._meta_path(key)) as f:
+                meta = json.load(f)
+            with open(self._data_path(key), "rb") as f:
+                data = f.read()
+        except (OSError, ValueError):
+            return None
+
+        if self._expired(meta["created"]):
+            self._delete_disk(key)
+            return None
+
+        os.utime(self._meta_path(key))  # keep recently used entries at the back of the disk LRU
+        return meta["created"], meta["context"], data, meta["name"]
+
+    # ----- stores -----
+    def put(self, key, context, data, name):
+        context = {k: v for k, v in context.items() if k != "image_path"}
+        created = time.time()
+
+        try:
+            os.makedirs(self.folder, exist_ok=True)
+            with open(self._data_path(key), "wb") as f:
+                f.write(data)
+            with open(self._meta_path(key), "w") as f:
+                json.dump({"created": created, "context": context, "name": name}, f)
+        except (OSError, TypeError, ValueError):
+            # Disk tier unavailable or context not JSON serialisable: memory only
+            self._delete_disk(key)
+
+        with self._lock:
+            self.counters["stores"] += 1
+            self._remember(key, (created, context, data, name))
+        self._trim_disk()
+
+    def _remember(self, key, entry):
+        if key in self._memory:
+            self._forget(key)
+        self._memory[key] = entry
+        self._memory_bytes += len(entry[2])
+        while len(self._memory) > self.max_items or (
+                self._memory_bytes > self.max_memory_bytes and len(self._memory) > 1):
+            self._forget(next(iter(self._memory)))
+            self.counters["evictions"] += 1
+
+    def _forget(self, key):
+        entry = self._memory.pop(key)
+        self._memory_bytes -= len(entry[2])
+
+    # ----- eviction -----
+    def _delete_disk(self, key):
+        for path in (self._meta_path(key), self._data_path(key)):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _trim_disk(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self.folder):
+            path = os.path.join(self.folder, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            total += st.st_size
+            entries.append((st.st_mtime, name, st.st_size))
+
+        if total <= self.max_disk_bytes:
+            return
+
+        entries.sort()
+        for _, name, size in entries:
+            if total <= self.max_disk_bytes:
+                break
+            path = os.path.join(self.folder, name)
+            if os.path.exists(path):
+                total -= size
+                os.remove(path)
+            # An entry needs both files; drop its partner too
+            key = os.path.splitext(name)[0]
+            for partner in (self._meta_path(key), self._data_path(key)):
+                if os.path.exists(partner):
+                    total -= os.path.getsize(partner)
+                    os.remove(partner)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.counters["memory_hits"] + self.counters["disk_hits"] + self.counters["misses"]
+            hits = lookups - self.counters["misses"]
+            return dict(
+                self.counters,
+                memory_items=len(self._memory),
+                memory_bytes=self._memory_bytes,
+                hit_rate=hits / lookups if lookups else 0.0,
+            )
@@ -1,16 +1,138 @@
-import cv2
+import math
 import os
 
-def rotate_image(img, angle):
-    """Rotate image based on angle."""
-    if angle == 90:
-        return cv2.rotate(img, cv2.ROTATE_90_CLOCKWISE)
-    elif angle == 180:
-        return cv2.rotate(img, cv2.ROTATE_180)
-    elif angle == 360:
-        return img.copy()  # No change
-    else:
+import cv2
+import numpy as np
+
+from metrics import timed
+
+# ---------------------------
+# EXIF Orientation
+# ---------------------------
+EXIF_ORIENTATION = 0x0112
+
+
+def exif_orientation(pil_image):
+    """
+    EXIF orientation (1-8) of an opened PIL image; 1 if missing.
+    cv2.imread/imdecode already return upright pixels, PIL paths use
+    ImageOps.exif_transpose; this is for sizing before a decode.
+    """
+    try:
+        return int(pil_image.getexif().get(EXIF_ORIENTATION, 1))
+    except Exception:
+        return 1
+
+
+# ---------------------------
+# Fused Affine Transform
+# ---------------------------
+_RIGHT_ANGLES = {
+    90: cv2.ROTATE_90_CLOCKWISE,
+    180: cv2.ROTATE_180,
+    270: cv2.ROTATE_90_COUNTERCLOCKWISE,
+}
+
+
+def normalize_angle(angle):
+    """Clockwise degrees folded into [0, 360); raises ValueError for non-numbers."""
+    try:
+        angle = float(angle)
+    except (TypeError, ValueError):
+        raise ValueError("Invalid angle selected!") from None
+    if not math.isfinite(angle):
         raise ValueError("Invalid angle selected!")
+    angle %= 360.0
+    return 0.0 if math.isclose(angle, 360.0) else angle
+
+
+def transform_matrix(size, angle=0, out_size=None, crop=None, expand=True):
+    """
+    One 2x3 matrix (and the output size) that crops, rotates and scales.
+
+    size     - (w, h) of the source
+    angle    - clockwise degrees, around the centre of the crop
+    out_size - (width, height) of the result; either may be None to keep aspect
+    crop     - (x, y, w, h) in source pixels, applied before rotating
+    expand   - grow the canvas so rotated corners are not cut off
+    """
+    w, h = size
+    x0, y0, cw, ch = crop or (0, 0, w, h)
+
+    theta = math.radians(angle)
+    cos, sin = math.cos(theta), math.sin(theta)
+    if expand:
+        bw = cw * abs(cos) + ch * abs(sin)
+        bh = cw * abs(sin) + ch * abs(cos)
+    else:
+        bw, bh = cw, ch
+    bw, bh = max(1, round(bw)), max(1, round(bh))
+
+    out_w, out_h = out_size or (None, None)
+    if out_w and not out_h:
+        out_h = max(1, int(bh * out_w / bw))
+    elif out_h and not out_w:
+        out_w = max(1, int(bw * out_h / bh))
+    elif not out_w:
+        out_w, out_h = bw, bh
+
+    # dst = S . R . (src - src_centre) + dst_centre, in pixel-centre coordinates
+    sx, sy = out_w / bw, out_h / bh
+    a = np.array([[sx * cos, -sx * sin], [sy * sin, sy * cos]])
+    src_c = np.array([x0 + (cw - 1) / 2, y0 + (ch - 1) / 2])
+    dst_c = np.array([(out_w - 1) / 2, (out_h - 1) / 2])
+    return np.hstack([a, (dst_c - a @ src_c)[:, None]]), (out_w, out_h)
+
+
+@timed("rotate")
+def transform(img, angle=0, width=None, height=None, crop=None, expand=True,
+              border=(0, 0, 0, 0), interpolation=None):
+    """
+    Crop, rotate (clockwise, any angle) and resize in a single resampling
+    pass. Untouched or pure-crop requests return img / a view of it
+    without allocating; right angles without scaling use cv2.rotate.
+    Strong downscales are box-shrunk first so the warp does not alias.
+    """
+    angle = normalize_angle(angle)
+    h, w = img.shape[:2]
+    if crop is not None:
+        x, y, cw, ch = (int(v) for v in crop)
+        x, y = max(0, x), max(0, y)
+        cw, ch = min(cw, w - x), min(ch, h - y)
+        if cw <= 0 or ch <= 0:
+            raise ValueError("Crop is outside the image!")
+        crop = (x, y, cw, ch)
+
+    if not (width or height) and angle in (0.0, 90.0, 180.0, 270.0):
+        view = img[crop[1]:crop[1] + crop[3], crop[0]:crop[0] + crop[2]] if crop else img
+        return view if angle == 0 else cv2.rotate(view, _RIGHT_ANGLES[int(angle)])
+
+    matrix, out_size = transform_matrix((w, h), angle, (width, height), crop, expand)
+    scale = min(math.hypot(*matrix[0, :2]), math.hypot(*matrix[1, :2]))
+
+    if scale < 0.5:
+        # warpAffine has no area filter; pre-shrink by an integer factor
+        factor = int(1 / scale)
+        x, y, cw, ch = crop or (0, 0, w, h)
+        img = cv2.resize(img[y:y + ch, x:x + cw], (max(1, cw // factor), max(1, ch // factor)),
+                         interpolation=cv2.INTER_AREA)
+        h, w = img.shape[:2]
+        crop = None
+        matrix, out_size = transform_matrix((w, h), angle, out_size, None, expand)
+        scale = min(math.hypot(*matrix[0, :2]), math.hypot(*matrix[1, :2]))
+
+    if interpolation is None:
+        interpolation = cv2.INTER_CUBIC if scale > 1.0 else cv2.INTER_LINEAR
+
+    return cv2.warpAffine(
+        img, matrix, out_size, flags=interpolation,
+        borderMode=cv2.BORDER_CONSTANT, borderValue=border,
+    )
+
+
+def rotate_image(img, angle):
+    """Rotate image clockwise by any angle; 0/360 returns img itself."""
+    return transform(img, angle)
 
 def main():
     print("===== IMAGE ROTATION TOOL =====")
@@ -22,7 +144,7 @@ def main():
         print("❌ Error: File not found!")
         return
 
-    # Try loading image
+    # Try loading image (cv2 applies EXIF orientation)
     img = cv2.imread(image_path)
     if img is None:
         print("❌ Error: Unable to read the image! Check file format.")
@@ -32,30 +154,37 @@ def main():
     print("\nSelect rotation angle:")
     print("1. 90°")
     print("2. 180°")
-    print("3. 360°")
+    print("3. 270°")
+    print("4. Custom angle")
 
-    choice = input("Enter choice (1/2/3): ").strip()
+    choice = input("Enter choice (1/2/3/4): ").strip()
 
-    angle_map = {"1": 90, "2": 180, "3": 360}
+    angle_map = {"1": 90, "2": 180, "3": 270}
 
-    if choice not in angle_map:
+    if choice == "4":
+        try:
+            angle = normalize_angle(input("Enter angle (degrees, clockwise): ").strip())
+        except ValueError as e:
+            print("❌", e)
+            return
+    elif choice in angle_map:
+        angle = angle_map[choice]
+    else:
         print("❌ Invalid choice!")
         return
 
-    angle = angle_map[choice]
-
     # Rotate image
     rotated_img = rotate_image(img, angle)
 
     # Auto-generate save name based on original file
     folder = os.path.dirname(image_path)
     base = os.path.splitext(os.path.basename(image_path))[0]
-    output_path = os.path.join(folder, f"{base}_rotated_{angle}.png")
+    output_path = os.path.join(folder, f"{base}_rotated_{angle:g}.png")
 
     # Save rotated image
     cv2.imwrite(output_path, rotated_img)
 
-    print(f"\n✅ Image rotated by {angle}° successfully!")
+    print(f"\n✅ Image rotated by {angle:g}° successfully!")
     print(f"📁 Saved as: {output_path}")
 
 if __name__ == "__main__":
@@ -0,0 +1,84 @@
+import gc
+import importlib
+import os
+import sys
+import time
+
+import metrics
+from lazy import registry
+
+# ---------------------------
+# Config (environment)
+# ---------------------------
+# Read-only state worth loading once in the gunicorn master and sharing with every worker
+PRELOAD_MODULES = ("cv2", "numpy", "PIL.Image", "scipy.spatial", "onnxruntime", "rembg")
+PRELOAD_MODELS = ("model_artifact", "color_model", "color_index", "font_model", "font_matcher")
+
+# gc.freeze() after preloading keeps the collector from writing to (and so copying) shared pages
+GC_FREEZE = os.environ.get("GC_FREEZE", "1") == "1"
+
+
+def cpu_count():
+    """Cores this process may run on (honours CPU affinity / cgroup cpusets)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+# ---------------------------
+# Preload (master) / After Fork (worker)
+# ---------------------------
+def preload(modules=PRELOAD_MODULES, models=PRELOAD_MODELS):
+    """
+    Import heavy modules and load the read-only models before workers
+    fork. Per-process resources (ONNX sessions unless REMBG_SHARED=1,
+    OCR handles, thread pools) are left for each worker to build.
+    Returns {name: seconds}.
+    """
+    timings = {}
+    for name in modules:
+        start = time.perf_counter()
+        importlib.import_module(name)
+        timings[f"import:{name}"] = time.perf_counter() - start
+
+    for name, info in registry.warm_up(models).items():
+        if name in models:
+            timings[name] = info["seconds"]
+
+    import remove_bg
+    if remove_bg.REMBG_SHARED:
+        remove_bg.preload_session()
+        timings["rembg_session"] = remove_bg.session_stats()["session_load_seconds"]
+
+    if GC_FREEZE:
+        gc.collect()
+        gc.freeze()
+    return timings
+
+
+def after_fork():
+    """
+    Worker start. Modules drop inherited thread pools and native handles
+    on their own (os.register_at_fork); this only builds what a preloaded
+    worker should have before its first request. Without preload the app
+    is imported after this and warms itself up.
+    """
+    metrics.share(os.environ.get("METRICS_DIR"))   # set by gunicorn.conf.py, read after it ran
+    if os.environ.get("SERVER_PRELOAD") != "1":
+        return
+    if os.environ.get("WARM_UP") == "1":
+        registry.warm_up()
+    if os.environ.get("REMBG_PRELOAD") == "1":
+        import remove_bg
+        remove_bg.preload_session()
+    app = sys.modules.get("ai_mitr")
+    if os.environ.get("JOB_PREWARM") == "1" and app is not None and app.job_queue is not None:
+        app.job_queue.start()
+
+
+def before_exit():
+    """Worker exit: settle this worker's background jobs and fold its metrics into the shared totals."""
+    app = sys.modules.get("ai_mitr")
+    if app is not None and app.job_queue is not None:
+        app.job_queue.drain()
+    metrics.retire()
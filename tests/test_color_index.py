@@ -0,0 +1,77 @@
+import pickle
+import random
+
+import numpy as np
+import pytest
+
+from color_index import LEVELS, ColorIndex, rgb_to_lab
+from color_ops import hex_to_rgb_array
+from model_artifact import import_pickles, load_artifact
+
+MODEL = "tesco_model.pkl"
+
+
+def reference_lookup(entries, hex_color, brightness, contrast, max_distance):
+    """The pre-artifact behaviour: case-insensitive exact dict, then the nearest Lab entry in the group."""
+    exact = {(e["dominant_color"].lower(), e["brightness"], e["contrast"]): e for e in entries}
+    hit = exact.get((hex_color.lower(), brightness, contrast))
+    if hit is not None:
+        return hit
+    group = [e for e in entries if (e["brightness"], e["contrast"]) == (brightness, contrast)]
+    if not group:
+        return None
+    lab = rgb_to_lab(hex_to_rgb_array([e["dominant_color"] for e in group]))
+    dist = np.linalg.norm(lab - rgb_to_lab(hex_to_rgb_array([hex_color]))[0], axis=1)
+    best = int(np.argmin(dist))
+    return group[best] if dist[best] <= max_distance else None
+
+
+def queries(entries, n=300, seed=0):
+    rng = random.Random(seed)
+    classes = list(LEVELS) + ["unknown"]
+    out = []
+    for e in entries:
+        color = e["dominant_color"]
+        out.append((color, e["brightness"], e["contrast"]))
+        out.append((color.upper(), e["brightness"], e["contrast"]))
+        # A few steps away: misses the exact table, hits the tree
+        value = min(int(color[1:], 16) + 0x030201, 0xFFFFFF)
+        out.append((f"#{value:06x}", e["brightness"], e["contrast"]))
+    for _ in range(n):
+        out.append((f"#{rng.randrange(1 << 24):06x}", rng.choice(classes), rng.choice(classes)))
+    return out
+
+
+@pytest.fixture(scope="module")
+def entries():
+    with open(MODEL, "rb") as f:
+        return pickle.load(f)
+
+
+@pytest.fixture(scope="module", params=["pickle", "artifact"])
+def index(request, entries, tmp_path_factory):
+    if request.param == "pickle":
+        return ColorIndex(entries)
+    out = tmp_path_factory.mktemp("model")
+    import_pickles(MODEL, "font_suggestion_model.pkl", str(out))
+    return ColorIndex.from_artifact(load_artifact(str(out)))
+
+
+def test_lookup_matches_dict_behaviour(index, entries):
+    for color, b, c in queries(entries):
+        assert index.lookup(color, b, c) == reference_lookup(entries, color, b, c, index.max_distance)
+
+
+def test_lookup_batch_matches_lookup(index, entries):
+    qs = queries(entries, seed=1)
+    colors, bs, cs = zip(*qs)
+    expected = [reference_lookup(entries, h, b, c, index.max_distance) for h, b, c in qs]
+    assert index.lookup_batch(list(colors), list(bs), list(cs)) == expected
+
+
+@pytest.mark.parametrize("color", ["", "#", "#12345", "#12345g", "not a color", "#fefefe00", None])
+def test_unparsable_colors_are_misses(index, entries, color):
+    e = entries[0]
+    assert index.lookup(color, e["brightness"], e["contrast"]) is None
+    assert index.nearest(color, e["brightness"], e["contrast"]) is None
+    assert index.lookup_batch([color, e["dominant_color"]], [e["brightness"]] * 2, [e["contrast"]] * 2) == [None, e]
@@ -0,0 +1,45 @@
+import json
+import os
+
+import pytest
+
+import metrics
+
+
+@pytest.fixture
+def shared(tmp_path):
+    metrics.reset()
+    metrics.share(str(tmp_path))
+    yield tmp_path
+    metrics._shared["path"] = None
+    metrics.reset()
+
+
+def counts(folder):
+    rows = json.loads((folder / metrics.DEAD_FILE).read_text())
+    return {(stage, feature): count for stage, feature, _, _, count in rows}
+
+
+def test_dead_worker_files_are_folded(shared):
+    metrics.observe("ocr", 0.2, "color_font")
+    # A worker that was killed before it could retire(); no process has this pid
+    with open(shared / f"{2 ** 22 + 1}-1.json", "w") as f:
+        json.dump([["ocr", "color_font", [0] * (len(metrics.BUCKETS) + 1), 0.5, 3]], f)
+
+    merged = metrics._merged()
+
+    assert merged[("ocr", "color_font")][2] == 4
+    assert set(os.listdir(shared)) == {".lock", metrics.DEAD_FILE, os.path.basename(metrics._shared["path"])}
+    assert counts(shared) == {("ocr", "color_font"): 3}
+
+
+def test_retire_moves_counts_into_dead_file(shared):
+    metrics.observe("ocr", 0.2, "color_font")
+    metrics.observe("ocr", 0.1, "color_font")
+    own = metrics._shared["path"]
+
+    metrics.retire()
+    metrics.retire()   # idempotent
+
+    assert not os.path.exists(own)
+    assert counts(shared) == {("ocr", "color_font"): 2}
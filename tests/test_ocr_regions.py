@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+import ocr
+from ocr_regions import PSM_BLOCK, PSM_LINE, PSM_WORD, TILE_GAP, read_tiled, tile_groups, tile_rois
+
+
+class RecordingEngine(ocr.OcrEngine):
+    """Returns one word per region laid out on the page, named after the region's width."""
+
+    name = "recording"
+
+    def __init__(self):
+        super().__init__(workers=1)
+        self.calls = []
+
+    def _recognize(self, image, psm):
+        raise AssertionError("read_tiled reads words")
+
+    def _words(self, image, psm):
+        self.calls.append((psm, image.shape))
+        across = psm != PSM_BLOCK
+        _, ranges = self.layout
+        words = []
+        for start, end in ranges:
+            box = (start, 0, end - start, 10) if across else (0, start, 10, end - start)
+            words.append((f"w{self.widths[(start, end)]}", box, 0 if across else start))
+        return words
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    engine = ocr.set_engine(RecordingEngine())
+
+    def record_layout(rois, gap=TILE_GAP, across=False):
+        page, ranges = tile_rois(rois, gap, across)
+        engine.layout = page, ranges
+        engine.widths = {r: roi.shape[1] for r, roi in zip(ranges, rois)}
+        return page, ranges
+
+    monkeypatch.setattr("ocr_regions.tile_rois", record_layout)
+    yield engine
+    ocr.set_engine(None)
+
+
+def roi(width, height=40):
+    return np.full((height, width), 255, dtype=np.uint8)
+
+
+def test_tile_groups_keep_psm_and_read_several_words_as_a_line():
+    jobs = [(None, PSM_BLOCK), (None, PSM_LINE), (None, PSM_WORD), (None, PSM_BLOCK)]
+    assert tile_groups(jobs) == {PSM_BLOCK: [0, 3], PSM_LINE: [1], PSM_WORD: [2]}
+
+    jobs.append((None, PSM_WORD))
+    assert tile_groups(jobs) == {PSM_BLOCK: [0, 3], PSM_LINE: [1, 2, 4]}
+
+
+def test_tile_rois_across_puts_regions_in_one_row():
+    page, ranges = tile_rois([roi(30, 20), roi(50, 40)], gap=5, across=True)
+    assert page.shape == (40, 85)
+    assert ranges == [(0, 30), (35, 85)]
+
+
+def test_read_tiled_one_call_per_psm(engine):
+    jobs = [(roi(100), PSM_BLOCK), (roi(60), PSM_LINE), (roi(30), PSM_WORD), (roi(120), PSM_BLOCK)]
+    texts = read_tiled(jobs)
+
+    assert sorted(psm for psm, _ in engine.calls) == [PSM_BLOCK, PSM_LINE, PSM_WORD]
+    assert texts == ["w100", "w60", "w30", "w120"]
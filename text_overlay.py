@@ -0,0 +1,252 @@
+import functools
+import io
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from PIL import Image, ImageColor, ImageDraw, ImageFont, ImageOps
+
+from metrics import timed
+from output_encoding import FORMATS, encode_image, supported
+
+# ---------------------------
+# Config (environment)
+# ---------------------------
+DEFAULT_FONT = os.environ.get("TEXT_FONT", "arial.ttf")
+FALLBACK_FONTS = ("DejaVuSans.ttf", "LiberationSans-Regular.ttf")
+FONT_CACHE_SIZE = int(os.environ.get("FONT_CACHE_SIZE", 64))
+
+EDIT_TTL = int(os.environ.get("TEXT_EDIT_TTL", 900))
+EDIT_MAX_SESSIONS = int(os.environ.get("TEXT_EDIT_MAX_SESSIONS", 32))
+EDIT_MAX_MB = int(os.environ.get("TEXT_EDIT_MAX_MB", 512))   # decoded bases kept in memory
+
+MAX_ITEMS = 20
+MIN_FONT_SIZE, MAX_FONT_SIZE = 6, 400
+DEFAULT_FONT_SIZE = 30
+DEFAULT_POSITION = (50, 50)
+
+# ---------------------------
+# Font Cache
+# ---------------------------
+_font_faces = {}   # requested face -> face actually loaded, for /text-stats
+
+
+@functools.lru_cache(maxsize=FONT_CACHE_SIZE)
+def load_font(face=DEFAULT_FONT, size=DEFAULT_FONT_SIZE):
+    """
+    Font for (face, size), loaded once and kept in an LRU. A missing face
+    falls back to common system fonts and then Pillow's bundled one; the
+    face really used is recorded in font_stats().
+    """
+    for candidate in (face, *FALLBACK_FONTS):
+        try:
+            font = ImageFont.truetype(candidate, size)
+        except OSError:
+            continue
+        _font_faces[face] = candidate
+        return font
+
+    _font_faces[face] = "default"
+    try:
+        return ImageFont.load_default(size)
+    except TypeError:   # Pillow < 10.1 has no scalable default font
+        return ImageFont.load_default()
+
+
+def font_stats():
+    info = load_font.cache_info()
+    return {
+        "hits": info.hits,
+        "misses": info.misses,
+        "size": info.currsize,
+        "max_size": info.maxsize,
+        "faces": dict(_font_faces),
+    }
+
+# ---------------------------
+# Text Items
+# ---------------------------
+def _int(value, default, name):
+    if value in (None, ""):
+        return default
+    try:
+        return int(float(value))
+    except ValueError:
+        raise ValueError(f"Invalid {name}: {value}") from None
+
+
+def parse_text_items(form):
+    """
+    Text items from a form with repeated fields: user_text, font_size, x,
+    y and color (one of each per item). Missing positions stack the items
+    below each other from DEFAULT_POSITION. Raises ValueError.
+    """
+    texts = form.getlist("user_text")
+    sizes = form.getlist("font_size")
+    xs, ys = form.getlist("x"), form.getlist("y")
+    colors = form.getlist("color")
+
+    def at(values, i):
+        return values[i] if i < len(values) else None
+
+    items = []
+    next_y = DEFAULT_POSITION[1]
+    for i, text in enumerate(texts):
+        if not text or not text.strip():
+            continue
+        size = min(MAX_FONT_SIZE, max(MIN_FONT_SIZE, _int(at(sizes, i), DEFAULT_FONT_SIZE, "text size")))
+        x = _int(at(xs, i), DEFAULT_POSITION[0], "x position")
+        y = _int(at(ys, i), next_y, "y position")
+        color = at(colors, i) or "black"
+        try:
+            fill = ImageColor.getrgb(color)
+        except ValueError:
+            raise ValueError(f"Invalid color: {color}") from None
+
+        items.append({"text": text, "size": size, "x": x, "y": y, "fill": fill, "font": DEFAULT_FONT})
+        next_y = y + int(size * 1.4) * (text.count("\n") + 1)
+
+    if not items:
+        raise ValueError("Provide some text to add!")
+    if len(items) > MAX_ITEMS:
+        raise ValueError(f"At most {MAX_ITEMS} text items per request.")
+    return items
+
+# ---------------------------
+# Layered Edit
+# ---------------------------
+class TextEdit:
+    """
+    A decoded base image plus the text items drawn over it. Each item is
+    rendered once into its own small RGBA tile; producing the edited image
+    only copies the base and composites the tiles, so neither the upload
+    nor earlier edits are decoded or drawn again.
+    """
+
+    def __init__(self, base, fmt="PNG"):
+        self.id = uuid.uuid4().hex
+        self.fmt = fmt
+        if base.mode not in ("RGB", "RGBA"):
+            base = base.convert("RGBA" if "A" in base.getbands() or "transparency" in base.info else "RGB")
+        self.base = base
+        self.layers = []   # (item, tile, (x, y)) in drawing order
+        self.lock = threading.Lock()
+        self.touched = time.time()
+
+    @classmethod
+    @timed("decode")
+    def open(cls, data):
+        img = Image.open(io.BytesIO(data))
+        img.load()   # surface truncated/corrupt data here, not halfway through an edit
+        fmt = img.format or "PNG"
+        return cls(ImageOps.exif_transpose(img), fmt)
+
+    @property
+    def items(self):
+        return [item for item, _, _ in self.layers]
+
+    def _render_item(self, item):
+        """(tile, position) for one item, clipped to the image; None if fully outside."""
+        font = load_font(item["font"], item["size"])
+        x0, y0, x1, y1 = ImageDraw.Draw(self.base).textbbox((item["x"], item["y"]), item["text"], font=font)
+        x0, y0 = max(0, x0), max(0, y0)
+        x1, y1 = min(self.base.width, x1), min(self.base.height, y1)
+        if x1 <= x0 or y1 <= y0:
+            return None
+
+        tile = Image.new("RGBA", (x1 - x0, y1 - y0), (0, 0, 0, 0))
+        ImageDraw.Draw(tile).text((item["x"] - x0, item["y"] - y0), item["text"],
+                                  fill=item["fill"], font=font)
+        return tile, (x0, y0)
+
+    @timed("text_render")
+    def add(self, items):
+        for item in items:
+            rendered = self._render_item(item)
+            if rendered is not None:
+                self.layers.append((item, *rendered))
+
+    def undo(self):
+        if self.layers:
+            self.layers.pop()
+
+    @timed("text_composite")
+    def render(self):
+        """The base with every text tile composited on top (the base is untouched)."""
+        out = self.base.copy()
+        for _, tile, pos in self.layers:
+            if out.mode == "RGBA":
+                out.alpha_composite(tile, pos)
+            else:
+                out.paste(tile, pos, tile)
+        return out
+
+    @timed("encode")
+    def encode(self):
+        """(bytes, file name) of the edited image in the upload's format (lossless unless JPEG)."""
+        fmt = (self.fmt or "PNG").lower()
+        if not supported(fmt):
+            fmt = "png"
+        data = encode_image(self.render(), fmt, "photo" if fmt == "jpeg" else "graphic")
+        return data, f"text_{self.id}_{len(self.layers)}{FORMATS[fmt][0]}"
+
+    def nbytes(self):
+        return self.base.width * self.base.height * len(self.base.getbands())
+
+# ---------------------------
+# Open Edits
+# ---------------------------
+class TextEditStore:
+    """Open edits by id, LRU-capped by count and decoded bytes, dropped after `ttl` idle seconds."""
+
+    def __init__(self, max_sessions=EDIT_MAX_SESSIONS, ttl=EDIT_TTL, max_bytes=EDIT_MAX_MB * 1024 * 1024):
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._edits = OrderedDict()
+        self._lock = threading.Lock()
+
+    def open(self, data):
+        edit = TextEdit.open(data)
+        with self._lock:
+            self._edits[edit.id] = edit
+            self._evict()
+        return edit
+
+    def get(self, edit_id):
+        if not edit_id:
+            return None
+        with self._lock:
+            edit = self._edits.get(edit_id)
+            if edit is None:
+                return None
+            if time.time() - edit.touched > self.ttl:
+                del self._edits[edit_id]
+                return None
+            edit.touched = time.time()
+            self._edits.move_to_end(edit_id)
+            return edit
+
+    def _evict(self):
+        now = time.time()
+        for edit_id in [k for k, e in self._edits.items() if now - e.touched > self.ttl]:
+            del self._edits[edit_id]
+        while len(self._edits) > self.max_sessions:
+            self._edits.popitem(last=False)
+        # The newest edit always stays, however big
+        while len(self._edits) > 1 and sum(e.nbytes() for e in self._edits.values()) > self.max_bytes:
+            self._edits.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "open_edits": len(self._edits),
+                "max_edits": self.max_sessions,
+                "base_mb": round(sum(e.nbytes() for e in self._edits.values()) / 1024 / 1024, 1),
+                "fonts": font_stats(),
+            }
+
+
+text_edits = TextEditStore()
@@ -1,5 +1,7 @@
 import pickle
 
+from model_artifact import MODEL_ARTIFACT, import_pickles
+
 # Updated color model with more common colors and suggestions
 color_model = [
     {
@@ -79,3 +81,7 @@ with open("tesco_model.pkl", "wb") as f:
     pickle.dump(color_model, f)
 
 print("Updated color model saved as tesco_model.pkl")
+
+# Compile the columnar artifact the app loads (the pickles stay as its source and fallback)
+manifest = import_pickles("tesco_model.pkl", "font_suggestion_model.pkl", MODEL_ARTIFACT)
+print(f"Model artifact v{manifest['version']} written to {MODEL_ARTIFACT}/")